@@ -3,6 +3,8 @@ import argparse
 from cloudvolume.lib import Bbox, Vec
 from taskqueue import TaskQueue
 
+from synaptor import types
+from synaptor.proc import tasks_w_io
 import synaptor.cloud.kube.parser as parser
 import synaptor.cloud.kube.task_creation as tc
 
@@ -16,13 +18,29 @@ def main(configfilename):
 
     bounds = Bbox(startcoord, startcoord + volshape)
 
+    skip_tags = ()
+    if config["changedbounds"] is not None:
+        params_hash = tasks_w_io.cc_params_hash(
+                          config["descriptor"], config["tempoutput"],
+                          config["ccthresh"], config["dustthresh"],
+                          mip=config["voxelres"],
+                          hashmax=config["nummergetasks"])
+        changed_bounds = [types.BBox3d(box[:3], box[3:])
+                          for box in config["changedbounds"]]
+
+        skip_tags = tc.plan_skipped_chunks(
+                        config["storagestrs"][0], "ccs",
+                        params_hash, changed_bounds)
+
     iterator = tc.create_connected_component_tasks(
                    config["descriptor"], config["tempoutput"],
                    storagestr=config["storagestrs"][0],
                    storagedir=config["storagestrs"][1],
                    cc_thresh=config["ccthresh"], sz_thresh=config["dustthresh"],
                    bounds=bounds, shape=config["chunkshape"],
-                   mip=config["voxelres"], hashmax=config["nummergetasks"])
+                   mip=config["voxelres"], hashmax=config["nummergetasks"],
+                   skip_unchanged=config["skipunchanged"],
+                   skip_tags=skip_tags)
 
     tq = TaskQueue(config["queueurl"])
     tq.insert_all(iterator)
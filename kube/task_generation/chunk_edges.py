@@ -23,7 +23,8 @@ def main(configfilename):
                    storagedir=config["storagestrs"][1],
                    bounds=bounds, chunkshape=config["chunkshape"],
                    patchsz=config["patchshape"],
-                   resolution=config["voxelres"])
+                   resolution=config["voxelres"],
+                   skip_unchanged=config["skipunchanged"])
 
     tq = TaskQueue(config["queueurl"])
     tq.insert_all(iterator)
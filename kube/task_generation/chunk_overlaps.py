@@ -20,7 +20,7 @@ def main(configfilename):
                    config["output"], config["baseseg"],
                    config["storagestrs"][0],
                    bounds=bounds, shape=config["chunkshape"],
-                   mip=config["voxelres"])
+                   mip=config["voxelres"], hashmax=config["nummergetasks"])
 
     tq = TaskQueue(config["queueurl"])
     tq.insert_all(iterator)
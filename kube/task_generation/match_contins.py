@@ -10,9 +10,15 @@ def main(configfilename):
 
     config = parser.parse(configfilename)
 
+    bucket_plan = tc.plan_reduce_buckets(
+                      config["storagestrs"][0], "match_contins",
+                      config["nummergetasks"], config["numreducetasks"],
+                      only_dirty=config["skipunchanged"])
+
     iterator = tc.create_match_contins_tasks(
                    config["storagestrs"][0], config["nummergetasks"],
-                   max_faceshape=config["maxfaceshape"])
+                   max_faceshape=config["maxfaceshape"],
+                   bucket_plan=bucket_plan)
 
     tq = TaskQueue(config["queueurl"])
     tq.insert_all(iterator)
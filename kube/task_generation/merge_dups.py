@@ -10,10 +10,16 @@ def main(configfilename):
 
     config = parser.parse(configfilename)
 
+    bucket_plan = tc.plan_reduce_buckets(
+                      config["storagestrs"][0], "merge_dups",
+                      config["nummergetasks"], config["numreducetasks"],
+                      only_dirty=config["skipunchanged"])
+
     iterator = tc.create_merge_dup_tasks(
                    config["storagestrs"][0], config["nummergetasks"],
                    config["mergethresh"], config["szthresh"],
-                   config["voxelres"], config["storagestrs"][1]
+                   config["voxelres"], config["storagestrs"][1],
+                   bucket_plan=bucket_plan
                    )
 
     tq = TaskQueue(config["queueurl"])
@@ -10,10 +10,11 @@ def main(configfilename):
 
     config = parser.parse(configfilename)
 
-    iterator = tc.create_merge_overlaps_task(config["storagestrs"][0])
+    iterator = tc.create_hashed_merge_overlaps_tasks(
+                   config["storagestrs"][0], config["nummergetasks"])
 
     tq = TaskQueue(config["queueurl"])
-    tq.insert_all([iterator])
+    tq.insert_all(iterator)
 
 
 if __name__ == "__main__":
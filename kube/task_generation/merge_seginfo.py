@@ -13,10 +13,15 @@ def main(configfilename):
     enforce_szthresh = config["workflowtype"] == "Segmentation"
     szthresh = config["szthresh"] if enforce_szthresh else None
 
+    bucket_plan = tc.plan_reduce_buckets(
+                      config["storagestrs"][0], "merge_seginfo",
+                      config["nummergetasks"], config["numreducetasks"],
+                      only_dirty=config["skipunchanged"])
+
     iterator = tc.create_merge_seginfo_tasks(
                    config["storagestrs"][0], config["nummergetasks"],
                    aux_storagestr=config["storagestrs"][1],
-                   szthresh=szthresh)
+                   szthresh=szthresh, bucket_plan=bucket_plan)
 
     tq = TaskQueue(config["queueurl"])
     tq.insert_all(iterator)
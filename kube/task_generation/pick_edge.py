@@ -10,8 +10,14 @@ def main(configfilename):
 
     config = parser.parse(configfilename)
 
+    bucket_plan = tc.plan_reduce_buckets(
+                      config["storagestrs"][0], "pick_edge",
+                      config["nummergetasks"], config["numreducetasks"],
+                      only_dirty=config["skipunchanged"])
+
     iterator = tc.create_pick_edge_tasks(
-                   config["storagestrs"][0], config["nummergetasks"]
+                   config["storagestrs"][0], config["nummergetasks"],
+                   bucket_plan=bucket_plan
                    )
 
     tq = TaskQueue(config["queueurl"])
@@ -36,6 +36,8 @@ def parse(filename):
     conf["dustthresh"] = parser.getint("Parameters", "dustthresh")
     conf["mergethresh"] = parser.getint("Parameters", "mergethresh")
     conf["nummergetasks"] = parser.getint("Parameters", "nummergetasks")
+    conf["numreducetasks"] = parser.getint("Parameters", "numreducetasks",
+                                           fallback=None)
 
     conf["workflowtype"] = parser.get("Workflow", "workflowtype")
     conf["workspacetype"] = parser.get("Workflow", "workspacetype")
@@ -44,6 +46,12 @@ def parse(filename):
     conf["storagedir"] = parser.get("Workflow", "storagedir")
     conf["storagestrs"] = get_storagestrs(parser)
 
+    conf["skipunchanged"] = parser.getboolean("Workflow", "skipunchanged",
+                                              fallback=False)
+    conf["changedbounds"] = parse_bounds_list(
+                                parser.get("Workflow", "changedbounds",
+                                           fallback=None))
+
     return conf
 
 
@@ -51,6 +59,17 @@ def parse_tuple(field):
     return tuple(map(int, field.split(",")))
 
 
+def parse_bounds_list(field):
+    """ Parses ';'-separated boxes of 6 coordinates (begin, end) """
+    if field is None:
+        return None
+
+    boxes = list(map(parse_tuple, field.split(";")))
+    assert all(len(box) == 6 for box in boxes), "malformed bounds"
+
+    return boxes
+
+
 def infer_max_face_shape(chunk_shape):
     return tuple(sorted(chunk_shape)[1:])
 
@@ -11,12 +11,90 @@ from taskqueue import GreenTaskQueue
 
 from .synaptortask import SynaptorTask
 from synaptor import io
+from synaptor import types
+from synaptor.proc import hashing
+from synaptor.proc import io as taskio
+from synaptor.proc import colnames as cn
 
 
 def tup2str(t):
   return " ".join(map(str, t))
 
 
+def plan_reduce_buckets(storagestr, stage, hashmax, num_tasks=None,
+                        only_dirty=False):
+    """
+    Packs the hash buckets of a reduce stage (see taskio.BUCKET_SOURCES)
+    into num_tasks tasks of similar size. The bucket sizes are read from
+    the database, so this should run after the stage's map phase.
+    Returns None (one task per bucket) if num_tasks isn't specified.
+
+    only_dirty restricts the plan to the buckets whose inputs changed
+    since they were last reduced (see taskio.read_dirty_buckets), e.g.
+    after re-running the chunk tasks over an edited region.
+    """
+    proc_url = io.parse_storagestr(storagestr)
+
+    if only_dirty:
+        dirty = taskio.read_dirty_buckets(proc_url, stage)
+        print(f"{len(dirty)} dirty {stage} buckets")
+
+        if num_tasks is None:
+            return [[bucket] for bucket in dirty]
+
+        bucket_sizes = taskio.read_bucket_sizes(proc_url, stage)
+        bucket_sizes = bucket_sizes.reindex(dirty, fill_value=0)
+
+        return hashing.plan_buckets(bucket_sizes, num_tasks)
+
+    if num_tasks is None:
+        return None
+
+    bucket_sizes = taskio.read_bucket_sizes(proc_url, stage)
+
+    return hashing.plan_buckets(bucket_sizes, num_tasks, hashmax=hashmax)
+
+
+def plan_skipped_chunks(storagestr, task_name, params_hash, changed_bounds=()):
+    """
+    Finds the tags of chunks which a chunk task can skip: those whose last
+    run used the same parameters (see tasks_w_io.*_params_hash), and which
+    don't intersect any of the changed_bounds (e.g. the boxes edited by
+    proofreading). The changed_bounds need to cover every input that
+    changed, including upstream results such as remapped ids. Otherwise,
+    the tasks can check their inputs themselves with skip_unchanged.
+    """
+    proc_url = io.parse_storagestr(storagestr)
+    manifests = taskio.read_task_manifests(proc_url, task_name)
+
+    same_params = manifests.index[manifests[cn.params_hash] == params_hash]
+
+    return set(tag for tag in same_params
+               if not any(_overlaps(io.bbox_from_tag(tag), bounds)
+                          for bounds in changed_bounds))
+
+
+def _overlaps(bbox, other):
+    """ Whether two BBox3ds share any voxels """
+    return all(max(b1, b2) < min(e1, e2)
+               for (b1, e1, b2, e2) in zip(bbox.min(), bbox.max(),
+                                           other.min(), other.max()))
+
+
+def chunk_tag(task_bounds):
+    """ The storage tag for a CloudVolume Bbox """
+    return io.fname_chunk_tag(types.BBox3d(task_bounds.minpt,
+                                           task_bounds.maxpt))
+
+
+def bucket_groups(hashmax, bucket_plan=None):
+    """ The buckets for each reduce task (one per task without a plan) """
+    if bucket_plan is None:
+        return [[i] for i in range(hashmax)]
+
+    return bucket_plan
+
+
 def create_init_db_task(storagestr):
     return SynaptorTask(f"init_db {storagestr}")
 
@@ -24,7 +102,8 @@ def create_init_db_task(storagestr):
 def create_connected_component_tasks(
     descpath, segpath, storagestr, storagedir,
     cc_thresh, sz_thresh, bounds, shape,
-    mip=(8, 8, 40), parallel=1, hashmax=1):
+    mip=(8, 8, 40), parallel=1, hashmax=1,
+    skip_unchanged=False, skip_tags=()):
 
     shape = Vec(*shape)
 
@@ -55,6 +134,9 @@ def create_connected_component_tasks(
           if task_bounds.volume() < 1:
             continue
 
+          if chunk_tag(task_bounds) in skip_tags:
+            continue
+
           chunk_begin = tup2str(task_bounds.minpt)
           chunk_end = tup2str(task_bounds.maxpt)
           mip_str = tup2str(mip)
@@ -64,6 +146,8 @@ def create_connected_component_tasks(
                  f" --chunk_end {chunk_end} --hashmax {hashmax}"
                  f" --parallel {parallel} --mip {mip_str}"
                  f" --storagedir {storagedir}")
+          if skip_unchanged:
+            cmd += " --skip_unchanged"
 
           yield SynaptorTask(cmd)
 
@@ -78,13 +162,21 @@ def create_merge_ccs_task(
                         f"{max_face_shape[0]} {max_face_shape[1]}")
 
 
+def create_append_ccs_task(
+    storagestr, size_thr, max_face_shape, timingtag=None):
+    return SynaptorTask(f"append_ccs {storagestr} {size_thr} "
+                        f"--max_face_shape "
+                        f"{max_face_shape[0]} {max_face_shape[1]}")
+
+
 def create_match_contins_tasks(
-    storagestr, hashmax, max_faceshape, timingtag=None):
+    storagestr, hashmax, max_faceshape, timingtag=None, bucket_plan=None):
 
     class MatchContinsTaskIterator(object):
         def __init__(self, hashmax):
+            self.buckets = bucket_groups(hashmax, bucket_plan)
             self.level_start = 0
-            self.level_end = hashmax
+            self.level_end = len(self.buckets)
 
         def __len__(self):
             return self.level_end - self.level_start
@@ -97,8 +189,8 @@ def create_match_contins_tasks(
 
         def __iter__(self):
             max_faceshape_str = tup2str(max_faceshape)
-            for i in range(self.level_start, self.level_end):
-                cmd = (f"match_contins {storagestr} {i} "
+            for buckets in self.buckets[self.level_start:self.level_end]:
+                cmd = (f"match_contins {storagestr} {tup2str(buckets)} "
                        f" --max_face_shape {max_faceshape_str}")
 
                 yield SynaptorTask(cmd)
@@ -116,12 +208,13 @@ def create_chunk_seg_map_task(storagestr):
 
 def create_merge_seginfo_tasks(
     storagestr, hashmax, aux_storagestr=None, 
-    szthresh=None, timingtag=None):
+    szthresh=None, timingtag=None, bucket_plan=None):
 
     class MergeSeginfoTaskIterator(object):
         def __init__(self, storagestr, hashmax, aux_storagestr, szthresh):
+            self.buckets = bucket_groups(hashmax, bucket_plan)
             self.level_start = 0
-            self.level_end = hashmax
+            self.level_end = len(self.buckets)
             self.storagestr = storagestr
             self.aux_storagestr = aux_storagestr
             self.szthresh = szthresh
@@ -144,8 +237,9 @@ def create_merge_seginfo_tasks(
             if self.szthresh is not None:
                 aux_arg += f" --szthresh {self.szthresh}"
 
-            for i in range(self.level_start, self.level_end):
-                cmd = (f"merge_seginfo {self.storagestr} {i} {aux_arg}")
+            for buckets in self.buckets[self.level_start:self.level_end]:
+                cmd = (f"merge_seginfo {self.storagestr} {tup2str(buckets)}"
+                       f" {aux_arg}")
 
                 yield SynaptorTask(cmd)
 
@@ -155,7 +249,8 @@ def create_merge_seginfo_tasks(
 
 def create_chunk_edges_tasks(
     imgpath, cleftpath, segpath, storagestr, hashmax, storagedir,
-    bounds, chunkshape, patchsz, resolution=(4, 4, 40)):
+    bounds, chunkshape, patchsz, resolution=(4, 4, 40),
+    skip_unchanged=False, skip_tags=()):
     """ Only passing the required arguments for now """
     shape = Vec(*chunkshape)
 
@@ -185,6 +280,9 @@ def create_chunk_edges_tasks(
                 if task_bounds.volume() < 1:
                     continue
 
+                if chunk_tag(task_bounds) in skip_tags:
+                    continue
+
                 chunk_begin = tup2str(task_bounds.minpt)
                 chunk_end = tup2str(task_bounds.maxpt)
                 patchsz_str = tup2str(patchsz)
@@ -194,6 +292,8 @@ def create_chunk_edges_tasks(
                        f" {storagestr} {hashmax} --storagedir {storagedir}"
                        f" --chunk_begin {chunk_begin} --chunk_end {chunk_end}"
                        f" --patchsz {patchsz_str} --resolution {res_str}")
+                if skip_unchanged:
+                    cmd += " --skip_unchanged"
 
                 yield SynaptorTask(cmd)
 
@@ -201,12 +301,13 @@ def create_chunk_edges_tasks(
     return ChunkEdgesTaskIterator(0, level_end)
 
 
-def create_pick_edge_tasks(storagestr, hashmax):
+def create_pick_edge_tasks(storagestr, hashmax, bucket_plan=None):
 
     class PickEdgeTaskIterator(object):
         def __init__(self, storagestr, hashmax):
+            self.buckets = bucket_groups(hashmax, bucket_plan)
             self.level_start = 0
-            self.level_end = hashmax
+            self.level_end = len(self.buckets)
             self.storagestr = storagestr
 
         def __len__(self):
@@ -219,8 +320,8 @@ def create_pick_edge_tasks(storagestr, hashmax):
             return itr
 
         def __iter__(self):
-            for i in range(self.level_start, self.level_end):
-                cmd = f"pick_edge {self.storagestr} {i}"
+            for buckets in self.buckets[self.level_start:self.level_end]:
+                cmd = f"pick_edge {self.storagestr} {tup2str(buckets)}"
 
                 yield SynaptorTask(cmd)
 
@@ -229,15 +330,16 @@ def create_pick_edge_tasks(storagestr, hashmax):
 
 def create_merge_dup_tasks(
     storagestr, hashmax, dist_thresh, size_thresh,
-    resolution=(4, 4, 40), output_storagestr=None):
+    resolution=(4, 4, 40), output_storagestr=None, bucket_plan=None):
 
     output_storagestr = (storagestr if output_storagestr is None
                          else output_storagestr)
 
     class MergeDupsTaskIterator(object):
         def __init__(self, storagestr, hashmax):
+            self.buckets = bucket_groups(hashmax, bucket_plan)
             self.level_start = 0
-            self.level_end = hashmax
+            self.level_end = len(self.buckets)
             self.storagestr = storagestr
 
         def __len__(self):
@@ -251,8 +353,9 @@ def create_merge_dup_tasks(
 
         def __iter__(self):
             res_str = tup2str(resolution)
-            for i in range(self.level_start, self.level_end):
-                cmd = (f"merge_dups {self.storagestr} {i} {dist_thresh}"
+            for buckets in self.buckets[self.level_start:self.level_end]:
+                cmd = (f"merge_dups {self.storagestr} {tup2str(buckets)}"
+                       f" {dist_thresh}"
                        f" {size_thresh} --voxel_res {res_str}"
                        f" --fulldf_storagestr {output_storagestr}")
 
@@ -310,7 +413,7 @@ def create_remap_tasks(
 
 def create_overlap_tasks(
     segpath, base_segpath, storagestr,
-    bounds, shape, mip=(8, 8, 40), parallel=1):
+    bounds, shape, mip=(8, 8, 40), parallel=1, hashmax=None, topk=None):
 
     shape = Vec(*shape)
 
@@ -348,6 +451,10 @@ def create_overlap_tasks(
           cmd = (f"chunk_overlaps {segpath} {base_segpath} {storagestr}"
                  f" --chunk_begin {chunk_begin} --chunk_end {chunk_end}"
                  f" --parallel {parallel} --mip {mip_str}")
+          if hashmax is not None:
+            cmd += f" --hashmax {hashmax}"
+          if topk is not None:
+            cmd += f" --topk {topk}"
 
           yield SynaptorTask(cmd)
 
@@ -359,6 +466,34 @@ def create_merge_overlaps_task(storagestr):
     return SynaptorTask(f"merge_overlaps {storagestr}")
 
 
+def create_hashed_merge_overlaps_tasks(storagestr, hashmax, topk_mode=None):
+
+    class MergeOverlapsTaskIterator(object):
+        def __init__(self, storagestr, hashmax):
+            self.level_start = 0
+            self.level_end = hashmax
+            self.storagestr = storagestr
+
+        def __len__(self):
+            return self.level_end - self.level_start
+
+        def __getitem__(self, slc):
+            itr = copy.deepcopy(self)
+            itr.level_start = self.level_start + slc.start
+            itr.level_end = self.level_start + slc.stop
+            return itr
+
+        def __iter__(self):
+            for i in range(self.level_start, self.level_end):
+                cmd = f"merge_overlaps {self.storagestr} --hashval {i}"
+                if topk_mode is not None:
+                    cmd += f" --topk_mode {topk_mode}"
+
+                yield SynaptorTask(cmd)
+
+    return MergeOverlapsTaskIterator(storagestr, hashmax)
+
+
 def create_cloudvols(
     output_path, temp_output_path, voxelres, vol_shape,
     startcoord, block_shape):
@@ -6,6 +6,7 @@ Nicholas Turner, 2018
 """
 
 import operator
+import itertools
 
 import numpy as np
 
@@ -35,6 +36,7 @@ def score_at_thresholds(net, prox, img, seg, clf, labels,
     pairs, locs, cands = find_candidates(pre_terms, post_terms, seg,
                                          seg_sz_thresh=seg_sz_thresh,
                                          centroid_dist_thresh=centroid_dist_thresh,
+                                         sep_thresh=sep_thr,
                                          voxel_res=voxel_res,
                                          remove_self=True)
 
@@ -65,16 +67,102 @@ def score_at_thresholds(net, prox, img, seg, clf, labels,
         return returns
 
 
+def score_threshold_sweep(net, prox, img, seg, clf, labels,
+                          presyn_threshs, postsyn_threshs, term_sz_thresh=0,
+                          centroid_dist_thresh=200, sep_thr=50,
+                          seg_sz_thresh=0, voxel_res=[40, 4, 4],
+                          patchsz=(160, 160, 16)):
+    """
+    Scores every pair of presynaptic and postsynaptic thresholds in one pass
+
+    Terminals and their cleft overlaps are computed once per threshold on
+    each side, and each distinct candidate (segment pair and location) is
+    evaluated by the network once across the whole sweep.
+
+    Returns a dict mapping (presyn_thresh, postsyn_thresh) to the
+    prec_rec_curve output at those thresholds
+    """
+    pre_terms = dict()
+    pre_ovls = dict()
+    for t in presyn_threshs:
+        terms = proc.seg.partnerprox.find_terminals(prox > t, seg,
+                                                    term_sz_thresh)
+        pre_terms[t] = candidate.partnerprox.filter_terminals(
+                           terms, seg, seg_sz_thresh)[0]
+        pre_ovls[t] = cleft_overlaps(pre_terms[t], clf)
+
+    post_terms = dict()
+    post_ovls = dict()
+    for t in postsyn_threshs:
+        terms = proc.seg.partnerprox.find_terminals(prox < t, seg,
+                                                    term_sz_thresh)
+        post_terms[t] = candidate.partnerprox.filter_terminals(
+                            terms, seg, seg_sz_thresh)[0]
+        post_ovls[t] = cleft_overlaps(post_terms[t], clf)
+
+    # Extracting candidates for each threshold pair
+    find_candidates = candidate.extract_terminal_candidates
+    sweep_preds = dict()
+    sweep_keys = dict()
+    for (pre_t, post_t) in itertools.product(presyn_threshs, postsyn_threshs):
+        pairs, locs, cands = find_candidates(pre_terms[pre_t],
+                                             post_terms[post_t], seg,
+                                             seg_sz_thresh=seg_sz_thresh,
+                                             centroid_dist_thresh=centroid_dist_thresh,
+                                             sep_thresh=sep_thr,
+                                             voxel_res=voxel_res,
+                                             remove_self=True)
+
+        assoc_clefts = max_cleft_overlaps(cands, pre_ovls[pre_t],
+                                          post_ovls[post_t])
+
+        sweep_preds[pre_t, post_t] = [(cleft, pair[0], pair[1])
+                                      for (cleft, pair)
+                                      in zip(assoc_clefts, pairs)]
+        sweep_keys[pre_t, post_t] = [(loc, pair[0], pair[1])
+                                     for (loc, pair) in zip(locs, pairs)]
+
+    # Scoring each distinct candidate once, sharing patches by location
+    all_keys = sorted(set(itertools.chain(*sweep_keys.values())))
+    locs_fmt = {key[0]: (key[0],) for key in all_keys}
+    _, all_scores = edge.prune_candidates(net, img, seg, patchsz, all_keys,
+                                          output_thresh=-np.inf,
+                                          cleft_locs=locs_fmt, prox=prox,
+                                          loc_type="manual")
+    key_scores = dict(zip(all_keys, all_scores))
+
+    results = dict()
+    for (thresholds, preds) in sweep_preds.items():
+        scores = [key_scores[key] for key in sweep_keys[thresholds]]
+        results[thresholds] = prec_rec_curve(preds, scores, labels)
+
+    return results
+
+
 def find_max_cleft_overlaps(term_pairs, presyn_terms, postsyn_terms, clf):
 
-    pre_ovl, pre_ids, clf_ids = seg_utils.count_overlaps(presyn_terms, clf)
-    post_ovl, post_ids, _ = seg_utils.count_overlaps(postsyn_terms, clf)
+    pre_ovls = cleft_overlaps(presyn_terms, clf)
+    post_ovls = cleft_overlaps(postsyn_terms, clf)
+
+    return max_cleft_overlaps(term_pairs, pre_ovls, post_ovls)
+
+
+def cleft_overlaps(terms, clf):
+    """
+    Counts the overlaps between terminals and clefts, returning the overlap
+    matrix (csr), a mapping from terminal id to row, and the cleft ids
+    """
+    ovl, term_ids, clf_ids = seg_utils.count_overlaps(terms, clf)
+
+    lookup = {termid: i for (i, termid) in enumerate(term_ids)}
+
+    return ovl.tocsr(), lookup, clf_ids
+
 
-    pre_ovl = pre_ovl.tocsr()
-    post_ovl = post_ovl.tocsr()
+def max_cleft_overlaps(term_pairs, pre_ovls, post_ovls):
 
-    pre_lookup = {termid: i for (i, termid) in enumerate(pre_ids)}
-    post_lookup = {termid: i for (i, termid) in enumerate(post_ids)}
+    pre_ovl, pre_lookup, clf_ids = pre_ovls
+    post_ovl, post_lookup, _ = post_ovls
 
     overlapping_clefts = list()
     for (presyn_id, postsyn_id) in term_pairs:
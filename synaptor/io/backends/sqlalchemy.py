@@ -102,6 +102,18 @@ def read_dframe(url, statement, index_col=None):
     return pd.read_sql_query(statement, engine, index_col=index_col)
 
 
+def iter_dframes(url, statement, index_col=None, chunksize=100000):
+    """
+    Reads the results of a query as dataframes of up to chunksize rows.
+    Results are streamed by a server-side cursor where it's supported.
+    """
+    engine = init_engine(url)
+
+    with engine.connect().execution_options(stream_results=True) as conn:
+        yield from pd.read_sql_query(statement, conn, index_col=index_col,
+                                     chunksize=chunksize)
+
+
 def read_dframes(url, statements, index_cols=None):
     """ Read multiple tables as a single transaction. """
     if index_cols is None:
@@ -176,26 +188,33 @@ def copy_from_fname(fname, table, columns=None, conn=None, url=None):
         conn.close()
 
 
-def write_dframes_copy_from(dframes, url, tables, index=False):
-    """ Write multiple tables as a single transaction. """
+def write_dframes_copy_from(dframes, url, tables, index=False,
+                            statements=()):
+    """
+    Write multiple tables as a single transaction. Any statements
+    (e.g. deleting outdated rows) are executed first within the
+    same transaction.
+    """
     assert len(dframes) == len(tables)
     engine = init_engine(url)
 
-    conn = engine.raw_connection()
-    temp_file = tempfile.NamedTemporaryFile()
-    for (dframe, table) in zip(dframes, tables):
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.execute(statement)
 
-        if index:
-            dframe = dframe.reset_index()
+        conn = connection.connection
+        temp_file = tempfile.NamedTemporaryFile()
+        for (dframe, table) in zip(dframes, tables):
 
-        local.write_dframe(dframe, temp_file.name, index=False, header=False)
-        clean_file_floats(temp_file.name)
-        columns = list(str(c) for c in dframe.columns)
+            if index:
+                dframe = dframe.reset_index()
 
-        copy_from_fname(temp_file.name, table, columns=columns, conn=conn)
+            local.write_dframe(dframe, temp_file.name,
+                               index=False, header=False)
+            clean_file_floats(temp_file.name)
+            columns = list(str(c) for c in dframe.columns)
 
-    conn.commit()
-    conn.close()
+            copy_from_fname(temp_file.name, table, columns=columns, conn=conn)
 
 
 def clean_file_floats(fname):
@@ -295,6 +295,7 @@ def write_h5(data, path_or_head, basename=None, chunk_size=None):
 read_db_dframe = bck.sqlalchemy.read_dframe
 write_db_dframe = bck.sqlalchemy.write_dframe_copy_from
 read_db_dframes = bck.sqlalchemy.read_dframes
+iter_db_dframes = bck.sqlalchemy.iter_dframes
 write_db_dframes = bck.sqlalchemy.write_dframes_copy_from
 create_index = bck.sqlalchemy.create_index
 
@@ -6,7 +6,7 @@ from . import anchor
 
 from . import tasks
 from .tasks import cc_task
-from .tasks import merge_ccs_task
+from .tasks import merge_ccs_task, append_ccs_task
 from .tasks import edge_task
 from .tasks import merge_edges_task
 from .tasks import remap_ids_task
@@ -2,15 +2,25 @@
 
 import numpy as np
 import pandas as pd
+from scipy import spatial
 
 from ... import seg_utils
 from ...types import bbox
+from .. import utils
 
 
 def place_anchor_pts(edge_df, seg, clf, voxel_res=[4, 4, 40],
                      offset=(0, 0, 0), min_box_width=[100, 100, 5],
-                     wshed=None, cleft_ids=None, verbose=False):
-
+                     wshed=None, cleft_ids=None, verbose=False,
+                     num_workers=0):
+    """
+    Places anchor points for both partners of each cleft in a chunk.
+
+    The cleft and segment voxels are indexed once for the whole chunk
+    (seg_utils.CoordIndex), and each cleft then queries the coordinates
+    within its local box. Clefts are placed over num_workers forked
+    processes if num_workers > 0.
+    """
     if cleft_ids is None:
         cleft_ids = seg_utils.nonzero_unique_ids(clf)
     if len(cleft_ids) == 0:
@@ -22,19 +32,25 @@ def place_anchor_pts(edge_df, seg, clf, voxel_res=[4, 4, 40],
                      zip(edge_df.presyn_segid,
                          edge_df.postsyn_segid)))
 
+    seg_index = seg_utils.CoordIndex(seg)
+    clf_index = seg_utils.CoordIndex(clf)
+
+    def place_pair(cleft_id):
+        presyn, postsyn = edges[cleft_id]
+
+        return place_anchor_pair(cleft_id, presyn, postsyn,
+                                 seg_index, clf_index,
+                                 cleft_bboxes[cleft_id], seg.shape,
+                                 voxel_res=voxel_res, verbose=verbose,
+                                 min_box_width=min_box_width)
+
+    anchor_pairs = utils.fork_map(place_pair, cleft_ids,
+                                  num_workers=num_workers)
+
     anchor_pts = list()
     presyn_wshed_id = -1
     postsyn_wshed_id = -1
-    for cleft_id in cleft_ids:
-        presyn, postsyn = edges[cleft_id]
-        bbox = cleft_bboxes[cleft_id]
-
-        presyn_pt = place_anchor_pt(cleft_id, presyn, clf, seg, bb=bbox,
-                                    voxel_res=voxel_res, verbose=verbose,
-                                    min_box_width=min_box_width)
-        postsyn_pt = place_anchor_pt(cleft_id, postsyn, clf, seg, bb=bbox,
-                                     voxel_res=voxel_res, verbose=verbose,
-                                     min_box_width=min_box_width)
+    for (cleft_id, (presyn_pt, postsyn_pt)) in zip(cleft_ids, anchor_pairs):
 
         if wshed is not None:
             presyn_wshed_id = wshed[presyn_pt]
@@ -48,6 +64,43 @@ def place_anchor_pts(edge_df, seg, clf, voxel_res=[4, 4, 40],
     return pd.DataFrame.from_records(anchor_pts)
 
 
+def place_anchor_pair(cleft_id, presyn_id, postsyn_id, seg_index, clf_index,
+                      bb, vol_shape, verbose=False, voxel_res=[4, 4, 40],
+                      min_box_width=[100, 100, 5]):
+    """
+    Places the anchor points for both partners of a cleft using
+    seg_utils.CoordIndex objects over the segmentation and clefts.
+    The cleft's KD-tree is built once and shared between the partners.
+    """
+    if verbose:
+        print(f"Placing anchors for cleft {cleft_id}"
+              f" on segments {presyn_id} and {postsyn_id}")
+
+    bb = anchor_box(bb, vol_shape, min_box_width)
+
+    if verbose:
+        print(f"local bbox: {bb}")
+
+    box_min = np.array(tuple(bb.min()))
+    view_shape = tuple(bb.shape())
+
+    clf_coords = clf_index.coords_in_box(cleft_id, bb) - box_min
+    clf_tree = scaled_kdtree(clf_coords, voxel_res)
+
+    anchor_pts = list()
+    for seg_id in (presyn_id, postsyn_id):
+        if np.isnan(seg_id):
+            anchor_pts.append((-1,-1,-1))
+            continue
+
+        seg_coords = seg_index.coords_in_box(seg_id, bb) - box_min
+        anchor_pts.append(anchor_pt_from_coords(clf_tree, seg_coords, bb,
+                                                view_shape, voxel_res,
+                                                min_box_width))
+
+    return tuple(anchor_pts)
+
+
 def place_anchor_pt(cleft_id, seg_id, clf, seg,
                     bb=None, surfaces=None, verbose=False,
                     voxel_res=[4, 4, 40], min_box_width=[100, 100, 5]):
@@ -59,14 +112,8 @@ def place_anchor_pt(cleft_id, seg_id, clf, seg,
         return (-1,-1,-1)
     if bb is None:
         bb = seg_utils.bounding_boxes(clf)[cleft_id]
-    clf_b = clf[bb.index()]
 
-    bb = bb.grow_by(min_box_width)
-    bb = bbox.shift_to_bounds(bb, seg.shape)
-
-    # Extra checking that the bbox coordinates are valid
-    bounds = bbox.BBox3d((0, 0, 0), seg.shape)
-    bb = bb.intersect(bounds)
+    bb = anchor_box(bb, seg.shape, min_box_width)
 
     if verbose:
         print(f"local bbox: {bb}")
@@ -75,37 +122,63 @@ def place_anchor_pt(cleft_id, seg_id, clf, seg,
     seg_v = seg[bb.index()]
     clf_v = clf[bb.index()]
 
-    if seg_id not in seg_v:
+    clf_tree = scaled_kdtree(find_coords(clf_v, cleft_id), voxel_res)
+
+    return anchor_pt_from_coords(clf_tree, find_coords(seg_v, seg_id), bb,
+                                 seg_v.shape, voxel_res, min_box_width)
+
+
+def anchor_box(bb, vol_shape, min_box_width=[100, 100, 5]):
+    """ Grows a cleft bbox into the local box where anchors are placed """
+    bb = bb.grow_by(min_box_width)
+    bb = bbox.shift_to_bounds(bb, vol_shape)
+
+    # Extra checking that the bbox coordinates are valid
+    bounds = bbox.BBox3d((0, 0, 0), vol_shape)
+
+    return bb.intersect(bounds)
+
+
+def anchor_pt_from_coords(clf_tree, seg_coords, bb, view_shape,
+                          voxel_res, min_box_width):
+    """
+    Places an anchor point on a segment given its coordinates within a
+    local box (relative to the box), and a KD-tree over the (scaled)
+    cleft coordinates within that box
+    """
+    if len(seg_coords) == 0:
         return (-2,-2,-2)
 
-    base_pt = closest_pt_to_seg(cleft_id, seg_id, clf_v, seg_v, voxel_res)
-    shifted = shift_pt(base_pt, seg_id, seg_v, min_box_width, voxel_res)
+    base_pt = closest_coord_to_tree(clf_tree, seg_coords, voxel_res)
+    shifted = shift_coords(base_pt, seg_coords, view_shape,
+                           min_box_width, voxel_res)
     anchor_pt = tuple(shifted + bb.min())
 
     return anchor_pt
 
 
 def closest_pt_to_seg(seg1_id, seg2_id, seg1, seg2, voxel_res):
-    """Greedily estimates the closest point in seg2 to seg1"""
-
-    # Takes a greedy strategy
+    """Finds the closest point in seg2 to seg1"""
     seg1_coords = find_coords(seg1, seg1_id)
     seg2_coords = find_coords(seg2, seg2_id)
 
-    closest_seg1pt = tuple(seg1_coords[0])
-    closest_seg2pt = tuple(seg2_coords[0])
+    seg1_tree = scaled_kdtree(seg1_coords, voxel_res)
 
-    while True:
-        new_pt2 = closest_coord_to_pt(closest_seg1pt, seg2_coords, voxel_res)
-        new_pt1 = closest_coord_to_pt(new_pt2, seg1_coords, voxel_res)
+    return closest_coord_to_tree(seg1_tree, seg2_coords, voxel_res)
 
-        if new_pt1 == closest_seg1pt and new_pt2 == closest_seg2pt:
-            break
 
-        closest_seg1pt = new_pt1
-        closest_seg2pt = new_pt2
+def scaled_kdtree(coords, voxel_res):
+    """ Builds a KD-tree over coordinates scaled by the voxel resolution """
+    return spatial.cKDTree(coords * np.array(voxel_res))
 
-    return closest_seg2pt
+
+def closest_coord_to_tree(tree, coords, voxel_res):
+    """
+    Finds the coordinate closest to any point within a tree built by
+    scaled_kdtree. Ties are broken by the order of coords.
+    """
+    dists, _ = tree.query(coords * np.array(voxel_res))
+    return tuple(coords[np.argmin(dists)])
 
 
 def find_coords(seg, segid):
@@ -130,6 +203,25 @@ def shift_pt(base_pt, seg_id, seg_v, box_width, voxel_res):
     return tuple(local_centroid_coord + bb.min())
 
 
+def shift_coords(base_pt, seg_coords, view_shape, box_width, voxel_res):
+    """
+    Same as shift_pt, but selects the local coordinates from those
+    already found across the view (seg_coords) instead of rescanning
+    """
+    bb = bbox.containing_box(base_pt, box_width, view_shape)
+
+    box_min = np.array(tuple(bb.min()))
+    box_max = np.array(tuple(bb.max()))
+    inside = np.all((seg_coords >= box_min) & (seg_coords < box_max), axis=1)
+
+    local_coords = seg_coords[inside] - box_min
+    local_centroid = tuple(np.mean(local_coords, axis=0))
+    local_centroid_coord = closest_coord_to_pt(local_centroid, local_coords,
+                                               voxel_res)
+
+    return tuple(local_centroid_coord + bb.min())
+
+
 def make_record(cleft_segid, presyn_pt, postsyn_pt,
                 presyn_wshed_id, postsyn_wshed_id,
                 offset=(0, 0, 0)):
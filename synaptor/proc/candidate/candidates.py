@@ -1,16 +1,10 @@
 __doc__ = """
 Independent Implementation of HCBS' Synaptic Partner Candidate Generation
 """
-import operator
-import itertools
-
-import numpy as np
-from scipy import spatial
-from scipy import sparse
-from scipy.ndimage import distance_transform_edt
-
 from ... import seg_utils
 from .. import seg
+from . import partnerprox
+from . import cleft
 
 
 def extract_prox_candidates(proxim, seg, presyn_thr, postsyn_thr,
@@ -56,80 +50,27 @@ def find_terminals(threshed_proxim, seg, sz_thresh):
 
 
 def split_ccs_by_overlap(ccs, seg):
-
-    assert ccs.max() < np.iinfo(np.uint32).max, "cc values too high"
-    assert seg.max() < np.iinfo(np.uint32).max, "seg values too high"
-
-    ccs = ccs.astype(np.uint32)
-    split = (seg.astype(np.uint64) << np.uint64(32)) + ccs
-    split[ccs == 0] = 0
-
-    return seg_utils.relabel_data_1N(split, copy=False).astype(np.uint32)
+    """
+    Splits connected components by the segments they overlap. Components
+    outside of the segmentation keep a (relabeled) id of their own.
+    """
+    return seg_utils.relabel_pairs(seg, ccs, mask=ccs != 0)
 
 
 def filter_terminals(terminals, seg, seg_sz_thresh):
-
-    seg_szs = seg_utils.segment_sizes(seg)
-
-    term_nonz = terminals[terminals != 0]
-    seg_nonz = seg[terminals != 0]
-
-    term_to_seg = dict(zip(term_nonz, seg_nonz))
-
-    under_thresh = lambda x: x == 0 or seg_szs[x] < seg_sz_thresh
-
-    terms_to_remove = list(map(operator.itemgetter(0),
-                               filter(lambda pair: under_thresh(pair[1]),
-                                      term_to_seg.items())))
-
-    term_to_seg = dict(filter(lambda p: p[0] not in terms_to_remove,
-                              term_to_seg.items()))
-
-    terminals = seg_utils.filter_segs_by_id(terminals,
-                                            terms_to_remove, copy=False)
-
-    return terminals, term_to_seg
+    return partnerprox.filter_terminals(terminals, seg, seg_sz_thresh)
 
 
 def pairs_within_dist(centroids1, centroids2, dist_thr, voxel_res=[40,4,4]):
-
-    ids1 = list(centroids1.keys())
-    ids2 = list(centroids2.keys())
-
-    cents1 = np.array([centroids1[i] for i in ids1]) * voxel_res
-    cents2 = np.array([centroids2[i] for i in ids2]) * voxel_res
-
-    pairs = np.nonzero(spatial.distance.cdist(cents1, cents2) < dist_thr)
-    # converting to original ids
-    pairs = list((ids1[i], ids2[j]) for (i,j) in zip(*pairs))
-
-    return pairs
+    return partnerprox.pairs_within_dist(centroids1, centroids2, dist_thr,
+                                         voxel_res=voxel_res)
 
 
 def filter_by_dist(candidates, sep_thr,
                    presyn_terms, postsyn_terms, voxel_res=[40,4,4]):
-
-    presyn_bboxes = seg_utils.bounding_boxes(presyn_terms)
-    postsyn_bboxes = seg_utils.bounding_boxes(postsyn_terms)
-
-    filtered = list()
-    locs = list()
-    for (pre, post) in candidates:
-        bbox = presyn_bboxes[pre].merge(postsyn_bboxes[post])
-
-        pre_view = presyn_terms[bbox.index()]
-        post_view = postsyn_terms[bbox.index()]
-
-        edt = distance_transform_edt(post_view != post, sampling=voxel_res)
-
-        edt[pre_view != pre] = np.inf
-        if np.any(edt[pre_view == pre] < sep_thr):
-            filtered.append((pre, post))
-            # Find closest pt between terminals
-            local_loc = np.unravel_index(np.argmin(edt), edt.shape)
-            locs.append(tuple(local_loc + bbox.min()))
-
-    return filtered, locs
+    return partnerprox.filter_by_separation(candidates, sep_thr,
+                                            presyn_terms, postsyn_terms,
+                                            voxel_res=voxel_res)
 
 
 def extract_label_candidates(clefts, seg, dil_param=5, overlap_thresh=25,
@@ -150,19 +91,4 @@ def extract_label_candidates(clefts, seg, dil_param=5, overlap_thresh=25,
 
 
 def overlapping_pairs(clefts, seg, overlap_thresh):
-
-    overlaps, cleft_ids, seg_ids = seg_utils.count_overlaps(clefts, seg)
-
-    pairs = list()
-
-    r, c, v = sparse.find(overlaps)
-    r = r[v > overlap_thresh]
-    c = c[v > overlap_thresh]
-    v = v[v > overlap_thresh]
-
-    for i in np.unique(r):
-        segs = c[r == i]
-        for (seg_i, seg_j) in itertools.product(segs, segs):
-            pairs.append((cleft_ids[i], seg_ids[seg_i], seg_ids[seg_j]))
-
-    return pairs
+    return cleft.overlapping_pairs(clefts, seg, overlap_thresh)
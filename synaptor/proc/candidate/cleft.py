@@ -4,8 +4,6 @@ Connectivity Edge Candidate Generation Using Cleft Segments
 Nicholas Turner, 2018
 """
 
-import itertools
-
 import numpy as np
 from scipy import spatial
 from scipy import sparse
@@ -22,19 +20,28 @@ def extract_label_candidates(clefts, seg, dil_param=5, overlap_thresh=25):
 
 
 def overlapping_pairs(clefts, seg, overlap_thresh):
-
+    """
+    Returns (cleft id, segid, segid) for every ordered pair of segments
+    overlapping each cleft by more than a threshold
+    """
     overlaps, cleft_ids, seg_ids = seg_utils.count_overlaps(clefts, seg)
 
-    pairs = list()
-
     r, c, v = sparse.find(overlaps)
     r = r[v > overlap_thresh]
     c = c[v > overlap_thresh]
-    v = v[v > overlap_thresh]
 
-    for i in np.unique(r):
-        segs = c[r == i]
-        for (seg_i, seg_j) in itertools.product(segs, segs):
-            pairs.append((cleft_ids[i], seg_ids[seg_i], seg_ids[seg_j]))
+    order = np.lexsort((c, r))
+    r, c = r[order], c[order]
+
+    # each entry pairs with every entry (itself included) of its cleft
+    _, starts, sizes = np.unique(r, return_index=True, return_counts=True)
+    elem_sizes = np.repeat(sizes, sizes)
+    elem_starts = np.repeat(starts, sizes)
+
+    first = np.repeat(np.arange(len(r)), elem_sizes)
+    block_starts = np.cumsum(elem_sizes) - elem_sizes
+    second = (np.arange(len(first)) - np.repeat(block_starts, elem_sizes)
+              + np.repeat(elem_starts, elem_sizes))
 
-    return pairs
+    return list(zip(cleft_ids[r[first]],
+                    seg_ids[c[first]], seg_ids[c[second]]))
@@ -79,22 +79,32 @@ def filter_terminals(terminals, seg, seg_sz_thresh):
     """
     Remove terminal segments which overlap with segments with size
     under a threshold
-    """
-    seg_szs = seg_utils.segment_sizes(seg)
-
-    term_nonz = terminals[terminals != 0]
-    seg_nonz = seg[terminals != 0]
-
-    term_to_seg = dict(zip(term_nonz, seg_nonz))
-
-    terms_to_remove = [k for (k, v) in term_to_seg.items()
-                       if v == 0 or seg_szs[v] < seg_sz_thresh]
 
-    term_to_seg = dict(filter(lambda p: p[0] not in terms_to_remove,
-                              term_to_seg.items()))
-
-    terminals = seg_utils.filter_segs_by_id(terminals,
-                                            terms_to_remove, copy=False)
+    Each terminal maps to the segment under its last voxel (C-order)
+    """
+    nonz = np.nonzero(terminals)
+    term_nonz = terminals[nonz]
+    seg_nonz = seg[nonz]
+
+    # unique over the reversed voxels finds the last voxel of each terminal
+    term_ids, first = np.unique(term_nonz, return_index=True)
+    _, last_rev, inv = np.unique(term_nonz[::-1], return_index=True,
+                                 return_inverse=True)
+    term_segs = seg_nonz[len(seg_nonz) - 1 - last_rev]
+
+    seg_ids, seg_szs = np.unique(seg, return_counts=True)
+    term_seg_szs = seg_szs[np.searchsorted(seg_ids, term_segs)]
+    remove = (term_segs == 0) | (term_seg_szs < seg_sz_thresh)
+
+    # keeping dictionary order consistent with the first voxel of each id
+    keep = np.flatnonzero(~remove)
+    keep = keep[np.argsort(first[keep], kind="stable")]
+    term_to_seg = dict(zip(term_ids[keep], term_segs[keep]))
+
+    inv = inv.reshape(-1)[::-1]
+    to_zero = remove[inv]
+    if np.any(to_zero):
+        terminals[tuple(inds[to_zero] for inds in nonz)] = 0
 
     return terminals, term_to_seg
 
@@ -103,25 +113,29 @@ def pairs_within_dist(centroids1, centroids2, dist_thr, voxel_res=[40, 4, 4]):
     """
     Return the keys within two centroid dictionaries which are within
     a threshold distance of one another
+
+    Uses a KD-tree radius search over centroids scaled by the voxel
+    resolution, so memory scales with the number of close pairs
     """
     ids1 = list(centroids1.keys())
     ids2 = list(centroids2.keys())
 
-    empty = np.zeros((0, 3), dtype=np.float32)
+    if len(ids1) == 0 or len(ids2) == 0:
+        return list()
 
-    if len(centroids1) > 0:
-        cents1 = np.array([centroids1[i] for i in ids1]) * voxel_res
-    else:
-        cents1 = empty
+    cents1 = np.array([centroids1[i] for i in ids1]) * voxel_res
+    cents2 = np.array([centroids2[i] for i in ids2]) * voxel_res
 
-    if len(centroids2) > 0:
-        cents2 = np.array([centroids2[i] for i in ids2]) * voxel_res
-    else:
-        cents2 = empty
+    tree1 = spatial.cKDTree(cents1)
+    tree2 = spatial.cKDTree(cents2)
+
+    close = tree1.sparse_distance_matrix(tree2, dist_thr,
+                                         output_type="ndarray")
+    close = close[close["v"] < dist_thr]
+    close = close[np.lexsort((close["j"], close["i"]))]
 
-    pairs = np.nonzero(spatial.distance.cdist(cents1, cents2) < dist_thr)
     # converting to original ids
-    pairs = list((ids1[i], ids2[j]) for (i, j) in zip(*pairs))
+    pairs = list((ids1[i], ids2[j]) for (i, j) in zip(close["i"], close["j"]))
 
     return pairs
 
@@ -132,25 +146,44 @@ def filter_by_separation(candidates, sep_thr,
     """
     Filter candidate synaptic partners by the separation distance between
     the relevant terminal segments
+
+    The distance transform for each postsynaptic terminal is computed once
+    over a box containing all of its candidate presynaptic partners
     """
     presyn_bboxes = seg_utils.bounding_boxes(presyn_terms)
     postsyn_bboxes = seg_utils.bounding_boxes(postsyn_terms)
 
-    filtered = list()
-    locs = list()
-    for (pre, post) in candidates:
-        bbox = presyn_bboxes[pre].merge(postsyn_bboxes[post])
+    candidates = list(candidates)
+    by_post = dict()
+    for (i, (_, post)) in enumerate(candidates):
+        by_post.setdefault(post, []).append(i)
 
-        pre_view = presyn_terms[bbox.index()]
-        post_view = postsyn_terms[bbox.index()]
+    cand_locs = [None for _ in candidates]
+    for (post, inds) in by_post.items():
+        bbox = postsyn_bboxes[post]
+        for i in inds:
+            bbox = bbox.merge(presyn_bboxes[candidates[i][0]])
 
+        post_view = postsyn_terms[bbox.index()]
         edt = distance_transform_edt(post_view != post, sampling=voxel_res)
 
-        edt[pre_view != pre] = np.inf
-        if np.any(edt[pre_view == pre] < sep_thr):
-            filtered.append((pre, post))
-            # Find closest pt between terminals
-            local_loc = np.unravel_index(np.argmin(edt), edt.shape)
-            locs.append(tuple(local_loc + bbox.min()))
+        for i in inds:
+            pre = candidates[i][0]
+            pre_bbox = presyn_bboxes[pre]
+            local_bbox = pre_bbox.translate(-bbox.min())
+
+            pre_mask = presyn_terms[pre_bbox.index()] == pre
+            pre_edt = edt[local_bbox.index()]
+
+            pre_dists = np.where(pre_mask, pre_edt, np.inf)
+            if np.any(pre_dists < sep_thr):
+                # Find closest pt between terminals
+                local_loc = np.unravel_index(np.argmin(pre_dists),
+                                             pre_dists.shape)
+                cand_locs[i] = tuple(local_loc + pre_bbox.min())
+
+    filtered = [cand for (cand, loc) in zip(candidates, cand_locs)
+                if loc is not None]
+    locs = [loc for loc in cand_locs if loc is not None]
 
     return filtered, locs
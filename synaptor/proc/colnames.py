@@ -45,11 +45,14 @@ ovl_segid = "max_overlap"
 rows = "row_id"
 cols = "col_id"
 vals = "vals"
+rowhash = "rowhash"
+ovl_bound = "ovl_bound"
 
 
 # Continuation tables
 contin_filename = "filename"
 facehash = "facehash"
+contin_size = "contin_size"
 
 
 # Seg continuation graph edges
@@ -61,6 +64,14 @@ timing_tag = "timing_tag"
 task_name = "task_name"
 task_time = "duration"
 
+# Task manifests (fingerprints of task inputs)
+params_hash = "params_hash"
+input_hash = "input_hash"
+
+# Hash buckets whose reduce task inputs changed since the task last ran
+stage = "stage"
+bucket = "bucket"
+
 
 # ====================================================
 # Synapse assignment descriptors
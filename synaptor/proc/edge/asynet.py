@@ -5,6 +5,7 @@ import random
 import copy
 import operator
 import itertools
+from collections import namedtuple
 
 import torch
 
@@ -14,6 +15,7 @@ import pandas as pd
 
 from ...types import bbox
 from ... import seg_utils
+from .. import utils
 from .. import colnames as cn
 from . import locs
 from . import score
@@ -31,11 +33,17 @@ def infer_edges(net, img, cleft, seg, patchsz, root_seg=None, offset=(0, 0, 0),
                 cleft_ids=None, dil_param=5, loc_type="centroid",
                 samples_per_cleft=None, score_type="avg", alpha=1,
                 pre_type=None, post_type=None, assign_type="max",
-                thresh=None, thresh2=None):
+                thresh=None, thresh2=None, group_shift=0, max_group_size=8,
+                num_workers=2):
     """
     Runs a trained network over the synaptic clefts within the dataset
     and infers the synaptic partners involved at each synapse
 
+    Clefts whose sample patches lie within group_shift voxels of one
+    another share a patch, and are run through the network as a single
+    batch (see locs.group_cleft_locs). Patches are prepared by num_workers
+    background threads (see infer_grouped_patches)
+
     Returns a DataFrame mapping synaptic cleft segment id to a tuple of
     synaptic partners (presynaptic,postsynaptic)
     """
@@ -46,36 +54,34 @@ def infer_edges(net, img, cleft, seg, patchsz, root_seg=None, offset=(0, 0, 0),
     cleft_locs = locs.pick_cleft_locs(cleft, cleft_ids, loc_type,
                                       samples_per_cleft, patchsz)
 
+    patch_results = infer_grouped_patches(net, img, cleft, seg, patchsz,
+                                          cleft_locs, dil_param=dil_param,
+                                          offset=offset,
+                                          group_shift=group_shift,
+                                          max_group_size=max_group_size,
+                                          num_workers=num_workers)
+
     # whether or not we should record watershed ids
     record_basins = root_seg is not None
 
     edges = []  # list of dict records
-    for (cid, cid_locs) in cleft_locs.items():
+    for (cid, cid_results) in patch_results.items():
 
         wt_sums = dict()
         wt_avgs = dict()
         seg_szs = dict()
         seg_locs = dict()
-        for loc in cid_locs:
-            box = bbox.containing_box(loc, patchsz, cleft.shape)
-            box_offset = box.min() + offset
-
-            img_p, clf_p, seg_p = get_patches(img, cleft, seg, box, cid)
-
-            segids = find_close_segments(clf_p, seg_p, dil_param)
-            if len(segids) == 0:
+        for result in cid_results:
+            if result is None:
                 print(f"skipping {cid}, no close segments")
                 continue
 
-            new_weights, new_szs = infer_patch_weights(net, img_p, clf_p,
-                                                       seg_p, segids)
+            new_weights, new_szs, new_locs = result
 
             wt_sums = dict_tuple_sum(new_weights, wt_sums)
             seg_szs = dict_sum(seg_szs, new_szs)
             wt_avgs = update_avgs(wt_sums, seg_szs)
 
-            new_locs = random_locs(seg_p[0, 0, :].transpose((2, 1, 0)),
-                                   segids, offset=box_offset)
             seg_locs = update_locs(new_locs, seg_locs)
 
         if len(wt_sums) == 0:  # hallucinated synapse - or no segmentation
@@ -117,7 +123,8 @@ def infer_edges(net, img, cleft, seg, patchsz, root_seg=None, offset=(0, 0, 0),
 def infer_all_weights(net, img, cleft, seg, patchsz, offset=(0, 0, 0),
                       cleft_ids=None, dil_param=5, loc_type="centroid",
                       samples_per_cleft=None, alpha=1,
-                      return_sums=False, return_szs=False):
+                      return_sums=False, return_szs=False,
+                      group_shift=0, max_group_size=8, num_workers=2):
 
     """
     """
@@ -127,25 +134,28 @@ def infer_all_weights(net, img, cleft, seg, patchsz, offset=(0, 0, 0),
     cleft_locs = locs.pick_cleft_locs(cleft, cleft_ids, loc_type,
                                       samples_per_cleft, patchsz)
 
+    patch_results = infer_grouped_patches(net, img, cleft, seg, patchsz,
+                                          cleft_locs, dil_param=dil_param,
+                                          offset=offset,
+                                          group_shift=group_shift,
+                                          max_group_size=max_group_size,
+                                          sample_seg_locs=False,
+                                          num_workers=num_workers)
+
     cleft_avgs = dict()
     cleft_sums = dict()
     cleft_szs = dict()
-    for (cid, cid_locs) in cleft_locs.items():
+    for (cid, cid_results) in patch_results.items():
 
         wt_sums = dict()
         wt_avgs = dict()
         seg_szs = dict()
-        for loc in cid_locs:
-            box = bbox.containing_box(loc, patchsz, cleft.shape)
-
-            img_p, clf_p, seg_p = get_patches(img, cleft, seg, box, cid)
-
-            segids = find_close_segments(clf_p, seg_p, dil_param)
-            if len(segids) == 0:
+        for result in cid_results:
+            if result is None:
                 continue
 
-            new_weights, new_szs = infer_patch_weights(net, img_p, clf_p,
-                                                       seg_p, segids)
+            new_weights, new_szs, _ = result
+
             wt_sums = dict_tuple_sum(new_weights, wt_sums)
             seg_szs = dict_sum(seg_szs, new_szs)
             wt_avgs = update_avgs(wt_sums, seg_szs)
@@ -171,6 +181,134 @@ def infer_all_weights(net, img, cleft, seg, patchsz, offset=(0, 0, 0),
         return return_val
 
 
+def infer_grouped_patches(net, img, cleft, seg, patchsz, cleft_locs,
+                          dil_param=5, offset=(0, 0, 0), group_shift=0,
+                          max_group_size=8, sample_seg_locs=True,
+                          num_workers=2, max_prefetch=4):
+    """
+    Runs the network over each sample location of each cleft. Locations
+    whose patches nearly coincide are grouped, and each group shares one
+    image patch and forward pass. Each cleft is still described by its
+    own cleft mask channel within the batch.
+
+    Patches are prepared by num_workers background threads while the
+    network runs. At most max_prefetch groups wait for the network at
+    any time. Setting num_workers to 0 prepares them serially.
+
+    Returns a dictionary mapping each cleft id to a list with an entry
+    for each of its locations. Each entry is None if no segments were
+    close to the cleft within that patch, and a tuple of
+    (seg weights, seg sizes, seg locations) otherwise.
+    """
+    patch_results = {cid: [None for _ in cid_locs]
+                     for (cid, cid_locs) in cleft_locs.items()}
+
+    loc_groups = locs.group_cleft_locs(cleft_locs, patchsz, cleft.shape,
+                                       max_shift=group_shift,
+                                       max_group_size=max_group_size)
+
+    # shared by every patch below
+    img_t = format_img_chunk(img)
+
+    def prepare(loc_group):
+        box, members = loc_group
+        member_cids = [cid for (cid, _) in members]
+
+        return prepare_group(img_t, cleft, seg, box, member_cids,
+                             dil_param, offset=offset)
+
+    prepared_groups = utils.prefetch_map(prepare, loc_groups,
+                                         num_workers=num_workers,
+                                         max_pending=max_prefetch)
+
+    for ((_, members), prepared) in zip(loc_groups, prepared_groups):
+        group_results = weigh_group(net, prepared,
+                                    sample_seg_locs=sample_seg_locs)
+
+        for ((cid, loc_i), result) in zip(members, group_results):
+            patch_results[cid][loc_i] = result
+
+    return patch_results
+
+
+# Everything the network step needs to process a group of clefts
+PreparedGroup = namedtuple("PreparedGroup",
+                           ["num_clefts", "net_input", "to_infer",
+                            "close_segids", "seg_index"])
+
+
+def prepare_group(img_t, cleft, seg, box, cleft_ids, dil_param=5,
+                  offset=(0, 0, 0)):
+    """
+    Prepares the network input for a group of clefts sharing a patch.
+
+    Extracts the patches, finds the segments close to each cleft, and
+    indexes the segment voxels. The network input is a contiguous float32
+    batch covering each cleft with close segments, and the image is
+    normalized as it's copied into this batch. The segment index follows
+    the network's axis order, so its linear indices address the network
+    output directly.
+
+    img_t should be formatted by format_img_chunk.
+    """
+    box_offset = box.min() + offset
+
+    img_p = img_t[tuple(reversed(box.index()))]
+    seg_p = format_patch(seg[box.index()])
+    clf_ps = np.concatenate([get_cleft_patch(cleft, box, cid)
+                             for cid in cleft_ids], axis=0)
+
+    close_segids = find_close_segments_batch(clf_ps, seg_p, dil_param)
+
+    to_infer = [i for (i, segids) in enumerate(close_segids)
+                if len(segids) > 0]
+    if len(to_infer) == 0:
+        return PreparedGroup(len(cleft_ids), None, to_infer,
+                             close_segids, None)
+
+    net_input = np.empty((len(to_infer), 2) + img_p.shape, dtype=np.float32)
+    normalize_img(img_p, out=net_input[:, 0])
+    net_input[:, 1] = clf_ps[to_infer, 0]
+
+    seg_index = seg_utils.CoordIndex(seg_p[0, 0, :],
+                                     offset=tuple(reversed(box_offset)))
+
+    return PreparedGroup(len(cleft_ids), net_input, to_infer,
+                         close_segids, seg_index)
+
+
+def weigh_group(net, prepared, sample_seg_locs=True):
+    """
+    Runs the network over a prepared group, and finds the weights and
+    sizes of each close segment for each cleft.
+
+    Returns a list with an entry for each cleft, formatted as in
+    infer_grouped_patches.
+    """
+    results = [None for _ in range(prepared.num_clefts)]
+
+    if prepared.net_input is None:
+        return results
+
+    outputs = infer_net_input(net, prepared.net_input)
+    seg_index = prepared.seg_index
+
+    for (output, i) in zip(outputs, prepared.to_infer):
+        segids = prepared.close_segids[i]
+        new_weights, new_szs = indexed_seg_weights(output, seg_index, segids)
+
+        if sample_seg_locs:
+            # index coordinates follow the network's (reversed) axis order
+            new_locs = {segid: tuple(reversed(seg_index.random_coord(segid)))
+                        for segid in segids}
+        else:
+            new_locs = None
+
+        results[i] = (new_weights, new_szs, new_locs)
+
+    return results
+
+
 def infer_single_patch(net, img, cleft, seg, patchsz,
                        loc=None, cleft_id=None):
 
@@ -200,12 +338,14 @@ def infer_whole_edges(net, img, cleft, seg,
     if bboxes is None:
         bboxes = seg_utils.bounding_boxes(cleft)
 
+    index = seg_utils.CoordIndex(cleft)
+
     all_weights = {}
 
     for (iter_i, i) in enumerate(cleft_ids):
         weights, _ = infer_whole_edge(net, img, cleft, seg,
                                       i, patchsz, dil_param,
-                                      bboxes)
+                                      bboxes, index=index)
 
         all_weights[i] = weights
 
@@ -213,9 +353,10 @@ def infer_whole_edges(net, img, cleft, seg,
 
 
 def infer_whole_edge(net, img, cleft, seg, cleft_id,
-                     patchsz, dil_param=5, cleft_boxes=None):
+                     patchsz, dil_param=5, cleft_boxes=None, index=None):
 
-    bboxes = pick_cleft_bboxes(cleft, cleft_id, patchsz, cleft_boxes)
+    bboxes = pick_cleft_bboxes(cleft, cleft_id, patchsz, cleft_boxes,
+                               index=index)
 
     seg_weights, seg_szs = {}, {}
     for box in bboxes:
@@ -231,19 +372,23 @@ def infer_whole_edge(net, img, cleft, seg, cleft_id,
     return seg_weights, seg_szs
 
 
-def pick_cleft_bboxes(cleft, cleft_id, patchsz, cleft_boxes):
+def pick_cleft_bboxes(cleft, cleft_id, patchsz, cleft_boxes, index=None):
+
+    if index is None:
+        index = seg_utils.CoordIndex(cleft)
 
-    cleft_mask = cleft == cleft_id
+    cleft_coords = index.coords(cleft_id)
+    uncovered = np.ones((len(cleft_coords),), dtype=bool)
     bboxes = []
 
-    while cleft_mask.max():
-        locs = list(zip(*np.nonzero(cleft_mask)))
+    while uncovered.any():
+        remaining = np.nonzero(uncovered)[0]
 
-        loc = random.choice(locs)
-        box = containing_box(patchsz, cleft_mask, loc)
+        loc = tuple(cleft_coords[random.choice(remaining)])
+        box = bbox.containing_box(loc, patchsz, cleft.shape)
         bboxes.append(box)
 
-        cleft_mask[box.index()] = False
+        uncovered[locs.coords_in_box(cleft_coords, box)] = False
 
     return bboxes
 
@@ -260,7 +405,13 @@ def random_loc(seg, i, offset=(0, 0, 0)):
 
 
 def random_locs(seg, segids, offset=(0, 0, 0)):
-    return {segid: random_loc(seg, segid, offset) for segid in segids}
+    """
+    Finds a random location for each segid within seg. Indexes the
+    volume once instead of scanning it for every id.
+    """
+    index = seg_utils.CoordIndex(seg, offset=offset)
+
+    return {segid: index.random_coord(segid) for segid in segids}
 
 
 def infer_patch_weights(net, img_p, psd_p, seg_p, segids=None):
@@ -270,7 +421,7 @@ def infer_patch_weights(net, img_p, psd_p, seg_p, segids=None):
 def get_patches(img, psd, seg, box, psdid):
     """ Return 5d patches specified by the bbox for use in torch """
 
-    img_p = img[box.index()] / 255.0
+    img_p = normalize_img(img[box.index()])
     psd_p = (psd[box.index()] == psdid).astype("float32")
     seg_p = seg[box.index()]
 
@@ -287,6 +438,52 @@ def get_patches(img, psd, seg, box, psdid):
     return img_p, psd_p, seg_p
 
 
+def format_img_chunk(img):
+    """
+    Transposes an image chunk once to fit the net's conventions, so that
+    each image patch is a zero-copy slice of a contiguous array (indexed
+    by reversed bbox slices). uint8 images keep their dtype, and others
+    are stored as float32. Normalization is left to normalize_img.
+    """
+    dtype = img.dtype if img.dtype == np.uint8 else np.float32
+
+    return np.ascontiguousarray(img.transpose((2, 1, 0)), dtype=dtype)
+
+
+def normalize_img(img_p, out=None):
+    """
+    Scales an image patch to [0,1] as float32 without intermediate
+    float64 copies. Writes into :param: out if passed.
+    """
+    return np.divide(img_p, 255, out=out, dtype=np.float32)
+
+
+def format_patch(patch):
+    """ Transposes to fit the net's conventions, and adds two dims for torch """
+    return patch.transpose((2, 1, 0))[np.newaxis, np.newaxis, :]
+
+
+def get_cleft_patch(cleft, box, cleft_id):
+    """ Return a 5d cleft mask patch specified by the bbox for use in torch """
+    clf_p = (cleft[box.index()] == cleft_id).astype("float32")
+
+    return clf_p.transpose((2, 1, 0))[np.newaxis, np.newaxis, :]
+
+
+def find_close_segments_batch(psd_ps, seg_p, dil_param):
+    """
+    Finds the segments close to each cleft mask within a batch
+    of masks over the same segmentation patch. The dilation runs on the
+    CPU, since this is called by the prefetching workers, and GPU work
+    there would compete with inference.
+    """
+    kernel = make_dilation_kernel(dil_param)
+    psd_masks = cpu_dilation(psd_ps, kernel)
+
+    return [seg_utils.nonzero_unique_ids(seg_p[0][psd_mask])
+            for psd_mask in psd_masks]
+
+
 def find_close_segments(psd_p, seg_p, dil_param):
 
     kernel = make_dilation_kernel(dil_param).astype("float32")
@@ -307,6 +504,14 @@ def torch_dilation(seg, kernel, dil_param):
     return output.data.cpu().numpy().astype("bool")
 
 
+def cpu_dilation(seg, kernel):
+    """ Dilates a 5d batch of masks as torch_dilation does, using scipy """
+    # the leading kernel dim keeps each batch element separate
+    structure = kernel[0].astype(bool)
+
+    return ndimage.binary_dilation(seg[:, 0] != 0, structure)[:, np.newaxis]
+
+
 def make_dilation_kernel(dil_param):
 
     kernel = ndimage.generate_binary_structure(2, 1)
@@ -342,6 +547,21 @@ def infer_patch(net, img_p, psd_p):
     return output
 
 
+def infer_net_input(net, net_input):
+    """
+    Runs an assignment network over a formatted (5d float32) batch
+
+    Returns 5d output
+    """
+    with torch.no_grad():
+        net_input = torch.from_numpy(net_input).cuda()
+
+        # network has only one output
+        output = torch.sigmoid(net(net_input)[0])
+
+    return output
+
+
 def seg_weights(output, seg, segids=None):
     """
     Finds the sum over the pre and post synaptic weights
@@ -376,6 +596,31 @@ def seg_weights(output, seg, segids=None):
     return weights, sizes
 
 
+def indexed_seg_weights(output, seg_index, segids):
+    """
+    Finds the sum over the pre and post synaptic weights contained
+    in each segment using a seg_utils.CoordIndex of the segmentation
+    patch (in the same axis order as the output)
+    """
+    presyn_output = output[0, ...].reshape(-1)
+    postsyn_output = output[1, ...].reshape(-1)
+
+    weights = {}
+    sizes = {}
+    for i in segids:
+        inds = torch.from_numpy(seg_index.linear_indices(i))
+        inds = inds.to(presyn_output.device)
+
+        sizes[i] = len(inds)
+
+        pre_wt = torch.sum(presyn_output[inds]).item()
+        post_wt = torch.sum(postsyn_output[inds]).item()
+
+        weights[i] = (pre_wt, post_wt)
+
+    return weights, sizes
+
+
 def dict_tuple_avg(d1, s1, d2, s2):
     """
     Averages the 2-tuple entry of each dict together weighted by size
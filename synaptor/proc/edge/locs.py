@@ -2,6 +2,7 @@
 
 
 import random
+import itertools
 
 import numpy as np
 
@@ -12,46 +13,40 @@ from ...types import bbox
 IMPLEMENTED = ["random", "centroid", "coverage", "vol_center"]
 
 
-def pick_cleft_locs(cleft, cleft_ids, loc_type, num_samples, patchsz):
+def pick_cleft_locs(cleft, cleft_ids, loc_type, num_samples, patchsz,
+                    index=None):
     """
     General function for picking inference locations
+
+    A seg_utils.CoordIndex of the cleft volume can be passed as
+    :param: index to share it with other steps (for the random
+    and coverage types).
     """
     assert loc_type in IMPLEMENTED, f"loc type {loc_type} not supported"
 
     if loc_type == "random":
-        return pick_random_locs(cleft, cleft_ids, num_samples)
+        return pick_random_locs(cleft, cleft_ids, num_samples, index=index)
 
     elif loc_type == "centroid":
         return pick_centroids(cleft, cleft_ids)
 
     elif loc_type == "coverage":
-        return covering_patches(cleft, cleft_ids, patchsz)
+        return covering_patches(cleft, cleft_ids, patchsz, index=index)
 
     elif loc_type == "vol_center":
         return vol_center(cleft, cleft_ids, patchsz)
 
 
-def pick_random_locs(cleft, cleft_ids, num_locs):
+def pick_random_locs(cleft, cleft_ids, num_locs, index=None):
     """
     Finds random locations within cleft for each id in cleft ids. Finds a
     number of locations equal to num_locs, and returns a dictionary mapping
     each id to its locations within a list.
     """
-    order = np.argsort(cleft.flat)
-
-    first = np.searchsorted(cleft.flat, cleft_ids, "left", order)
-    last = np.searchsorted(cleft.flat, cleft_ids, "right", order)
-    bounds = list(zip(first, last))
-
-    indices = {i: list() for i in cleft_ids}
-    for (i, cid) in enumerate(cleft_ids):
-        lo, hi = bounds[i]
-
-        for j in range(num_locs):
-            linear_index = order[random.randint(lo, hi-1)]
-            indices[cid].append(np.unravel_index(linear_index, cleft.shape))
+    if index is None:
+        index = seg_utils.CoordIndex(cleft)
 
-    return indices
+    return {cid: index.random_coords(cid, num_locs) for cid in cleft_ids}
 
 
 def pick_centroids(cleft, cleft_ids):
@@ -68,35 +63,43 @@ def pick_centroids(cleft, cleft_ids):
     return locs
 
 
-def covering_patches(cleft, cleft_ids, patchsz):
+def covering_patches(cleft, cleft_ids, patchsz, index=None):
     """
     Selects locations which (when turned into patches) will at least cover
     the entire cleft.
 
     Returns a dictionary mapping each id to a list of locations
     """
-    bboxes = seg_utils.bounding_boxes(cleft)
+    if index is None:
+        index = seg_utils.CoordIndex(cleft)
+
     locs = {i: list() for i in cleft_ids}
 
     for cid in cleft_ids:
-        bbox_cid = bboxes[cid]
-        cleft_msk = cleft[bbox_cid.index()] == cid
-        msk_offset = bbox_cid.min()
+        cid_coords = index.coords(cid)
+        uncovered = np.ones((len(cid_coords),), dtype=bool)
 
-        while cleft_msk.max():
-            cid_locs = list(zip(*np.nonzero(cleft_msk)))
+        while uncovered.any():
+            remaining = np.nonzero(uncovered)[0]
 
-            loc = random.choice(cid_locs) + msk_offset
+            loc = tuple(cid_coords[random.choice(remaining)])
             patch = bbox.containing_box(loc, patchsz, cleft.shape)
 
-            coverage = bbox_cid.intersect(patch).translate(-msk_offset)
-            cleft_msk[coverage.index()] = False
+            uncovered[coords_in_box(cid_coords, patch)] = False
 
             locs[cid].append(loc)
 
     return locs
 
 
+def coords_in_box(coords, box):
+    """ Returns a mask over (N x 3) coords marking those within box """
+    box_min = np.array(tuple(box.min()))
+    box_max = np.array(tuple(box.max()))
+
+    return np.all((coords >= box_min) & (coords < box_max), axis=1)
+
+
 def vol_center(cleft, cleft_ids, patchsz):
 
     assert all(c >= p for (c, p) in zip(cleft.shape, patchsz))
@@ -104,3 +107,69 @@ def vol_center(cleft, cleft_ids, patchsz):
     middle = tuple(bbox.Vec3d(cleft.shape) // 2)
 
     return {cid: [middle] for cid in cleft_ids}
+
+
+def group_cleft_locs(cleft_locs, patchsz, vol_shape,
+                     max_shift=0, max_group_size=8):
+    """
+    Plans shared patches for neighboring clefts.
+
+    Groups the sample locations of different clefts whose patches nearly
+    coincide, so that a single patch (and forward pass) can serve each of
+    them. A location joins a group if its patch corner lies within
+    :param: max_shift voxels of the group's patch corner along each axis.
+    Each group holds at most :param: max_group_size locations and at most
+    one location per cleft.
+
+    Returns a list of (patch bbox, [(cleft_id, loc index), ...]) tuples,
+    where loc index refers to the position of the location within
+    cleft_locs[cleft_id].
+    """
+    cell_width = max_shift + 1
+
+    groups = list()
+    group_cids = list()
+    grid = dict()  # grid cell -> indices of groups anchored within the cell
+
+    for (cid, cid_locs) in cleft_locs.items():
+        for (i, loc) in enumerate(cid_locs):
+            box = bbox.containing_box(loc, patchsz, vol_shape)
+            corner = tuple(box.min())
+            cell = tuple(c // cell_width for c in corner)
+
+            group_i = find_open_group(grid, groups, group_cids, cell, corner,
+                                      cid, max_shift, max_group_size)
+
+            if group_i is None:
+                group_i = len(groups)
+                groups.append((box, list()))
+                group_cids.append(set())
+                grid.setdefault(cell, []).append(group_i)
+
+            groups[group_i][1].append((cid, i))
+            group_cids[group_i].add(cid)
+
+    return groups
+
+
+def find_open_group(grid, groups, group_cids, cell, corner, cid,
+                    max_shift, max_group_size):
+    """
+    Finds a group within the neighboring grid cells which can accept
+    a new location. Returns None if no such group exists.
+    """
+    for step in itertools.product((-1, 0, 1), repeat=3):
+        neighbor = tuple(c + s for (c, s) in zip(cell, step))
+
+        for group_i in grid.get(neighbor, []):
+            group_box, members = groups[group_i]
+
+            if len(members) >= max_group_size or cid in group_cids[group_i]:
+                continue
+
+            group_corner = group_box.min()
+            if all(abs(group_corner[d] - corner[d]) <= max_shift
+                   for d in range(3)):
+                return group_i
+
+    return None
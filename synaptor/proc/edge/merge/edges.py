@@ -1,25 +1,124 @@
 """ Resolving edge assignments across chunks. """
 
+import numpy as np
 import pandas as pd
 
 from ... import colnames as cn
 
 
 def pick_largest_edges_arr(edge_dframe_arr):
+    """
+    Picks the largest edge for each cleft across chunk edge dataframes.
+    Accepts an array of dataframes or any iterable (e.g. a generator which
+    reads one chunk at a time).
+    """
+    if isinstance(edge_dframe_arr, np.ndarray):
+        edge_dframe_arr = edge_dframe_arr.flat
 
-    df = pd.concat(map(lambda x: x.reset_index(), edge_dframe_arr.flat),
-                   copy=False, sort=False, axis="index")
+    largest = LargestEdges()
+    for df in edge_dframe_arr:
+        largest.add(df)
 
-    return pick_largest_edges(df)
+    return largest.result()
 
 
 def pick_largest_edges(df, indexname=cn.seg_id):
-    df = df[df[cn.size] == df.groupby([indexname])[cn.size].transform(max)]
+    largest = LargestEdges(indexname=indexname)
+    largest.add(df)
 
-    # keeps the first row in the case of a tie (effectively random)
-    df = df.drop_duplicates(indexname)
+    return largest.result()
 
-    return df.set_index(indexname)
+
+class LargestEdges(object):
+    """
+    Streaming Largest Edge Selection
+
+    Keeps the largest edge (by size) for each cleft id over a stream of
+    edge dataframes. Ties go to the edge seen first. Rows are stored as
+    column arrays, and frames are buffered until they outnumber the current
+    selection before being sorted into it, so each row is only re-sorted a
+    logarithmic number of times.
+
+    add()    -- consume an edge dataframe
+    result() -- return the selected edges indexed by cleft id
+    """
+
+    def __init__(self, indexname=cn.seg_id):
+        self.indexname = indexname
+        self._columns = None
+        self._empty_columns = None
+        self._selected = None
+        self._pending = list()
+        self._num_pending = 0
+        self._num_seen = 0
+
+    def add(self, df):
+        if df.index.name == self.indexname:
+            df = df.reset_index()
+
+        # empty placeholder frames can lack columns (e.g. chunk_tag), so
+        # they only define the columns of an empty result
+        if len(df) == 0:
+            if self._empty_columns is None:
+                self._empty_columns = list(df.columns)
+            return
+
+        if self._columns is None:
+            self._columns = list(df.columns)
+
+        assert set(df.columns) == set(self._columns), "mismatched columns"
+
+        cols = {c: df[c].values for c in self._columns}
+        cols["arrival"] = np.arange(self._num_seen, self._num_seen + len(df))
+        self._pending.append(cols)
+        self._num_pending += len(df)
+        self._num_seen += len(df)
+
+        if self._num_pending > self._num_selected():
+            self._compact()
+
+    def _num_selected(self):
+        if self._selected is None:
+            return 0
+
+        return len(self._selected["arrival"])
+
+    def _compact(self):
+        if len(self._pending) == 0:
+            return
+
+        blocks = self._pending
+        if self._selected is not None:
+            blocks = [self._selected] + blocks
+
+        cols = {c: np.concatenate([b[c] for b in blocks]) for c in blocks[0]}
+
+        ids = cols[self.indexname]
+        sizes = cols[cn.size].astype(np.float64)
+        order = np.lexsort((cols["arrival"], -sizes, ids))
+
+        sorted_ids = ids[order]
+        firsts = order[np.concatenate(([True],
+                                       sorted_ids[1:] != sorted_ids[:-1]))]
+
+        self._selected = {c: v[firsts] for (c, v) in cols.items()}
+        self._pending = list()
+        self._num_pending = 0
+
+    def result(self):
+        self._compact()
+
+        if self._selected is None:
+            columns = self._empty_columns
+            if columns is None:
+                columns = [self.indexname]
+
+            return pd.DataFrame(columns=columns).set_index(self.indexname)
+
+        df = pd.DataFrame({c: self._selected[c] for c in self._columns},
+                          columns=self._columns)
+
+        return df.set_index(self.indexname)
 
 
 def merge_to_cleft_df(edge_df, cleft_df):
@@ -3,54 +3,96 @@ Merging Duplicates - defined as two clefts which connect the same
 partners within some distance threshold
 """
 
-import math
-import operator
-
 import numpy as np
-import scipy.spatial
+from scipy import sparse
+from scipy import spatial
+from scipy.sparse import csgraph
 
 from ... import utils
 from ... import colnames as cn
 
 
 def merge_duplicate_clefts(full_info_df, dist_thr, res):
-
+    """
+    Finds the clefts which connect the same partners with centroids within
+    a threshold distance of one another. Returns a mapping from each
+    duplicate cleft id to the minimum id of its connected component.
+    """
     full_info_df = full_info_df.reset_index()
-    conn_comps = []
-
-    def find_new_comps(group):
-        if len(group) > 1:
-            ids = group.cleft_segid.values
-            coords = group[cn.centroid_cols].values
 
-            pairs = find_pairs_within_dist(ids, coords, dist_thr, res)
+    partners = full_info_df[[cn.presyn_id, cn.postsyn_id]]
+    assigned = partners.notnull().all(axis=1).values
 
-            conn_comps.extend(utils.find_connected_components(pairs))
-        return 0
+    ids = full_info_df[cn.seg_id].values[assigned]
+    coords = full_info_df[cn.centroid_cols].values[assigned] * res
+    _, groups = np.unique(partners.values[assigned], axis=0,
+                          return_inverse=True)
 
-    full_info_df.groupby([cn.presyn_id, cn.postsyn_id]).apply(find_new_comps)
+    pairs = find_close_pairs(coords, dist_thr, groups=groups.reshape(-1))
 
-    return utils.make_id_map(conn_comps)
+    return id_map_from_pairs(ids, pairs)
 
 
 def find_pairs_within_dist(ids, coords, dist_thr, res):
 
     coord_array = np.vstack(coords) * res
 
-    dists = scipy.spatial.distance.pdist(coord_array)
-    under_thr = np.nonzero(dists < dist_thr)[0]
+    pairs = find_close_pairs(coord_array, dist_thr)
+
+    return list((ids[i], ids[j]) for (i, j) in pairs)
+
+
+def find_close_pairs(coords, dist_thr, groups=None):
+    """
+    Returns the (i, j) index pairs (i < j, sorted) of coordinates strictly
+    within a threshold distance of one another. If groups are given, only
+    pairs within the same group are returned.
+    """
+    if len(coords) < 2:
+        return np.zeros((0, 2), dtype=np.intp)
+
+    coords = np.asarray(coords, dtype=np.float64)
+
+    if groups is not None:
+        # spacing the groups apart along an extra axis keeps a single
+        # tree query from pairing clefts across groups
+        spacing = 2 * dist_thr + 1
+        offsets = np.asarray(groups, dtype=np.float64) * spacing
+        tree = spatial.cKDTree(np.column_stack((coords, offsets)))
+    else:
+        tree = spatial.cKDTree(coords)
+
+    pairs = tree.query_pairs(dist_thr, output_type="ndarray")
+    pairs = pairs.reshape((-1, 2))
+
+    # query_pairs includes the threshold distance itself
+    dists = np.sqrt(((coords[pairs[:, 0]] - coords[pairs[:, 1]])**2).sum(1))
+    pairs = pairs[dists < dist_thr]
+
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def id_map_from_pairs(ids, pairs):
+    """
+    Maps each id within a pair to the minimum id of its connected component
+    """
+    if len(pairs) == 0:
+        return dict()
 
-    pairs = [row_col_from_condensed_index(len(ids), i) for i in under_thr]
+    n = len(ids)
+    graph = sparse.coo_matrix((np.ones(len(pairs), dtype=np.uint8),
+                               (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, comps = csgraph.connected_components(graph, directed=False)
 
-    return list(map(lambda tup: (ids[tup[0]], ids[tup[1]]), pairs))
+    # the first id of each component in id order is its minimum
+    order = np.argsort(ids, kind="stable")
+    comp_ids, first = np.unique(comps[order], return_index=True)
+    comp_min = np.empty(comp_ids.size, dtype=ids.dtype)
+    comp_min[comp_ids] = ids[order[first]]
 
+    paired = np.unique(pairs)
 
-def row_col_from_condensed_index(d, i):
-    # https://stackoverflow.com/questions/5323818/condensed-matrix-function-to-find-pairs  # noqa
-    b = 1 - 2 * d
-    x = math.floor((-b - math.sqrt(b**2 - 8*i))/2)
-    y = i + x*(b + x + 2)/2 + 1
-    return (x, int(y))
+    return dict(zip(ids[paired], comp_min[comps[paired]]))
 
 
 def merge_polyad_dups(edge_list, centroids, dist_thr, res):
@@ -1,22 +1,16 @@
 """ Miscellaneous Functionality """
 
 
-def update_id_map(id_map, next_map, reused_ids=False):
-
-    # need to keep track of which keys are accounted
-    # for within the current id_map
-    new_keys = set(next_map.keys())
-
-    for (k, v) in id_map.items():
-        id_map[k] = next_map.get(v, v)
-        new_keys.discard(v)
+from ....types import IdMap
 
-    # make a new mapping for each new key
-    if not reused_ids:
-        for k in new_keys:
-            id_map[k] = next_map[k]
 
-    return id_map
+def update_id_map(id_map, next_map, reused_ids=False):
+    """
+    Composes two id maps (id_map followed by next_map) as an IdMap. Keys of
+    next_map which aren't values of id_map are included unless reused_ids.
+    """
+    return IdMap.from_dict(id_map).compose(next_map,
+                                           include_new=not reused_ids)
 
 
 def expand_id_map(id_map, all_ids):
@@ -1,5 +1,7 @@
 """ HCBS Pruning Network Inference """
 
+import itertools
+
 import torch
 
 import numpy as np
@@ -11,7 +13,7 @@ from . import locs
 
 def prune_candidates(net, img, seg, patchsz, candidates, cleft=None,
                      output_thresh=0, cleft_locs=None, prox=None,
-                     cleft_ids=None, loc_type="centroid"):
+                     cleft_ids=None, loc_type="centroid", batch_size=16):
     """
     Apply pruner network to candidate list w/ threshold.
 
@@ -40,6 +42,8 @@ def prune_candidates(net, img, seg, patchsz, candidates, cleft=None,
             loc_type is not manual. Defaults to None.
         loc_type (str): A string specifying how to determine sample locations.
             See locs.py. Defaults to "centroid".
+        batch_size (int): The number of candidates to evaluate within each
+            forward pass. Defaults to 16.
 
     Returns:
         list: A subset of candidates whose output was greater than threshold.
@@ -56,18 +60,14 @@ def prune_candidates(net, img, seg, patchsz, candidates, cleft=None,
     else:
         assert cleft_locs is not None, "manual loc mode w/o cleft_locs"
 
+    all_outputs = predict_candidates(net, img, seg, patchsz, candidates,
+                                     cleft_locs, cleft=cleft, prox=prox,
+                                     batch_size=batch_size)
+
     pruned = list()
     outputs = list()
-    for (cid, presyn_id, postsyn_id) in candidates:
-        loc = cleft_locs[cid][0]
-        box = bbox.containing_box(loc, patchsz, img.shape)
-
-        img_p, syn_p, seg_p = get_patches(img, cleft, seg,
-                                          box, cid, prox=prox)
-
-        output = predict_candidate(net, img_p, syn_p, seg_p,
-                                   presyn_id, postsyn_id)
-
+    for ((cid, presyn_id, postsyn_id), output) in zip(candidates,
+                                                      all_outputs):
         if output > output_thresh:
             pruned.append((cid, presyn_id, postsyn_id))
             outputs.append(output)
@@ -77,7 +77,7 @@ def prune_candidates(net, img, seg, patchsz, candidates, cleft=None,
 
 def max_candidates(net, img, seg, patchsz, candidates, cleft=None,
                    cleft_locs=None, prox=None, cleft_ids=None,
-                   loc_type="centroid"):
+                   loc_type="centroid", batch_size=16):
     """
     Apply pruner network to candidate list, select maxima.
 
@@ -104,6 +104,8 @@ def max_candidates(net, img, seg, patchsz, candidates, cleft=None,
             loc_type is not manual. Defaults to None.
         loc_type (str): A string specifying how to determine sample locations.
             See locs.py. Defaults to "centroid".
+        batch_size (int): The number of candidates to evaluate within each
+            forward pass. Defaults to 16.
 
     Returns:
         list: A subset of candidates whose output was maximal for each pair_id.
@@ -120,18 +122,14 @@ def max_candidates(net, img, seg, patchsz, candidates, cleft=None,
     else:
         assert cleft_locs is not None, "manual loc type w/o cleft_locs"
 
+    all_outputs = predict_candidates(net, img, seg, patchsz, candidates,
+                                     cleft_locs, cleft=cleft, prox=prox,
+                                     batch_size=batch_size)
+
     pruned = dict()
     max_outputs = dict()
-    for (cid, presyn_id, postsyn_id) in candidates:
-        loc = cleft_locs[cid][0]
-        box = bbox.containing_box(loc, patchsz, img.shape)
-
-        img_p, syn_p, seg_p = get_patches(img, cleft, seg,
-                                          box, cid, prox=prox)
-
-        output = predict_candidate(net, img_p, syn_p, seg_p,
-                                   presyn_id, postsyn_id)
-
+    for ((cid, presyn_id, postsyn_id), output) in zip(candidates,
+                                                      all_outputs):
         if cid in pruned:
             if output > max_outputs[cid]:
                 pruned[cid] = (cid, presyn_id, postsyn_id)
@@ -144,6 +142,66 @@ def max_candidates(net, img, seg, patchsz, candidates, cleft=None,
     return pruned
 
 
+def predict_candidates(net, img, seg, patchsz, candidates, cleft_locs,
+                       cleft=None, prox=None, batch_size=16):
+    """
+    Runs a pruner network over a list of candidates in batches
+
+    Candidates which share a pair id share a single extracted patch, and
+    each segment mask is only computed once per patch.
+
+    Returns a list of outputs (floats) matching the candidate order
+    """
+    inputs = candidate_inputs(img, seg, patchsz, candidates, cleft_locs,
+                              cleft=cleft, prox=prox)
+
+    outputs = [None] * len(candidates)
+    while True:
+        batch = list(itertools.islice(inputs, batch_size))
+        if len(batch) == 0:
+            break
+
+        inds, net_inputs = zip(*batch)
+        batch_outputs = predict_batch(net, np.concatenate(net_inputs, axis=0))
+
+        for (i, output) in zip(inds, batch_outputs):
+            outputs[i] = output
+
+    return outputs
+
+
+def candidate_inputs(img, seg, patchsz, candidates, cleft_locs,
+                     cleft=None, prox=None):
+    """
+    Generates the network input for each candidate, grouping the candidates
+    by pair id so that each patch is extracted once
+
+    Yields (candidate index, 5d net input) pairs
+    """
+    by_cleft = dict()
+    for (i, (cid, _, _)) in enumerate(candidates):
+        by_cleft.setdefault(cid, []).append(i)
+
+    for (cid, inds) in by_cleft.items():
+        loc = cleft_locs[cid][0]
+        box = bbox.containing_box(loc, patchsz, img.shape)
+
+        img_p, syn_p, seg_p = get_patches(img, cleft, seg,
+                                          box, cid, prox=prox)
+        img_syn_p = np.concatenate((img_p, syn_p), axis=1).astype("float32")
+
+        masks = dict()
+        for i in inds:
+            _, presyn_id, postsyn_id = candidates[i]
+
+            for segid in (presyn_id, postsyn_id):
+                if segid not in masks:
+                    masks[segid] = (seg_p == segid).astype("float32")
+
+            yield i, np.concatenate((img_syn_p, masks[presyn_id],
+                                     masks[postsyn_id]), axis=1)
+
+
 def get_patches(img, clf, seg, box, clfid, prox=None):
     """ Return 5d patches specified by the bbox for use in torch """
 
@@ -168,20 +226,19 @@ def format_patch(patch):
     return patch.transpose((2, 1, 0))[np.newaxis, np.newaxis, :]
 
 
-def predict_candidate(net, img_p, syn_p, seg_p, presyn_id, postsyn_id):
+def predict_batch(net, net_input):
     """
-    Runs an pruner network over a single patch
+    Runs a pruner network over a batch of formatted (5d) inputs
 
-    Returns a float
+    Returns a list of floats (one per batch element)
     """
     with torch.no_grad():
-        # formatting
-        presyn_p = (seg_p == presyn_id).astype("float32")
-        postsyn_p = (seg_p == postsyn_id).astype("float32")
-        net_input = np.concatenate((img_p, syn_p, presyn_p, postsyn_p),
-                                   axis=1).astype("float32")
-        net_input = torch.from_numpy(net_input.copy()).cuda()
-
-        # network has only one output
-        # and batch size = 1
-        return net(net_input)[0].item()
+        net_input = torch.from_numpy(net_input).cuda()
+
+        output = net(net_input)
+
+        # some networks return a list of outputs, where the first is ours
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+
+        return output.reshape((net_input.shape[0], -1))[:, 0].tolist()
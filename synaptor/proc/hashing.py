@@ -2,23 +2,40 @@
 Some utilities for hashing groups of values for distributed processing.
 """
 
+import json
+import heapq
 import random
 import struct
 import hashlib
-import collections
+import functools
+import collections.abc
 
+import numpy as np
 import pandas as pd
 
 
 HASHED_INDEX_NAME = "hashed_index"
 PRIME = 4839472903831
 
+# uint64 constants for the vectorized hashes
+_PRIME = np.uint64(PRIME)
+_BYTE = np.uint64(256)
+_COMMA = np.uint64(ord(","))
+
+
+@functools.lru_cache()
+def hash_coefs(seed=54321):
+    """ The (a, b) coefficients of the universal hash for a seed. """
+    rng = random.Random(seed)
+    a = rng.randint(1, PRIME-1)
+    b = rng.randint(0, PRIME-1)
+
+    return a, b
+
 
 def basehash(v, seed=54321, verbose=False):
     """ Hash an object, return a hash object. """
-    random.seed(seed)
-    a = random.randint(1, PRIME-1)
-    b = random.randint(0, PRIME-1)
+    a, b = hash_coefs(seed)
     ret = (a*v + b) % PRIME
 
     if verbose:
@@ -28,7 +45,7 @@ def basehash(v, seed=54321, verbose=False):
 
 
 def pack_many(v, verbose=False):
-    if isinstance(v, collections.Iterable):
+    if isinstance(v, collections.abc.Iterable):
         if verbose:
             print(",".join(map(str, v)))
         return int.from_bytes(",".join(map(str, v)).encode(),
@@ -52,17 +69,26 @@ def hashtuple(t, maxval):
     Hash a tuple of values to an index below maxval using
     a combination of the element hash values.
     """
-    elem_hashes = tuple(map(basehash, t))
-    full_digest = "".join(map(h.hexdigest() for h in elem_hashes))
+    elem_hashes = tuple(basehash(pack_many(v)) for v in t)
 
-    return hashval(full_digest, maxval)
+    return hashval(elem_hashes, maxval)
 
 
-def hashcolumns(dframe, columns, maxval):
-    """ Hash each value of multiple dataframe columns. """
-    columnvals = list(zip(*(dframe[col] for col in columns)))
+def hashcolumns(dframe, columns, maxval, compat=True, seed=54321):
+    """
+    Hash each value of multiple dataframe columns.
 
-    return list(hashval(v, maxval) for v in columnvals)
+    The compat mode reproduces hashval over each row tuple (and so the
+    buckets of earlier runs), but computes the packed string values
+    arithmetically. Otherwise, the columns are hashed directly as
+    integers, which is faster but assigns different buckets.
+    """
+    if compat:
+        hashes = _packed_hashes(dframe, columns, seed)
+    else:
+        hashes = _integer_hashes(dframe, columns, seed)
+
+    return (hashes % np.uint64(maxval)).astype(np.int64)
 
 
 def hashcolumns2(dframe, columns, maxval):
@@ -75,8 +101,9 @@ def hashcolumns2(dframe, columns, maxval):
 
 
 def add_hashed_index(dframe, columns, maxval,
-                     indexname=HASHED_INDEX_NAME, null_fillval=None):
-    dframe[indexname] = hashcolumns(dframe, columns, maxval)
+                     indexname=HASHED_INDEX_NAME, null_fillval=None,
+                     compat=True):
+    dframe[indexname] = hashcolumns(dframe, columns, maxval, compat=compat)
     if null_fillval is not None:
         dframe = fill_nulls(dframe, columns, null_fillval,
                             indexname=indexname)
@@ -89,3 +116,225 @@ def fill_nulls(dframe, columns, fillval, indexname=HASHED_INDEX_NAME):
         dframe.loc[pd.isnull(dframe[col]), indexname] = fillval
 
     return dframe
+
+
+def changed_buckets(old, new, key, hashcol):
+    """
+    Finds the hash buckets whose rows differ between two versions of a
+    hashed table (e.g. an id map with hashed dst ids). A row has changed
+    if any of its values differ or it only exists in one version, and
+    both its old and new buckets are returned.
+    """
+    valcols = [col for col in old.columns if col != key]
+
+    merged = old.merge(new[[key, *valcols]], on=key, how="outer",
+                       suffixes=("_old", "_new"), indicator=True)
+
+    changed = merged["_merge"] != "both"
+    for col in valcols:
+        changed |= merged[f"{col}_old"] != merged[f"{col}_new"]
+
+    hashes = pd.concat([merged.loc[changed, f"{hashcol}_old"],
+                        merged.loc[changed, f"{hashcol}_new"]])
+
+    return set(int(h) for h in hashes.dropna())
+
+
+def plan_buckets(bucket_sizes, num_tasks, hashmax=None):
+    """
+    Assigns hash buckets to at most num_tasks reduce tasks, balancing the
+    total size of each task by greedy (largest first) bin packing.
+
+    :param: bucket_sizes maps each bucket to its load (e.g. a Series of
+    row counts). Buckets below hashmax without a size are treated as
+    empty, so each still belongs to some task.
+
+    Returns a list of sorted bucket lists, one per nonempty task. A single
+    bucket can't be split across tasks since every row of a key needs to
+    reach the same task, so oversized buckets are placed alone.
+    """
+    sizes = dict(bucket_sizes.items())
+    if hashmax is not None:
+        sizes = {b: sizes.get(b, 0) for b in range(hashmax)}
+
+    num_tasks = max(min(num_tasks, len(sizes)), 1)
+    tasks = [(0, i, []) for i in range(num_tasks)]
+
+    by_size = sorted(sizes.items(), key=lambda kv: (-kv[1], kv[0]))
+    for (bucket, size) in by_size:
+        load, i, buckets = heapq.heappop(tasks)
+        buckets.append(int(bucket))
+        heapq.heappush(tasks, (load + size, i, buckets))
+
+    return sorted(sorted(buckets) for (_, _, buckets) in tasks
+                  if len(buckets) > 0)
+
+
+def fingerprint(*arrays, **params):
+    """
+    Computes a hex digest identifying a set of arrays (by contents, shape
+    and dtype) and keyword parameters. Parameters are compared by their
+    JSON form, so tuples and lists (or arrays) of the same values match.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    digest.update(json.dumps(params, sort_keys=True,
+                             default=_jsonable).encode())
+
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        digest.update(f"{arr.dtype.str}{arr.shape}".encode())
+        digest.update(arr.view(np.uint8).ravel())
+
+    return digest.hexdigest()
+
+
+def _jsonable(v):
+    """ Converts numpy values for json.dumps. """
+    if isinstance(v, (np.ndarray, np.generic)):
+        return v.tolist()
+
+    return str(v)
+
+
+def _packed_hashes(dframe, columns, seed):
+    """
+    Computes basehash(pack_many(row)) for each row of the columns.
+
+    pack_many reads the bytes of ",".join(map(str, row)) as a little-endian
+    int, so each column's string codes are combined below modulo PRIME
+    (which is all that basehash needs) instead of building the ints.
+    """
+    a, b = map(np.uint64, hash_coefs(seed))
+
+    codes, lens = _str_codes(dframe[columns[0]].values)
+    for col in columns[1:]:
+        col_codes, col_lens = _str_codes(dframe[col].values)
+        col_codes = (_COMMA + col_codes * _BYTE) % _PRIME
+
+        codes = (codes + _mulmod(_pow256(lens), col_codes)) % _PRIME
+        lens = lens + col_lens + 1
+
+    return (_mulmod(a, codes) + b) % _PRIME
+
+
+def _integer_hashes(dframe, columns, seed):
+    """ Folds the integer values of each column into a universal hash. """
+    a, b = map(np.uint64, hash_coefs(seed))
+
+    hashes = np.full(len(dframe), b, dtype=np.uint64)
+    for col in columns:
+        vals = dframe[col].values
+        assert np.issubdtype(vals.dtype, np.number), "non-numeric column"
+
+        # nulls are overwritten by fill_nulls when needed
+        if np.issubdtype(vals.dtype, np.floating):
+            vals = np.nan_to_num(vals)
+        vals = (vals.astype(np.int64) % PRIME).astype(np.uint64)
+
+        hashes = (_mulmod(a, hashes) + vals) % _PRIME
+
+    return hashes
+
+
+def _mulmod(x, y):
+    """ x * y % PRIME for uint64 values below PRIME. """
+    # PRIME < 2**43, so splitting y at 21 bits keeps each product < 2**64
+    lo = y & np.uint64(0x1FFFFF)
+    hi = y >> np.uint64(21)
+
+    hi_part = (x * hi) % _PRIME
+    hi_part = (hi_part << np.uint64(21)) % _PRIME
+
+    return (hi_part + (x * lo) % _PRIME) % _PRIME
+
+
+def _pow256(exps):
+    """ 256 ** exps % PRIME for an array of nonnegative exponents. """
+    table = [1]
+    for _ in range(exps.max(initial=0)):
+        table.append(table[-1] * 256 % PRIME)
+
+    return np.array(table, dtype=np.uint64)[exps]
+
+
+def _str_codes(values):
+    """
+    Returns the little-endian int value (mod PRIME) of the bytes of
+    str(v) for each value, along with each string's length.
+    """
+    # pandas extension dtypes (e.g. nullable Int64) are hashed by str(v)
+    if not isinstance(values.dtype, np.dtype):
+        values = np.asarray(values, dtype=object)
+
+    if np.issubdtype(values.dtype, np.integer):
+        return _int_str_codes(values)
+
+    codes = np.zeros(values.shape, dtype=np.uint64)
+    lens = np.zeros(values.shape, dtype=np.int64)
+
+    if np.issubdtype(values.dtype, np.floating):
+        # str(v) is str(int(v)) + ".0" for integral floats
+        # printed without an exponent
+        # (-0.0 prints with its sign, so it isn't simple)
+        simple = (np.isfinite(values) & (np.abs(values) < 1e16)
+                  & ~((values == 0) & np.signbit(values)))
+        simple[simple] = values[simple] == np.round(values[simple])
+        int_codes, int_lens = _int_str_codes(values[simple].astype(np.int64))
+
+        suffix = np.uint64(ord(".") + 256 * ord("0"))
+        codes[simple] = (int_codes +
+                         _mulmod(_pow256(int_lens), suffix)) % _PRIME
+        lens[simple] = int_lens + 2
+
+    else:
+        simple = np.zeros(values.shape, dtype=bool)
+
+    others = [str(v).encode() for v in values[~simple].tolist()]
+    codes[~simple], lens[~simple] = _bytes_codes(others)
+
+    return codes, lens
+
+
+def _int_str_codes(values):
+    """ _str_codes for an integer array, computed from its digits. """
+    neg = values < 0
+    if np.issubdtype(values.dtype, np.unsignedinteger):
+        mags = values.astype(np.uint64)
+    else:
+        mags = np.abs(values.astype(np.int64)).astype(np.uint64)
+
+    ndigits = np.ones(values.shape, dtype=np.int64)
+    rest = mags // np.uint64(10)
+    while np.any(rest > 0):
+        ndigits += rest > 0
+        rest //= np.uint64(10)
+
+    # the most significant digit is the lowest byte, so the digits
+    # are accumulated from least to most significant
+    codes = np.zeros(values.shape, dtype=np.uint64)
+    rest = mags.copy()
+    for i in range(ndigits.max(initial=0)):
+        chars = rest % np.uint64(10) + np.uint64(ord("0"))
+        codes = np.where(i < ndigits, (codes * _BYTE + chars) % _PRIME, codes)
+        rest //= np.uint64(10)
+
+    codes[neg] = (np.uint64(ord("-")) + codes[neg] * _BYTE) % _PRIME
+
+    return codes, ndigits + neg
+
+
+def _bytes_codes(strings):
+    """ _str_codes for a list of byte strings. """
+    lens = np.array([len(s) for s in strings], dtype=np.int64)
+    codes = np.zeros(len(strings), dtype=np.uint64)
+    if lens.max(initial=0) == 0:
+        return codes, lens
+
+    # trailing null padding doesn't change a little-endian value
+    padded = np.array(strings, dtype=f"S{lens.max()}")
+    byte_arr = padded.view(np.uint8).reshape((len(strings), -1))
+    for i in reversed(range(byte_arr.shape[1])):
+        codes = (codes * _BYTE + byte_arr[:, i]) % _PRIME
+
+    return codes, lens
@@ -1,16 +1,21 @@
 from . import seginfo
 from .seginfo import read_chunk_seg_info, write_chunk_seg_info
 from .seginfo import read_all_chunk_seg_infos, read_all_unique_seg_ids
+from .seginfo import read_new_chunk_seg_infos
 from .seginfo import read_merged_seg_info, write_merged_seg_info
+from .seginfo import read_unthresholded_seg_info
+from .seginfo import write_unthresholded_seg_info
 from .seginfo import read_mapped_seginfo_by_dst_hash
-from .seginfo import prep_chunk_seg_info
+from .seginfo import mark_partner_buckets
+from .seginfo import prep_chunk_seg_info, outdated_chunk_seg_info
 from .seginfo import dedup_chunk_segs
 
 from . import continuation
 from .continuation import read_chunk_continuations, write_chunk_continuations
 from .continuation import read_all_continuations, read_face_filenames
+from .continuation import face_filename
 from .continuation import continuations_by_hash, prep_face_hashes
-from .continuation import write_face_hashes
+from .continuation import write_face_hashes, outdated_face_hashes
 from .continuation import read_continuation_graph, write_contin_graph_edges
 
 from . import network
@@ -19,7 +24,7 @@ from .network import read_network_from_proc, write_network_to_proc
 from . import edgeinfo
 from .edgeinfo import read_chunk_edge_info, write_chunk_edge_info
 from .edgeinfo import read_hashed_edge_info, read_max_n_edge_per_cleft
-from .edgeinfo import read_all_chunk_edge_infos
+from .edgeinfo import read_all_chunk_edge_infos, iter_chunk_edge_infos
 from .edgeinfo import read_merged_edge_info, write_merged_edge_info
 
 from . import fullinfo
@@ -27,16 +32,28 @@ from .fullinfo import read_full_info, write_full_info
 
 from . import idmap
 from .idmap import read_chunk_id_map, write_chunk_id_map
-from .idmap import write_chunk_id_maps
+from .idmap import write_chunk_id_maps, read_all_chunk_id_maps
 from .idmap import read_dup_id_map, write_dup_id_map
 from .idmap import read_chunk_unique_ids, read_all_chunk_unique_ids
-from .idmap import write_seg_merge_map, write_chunked_seg_map
+from .idmap import read_seg_merge_map, write_seg_merge_map
+from .idmap import write_chunked_seg_map
 
 from . import overlap
 from .overlap import read_chunk_overlap_mat, write_chunk_overlap_mat
-from .overlap import read_all_overlap_mats
+from .overlap import read_all_overlap_mats, read_hashed_overlap_mat
+from .overlap import read_overlap_mat_for_rows
+from .overlap import read_overlap_topk, write_chunk_overlap_topk
 from .overlap import read_max_overlaps, write_max_overlaps
 
+from . import buckets
+from .buckets import read_bucket_sizes
+from .buckets import read_dirty_buckets, prep_dirty_buckets
+from .buckets import write_dirty_buckets, clear_dirty_bucket
+
+from . import manifest
+from .manifest import read_task_manifest, read_task_manifests
+from .manifest import write_task_manifest
+
 from . import timing
 from .timing import read_task_timing, write_task_timing
 from .timing import read_all_task_timing
@@ -0,0 +1,110 @@
+""" Hash bucket cardinality IO for planning reduce tasks """
+
+
+from sqlalchemy import select, func, literal
+import pandas as pd
+
+from ... import io
+from .. import colnames as cn
+
+
+# the table, hash column and load column (None counts rows) read by each
+# hashed reduce stage. A continuations row is a whole face file, so its load
+# is the number of continuation voxels on that face.
+BUCKET_SOURCES = {"match_contins": ("continuations", cn.facehash,
+                                    cn.contin_size),
+                  "merge_seginfo": ("seg_merge_map", cn.dst_id_hash, None),
+                  "pick_edge": ("chunk_edges", cn.clefthash, None),
+                  "merge_dups": ("merged_edges", cn.partnerhash, None)}
+DIRTY_TABLENAME = "dirty_buckets"
+
+
+def read_bucket_sizes(proc_url, stage):
+    """
+    Reads the load of each hash bucket of the table that a reduce stage
+    reads. Returns a Series of loads indexed by bucket.
+    """
+    assert io.is_db_url(proc_url), "bucket sizes not implemented for files"
+    assert stage in BUCKET_SOURCES, f"unknown hashed stage {stage}"
+
+    tablename, hashcol, loadcol = BUCKET_SOURCES[stage]
+
+    metadata = io.open_db_metadata(proc_url)
+    table = metadata.tables[tablename]
+
+    bucket = table.c[hashcol]
+    if loadcol is None:
+        load = func.count()
+    else:
+        load = func.coalesce(func.sum(table.c[loadcol]), 0)
+
+    statement = select([bucket, load.label("count")]).group_by(bucket)
+
+    return io.read_db_dframe(proc_url, statement, index_col=hashcol)["count"]
+
+
+def read_dirty_buckets(proc_url, stage):
+    """
+    Reads the buckets of a reduce stage whose inputs changed since the
+    stage's task for that bucket last ran.
+    """
+    assert io.is_db_url(proc_url), "dirty buckets not implemented for files"
+
+    metadata = io.open_db_metadata(proc_url)
+    dirty = metadata.tables[DIRTY_TABLENAME]
+
+    statement = select([dirty.c[cn.bucket]]).distinct().where(
+                    dirty.c[cn.stage] == stage)
+
+    dframe = io.read_db_dframe(proc_url, statement)
+
+    return sorted(int(b) for b in dframe[cn.bucket])
+
+
+def prep_dirty_buckets(stage, buckets):
+    """ Packaging a set of buckets to mark as dirty for a reduce stage """
+    buckets = sorted(set(int(b) for b in buckets))
+
+    to_write = pd.DataFrame({cn.stage: [stage] * len(buckets),
+                             cn.bucket: buckets})
+
+    return to_write, DIRTY_TABLENAME
+
+
+def write_dirty_buckets(proc_url, stage, buckets):
+    """ Marks a set of buckets as dirty for a reduce stage """
+    df, tablename = prep_dirty_buckets(stage, buckets)
+
+    io.write_db_dframe(df, proc_url, tablename)
+
+
+def dirty_buckets_from_select(metadata, stage, hash_column, *whereclauses,
+                              select_from=None):
+    """
+    Makes a statement that marks the distinct values of a hash column
+    (within the rows selected by the where clauses) as dirty buckets for
+    a reduce stage. Executing this before deleting or overwriting those
+    rows marks the buckets that they fed.
+    """
+    dirty = metadata.tables[DIRTY_TABLENAME]
+
+    statement = select([literal(stage), hash_column]).distinct()
+    if select_from is not None:
+        statement = statement.select_from(select_from)
+    for clause in whereclauses:
+        statement = statement.where(clause)
+
+    return dirty.insert().from_select([cn.stage, cn.bucket], statement)
+
+
+def clear_dirty_bucket(proc_url, stage, bucket):
+    """ Unmarks a bucket once the reduce stage has rewritten its outputs """
+    assert io.is_db_url(proc_url), "dirty buckets not implemented for files"
+
+    metadata = io.open_db_metadata(proc_url)
+    dirty = metadata.tables[DIRTY_TABLENAME]
+
+    statement = dirty.delete().where(dirty.c[cn.stage] == stage).where(
+                    dirty.c[cn.bucket] == int(bucket))
+
+    io.execute_db_statement(proc_url, statement)
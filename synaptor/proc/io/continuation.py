@@ -192,10 +192,12 @@ def write_chunk_continuations(continuations, proc_url, chunk_bounds):
     io.send_files(local_fnames, os.path.join(proc_url, fn.contin_dirname))
 
 
-def write_face_hashes(face_hashes, proc_url, chunk_bounds, proc_dir=None):
+def write_face_hashes(face_hashes, proc_url, chunk_bounds, proc_dir=None,
+                      face_sizes=None):
     proc_dir = proc_url if proc_dir is None else proc_dir
 
-    df, tablename = prep_face_hashes(face_hashes, chunk_bounds, proc_dir)
+    df, tablename = prep_face_hashes(face_hashes, chunk_bounds, proc_dir,
+                                     face_sizes=face_sizes)
 
     if io.is_db_url(proc_url):
         io.write_db_dframe(df, proc_url, tablename)
@@ -204,8 +206,11 @@ def write_face_hashes(face_hashes, proc_url, chunk_bounds, proc_dir=None):
         raise(Exception("file IO for face hashes not implemented yet"))
 
 
-def prep_face_hashes(face_hashes, chunk_bounds, proc_dir):
-    """ Packaging face hashes to send as a dataframe"""
+def prep_face_hashes(face_hashes, chunk_bounds, proc_dir, face_sizes=None):
+    """
+    Packaging face hashes to send as a dataframe. face_sizes records the
+    number of continuation voxels on each face (the load of matching it).
+    """
     items = list(face_hashes.items())
     faces, hashes = zip(*items)
     filenames = [face_filename(proc_dir, chunk_bounds, face) for face in faces]
@@ -213,9 +218,24 @@ def prep_face_hashes(face_hashes, chunk_bounds, proc_dir):
     to_write = pd.DataFrame({cn.contin_filename: filenames,
                              cn.facehash: hashes})
 
+    if face_sizes is not None:
+        to_write[cn.contin_size] = [face_sizes.get(face, 0) for face in faces]
+
     return to_write, TABLENAME
 
 
+def outdated_face_hashes(proc_url, filenames):
+    """
+    Makes a statement that deletes the face hash rows written by an
+    earlier run for a set of continuation files.
+    """
+    metadata = io.open_db_metadata(proc_url)
+    continuations = metadata.tables[TABLENAME]
+
+    return continuations.delete().where(
+               continuations.c[cn.contin_filename].in_(list(filenames)))
+
+
 def read_all_continuations(storagestr):
     """
     Reads all of the continuation files from a processing directory
@@ -275,14 +295,32 @@ def read_continuation_graph(proc_url):
     return list(zip(dframe[cn.graph_id1], dframe[cn.graph_id2]))
 
 
-def write_contin_graph_edges(graph_edges, proc_url):
+def write_contin_graph_edges(graph_edges, proc_url, facehash=None):
+    """
+    Writes continuation graph edges. Passing the facehash of the faces
+    that were matched replaces the edges written for that hash before.
+    """
     assert io.is_db_url(proc_url), "graph IO not implemented for files"
 
     if len(graph_edges) == 0:
         print("WARNING: no graph edges to write")
-        return
+        if facehash is None:
+            return
 
-    ids1, ids2 = zip(*graph_edges)
+    ids1 = [e[0] for e in graph_edges]
+    ids2 = [e[1] for e in graph_edges]
     dframe = pd.DataFrame({cn.graph_id1: ids1, cn.graph_id2: ids2})
 
-    io.write_db_dframe(dframe, proc_url, "contin_graph")
+    if facehash is None:
+        io.write_db_dframe(dframe, proc_url, "contin_graph")
+        return
+
+    metadata = io.open_db_metadata(proc_url)
+    contin_graph = metadata.tables["contin_graph"]
+
+    dframe[cn.facehash] = facehash
+    outdated = contin_graph.delete().where(
+                   contin_graph.c[cn.facehash] == facehash)
+
+    io.write_db_dframes([dframe], proc_url, ["contin_graph"],
+                        statements=[outdated])
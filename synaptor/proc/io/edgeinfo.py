@@ -9,6 +9,7 @@ import pandas as pd
 from ... import io
 from .. import colnames as cn
 from . import filenames as fn
+from . import buckets
 
 
 EDGE_INFO_COLUMNS = [cn.seg_id, cn.size, cn.presyn_id, cn.postsyn_id,
@@ -70,12 +71,31 @@ def read_hashed_edge_info(proc_url, partnerhash=None,
 
 
 def write_chunk_edge_info(dframe, proc_url, chunk_bounds):
-    """ Writes edge info for a single chunk to storage. """
+    """
+    Writes edge info for a single chunk to storage. For databases, this
+    replaces the rows from any earlier run over the chunk, and marks the
+    cleft hashes of the old and new rows as dirty for pick_edge.
+    """
     if io.is_db_url(proc_url):
         chunk_tag = io.fname_chunk_tag(chunk_bounds)
         to_write = dframe[EDGE_INFO_COLUMNS].copy()
         to_write[cn.chunk_tag] = chunk_tag
-        io.write_db_dframe(to_write, proc_url, "chunk_edges", index=False)
+
+        metadata = io.open_db_metadata(proc_url)
+        edges = metadata.tables["chunk_edges"]
+        in_chunk = edges.c[cn.chunk_tag] == chunk_tag
+
+        statements = [buckets.dirty_buckets_from_select(
+                          metadata, "pick_edge", edges.c[cn.clefthash],
+                          in_chunk),
+                      edges.delete().where(in_chunk)]
+
+        dirty_df, dirty_tablename = buckets.prep_dirty_buckets(
+                                        "pick_edge", to_write[cn.clefthash])
+
+        io.write_db_dframes([to_write, dirty_df], proc_url,
+                            ["chunk_edges", dirty_tablename],
+                            statements=statements)
 
     else:
         io.write_dframe(dframe, chunk_info_fname(proc_url, chunk_bounds))
@@ -130,6 +150,43 @@ def read_all_chunk_edge_infos(proc_url):
     return io.utils.make_info_arr(dframe_lookup)
 
 
+def iter_chunk_edge_infos(proc_url):
+    """
+    Yields the edge info of the chunks within storage in chunk order.
+    For file storage, this reads one chunk file at a time. For databases,
+    the rows are streamed in fixed-size dataframes.
+    """
+    if io.is_db_url(proc_url):
+        metadata = io.open_db_metadata(proc_url)
+        edges = metadata.tables["chunk_edges"]
+        chunks = metadata.tables["chunks"]
+
+        edgecols = list(edges.c[name] for name in EDGE_INFO_COLUMNS)
+        edgecols.append(edges.c[cn.chunk_tag])
+
+        # matching the order of read_all_chunk_edge_infos
+        statement = select(edgecols).select_from(
+                        edges.join(chunks, edges.c[cn.chunk_tag] ==
+                                   chunks.c[cn.chunk_tag])
+                        ).order_by(chunks.c[cn.chunk_bx],
+                                   chunks.c[cn.chunk_by],
+                                   chunks.c[cn.chunk_bz],
+                                   edges.c["id"])
+
+        yield from io.iter_db_dframes(proc_url, statement,
+                                      index_col=cn.seg_id)
+
+    else:
+        edgeinfo_dir = os.path.join(proc_url, fn.edgeinfo_dirname)
+        fnames = io.pull_directory(edgeinfo_dir)
+        assert len(fnames) > 0, "No filenames returned"
+
+        starts = [tuple(io.bbox_from_fname(f).min()) for f in fnames]
+
+        for (_, fname) in sorted(zip(starts, fnames)):
+            yield io.read_dframe(fname)
+
+
 def make_empty_df():
     """ Make an empty dataframe as a placeholder. """
     df = pd.DataFrame(data=None, dtype=int, columns=EDGE_INFO_COLUMNS)
@@ -168,11 +225,35 @@ def read_merged_edge_info(proc_url):
         return io.read_dframe(proc_url, fn.merged_edgeinfo_fname)
 
 
-def write_merged_edge_info(dframe, proc_url):
-    """ Writes a merged edge info dataframe to storage. """
+def write_merged_edge_info(dframe, proc_url, clefthash=None):
+    """
+    Writes a merged edge info dataframe to storage. For databases, passing
+    the clefthash of a pick_edge task replaces the rows written for that
+    hash before, and marks the partner hashes of the old and new rows as
+    dirty for merge_dups.
+    """
     if io.is_db_url(proc_url):
         dframe = dframe.reset_index()
-        io.write_db_dframe(dframe, proc_url, "merged_edges", index=False)
+
+        if clefthash is None:
+            io.write_db_dframe(dframe, proc_url, "merged_edges", index=False)
+            return
+
+        metadata = io.open_db_metadata(proc_url)
+        edges = metadata.tables["merged_edges"]
+        in_bucket = edges.c[cn.clefthash] == clefthash
+
+        statements = [buckets.dirty_buckets_from_select(
+                          metadata, "merge_dups", edges.c[cn.partnerhash],
+                          in_bucket),
+                      edges.delete().where(in_bucket)]
+
+        dirty_df, dirty_tablename = buckets.prep_dirty_buckets(
+                                        "merge_dups", dframe[cn.partnerhash])
+
+        io.write_db_dframes([dframe, dirty_df], proc_url,
+                            ["merged_edges", dirty_tablename],
+                            statements=statements)
 
     else:
         io.write_dframe(dframe, proc_url, fn.merged_edgeinfo_fname)
@@ -5,6 +5,8 @@ seginfo_dirname = "seg_infos"
 seginfo_fmtstr = "seg_info_{tag}.df"
 merged_seginfo_fname = "merged_cleft_info.df"
 merged_seginfo_fmtstr = "merged_cleft_info_{tag}.df"
+# before the size threshold (kept for appending chunks)
+unthresholded_seginfo_fname = "merged_cleft_info_unthresholded.df"
 
 # Segment continuations
 contin_dirname = "continuations"
@@ -14,6 +16,7 @@ contin_fmtstr = "continuations_{chunk_tag}_{face_tag}.h5"
 # Segmentation merging id maps
 idmap_dirname = "id_maps"
 idmap_fmtstr = "id_map_{tag}.df"
+unthresholded_idmap_dirname = "id_maps_unthresholded"
 
 
 # Duplicate connection merging id map
@@ -31,7 +34,12 @@ tagged_final_edgeinfo_fname = "final_edgelist_{}.df"
 # Overlap matrices
 overlaps_dirname = "overlaps"
 overlaps_fmtstr = "chunk_overlap_{tag}.df"
+hashed_overlaps_dirname = "hashed_overlaps"
+hashed_overlaps_partfmt = "rowhash_{hashval}"
 max_overlaps_fname = "max_overlaps.df"
+max_overlaps_fmtstr = "max_overlaps_{tag}.df"
+topk_overlaps_dirname = "overlap_topk"
+topk_overlaps_fmtstr = "chunk_overlap_topk_{tag}.df"
 
 
 # PyTorch network
@@ -42,3 +50,7 @@ network_chkpt = "net.chkpt"
 # Task time durations
 timing_dirname = "task_durations"
 timing_fmtstr = "{tag}"
+
+# Task manifests
+manifest_dirname = "task_manifests"
+manifest_fmtstr = "{task_name}_{tag}.df"
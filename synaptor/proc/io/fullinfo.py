@@ -1,7 +1,7 @@
 """ Edge info DataFrame IO for processing tasks """
 
 
-from sqlalchemy import select
+from sqlalchemy import select, or_
 
 from ... import io
 from .. import colnames as cn
@@ -35,11 +35,27 @@ def read_full_info(proc_url):
 def write_full_info(dframe, proc_url, tag=None):
     """
     Writes the info dataframe with clefts and edges combined
-    to a processing directory
+    to a processing directory. For databases, passing the partnerhash
+    tag of a merge_dups task replaces the rows written for that hash
+    before (and any other rows for the same clefts).
     """
     if io.is_db_url(proc_url):
         dframe = dframe.reset_index()
-        io.write_db_dframe(dframe, proc_url, "final", index=False)
+
+        if tag is None:
+            io.write_db_dframe(dframe, proc_url, "final", index=False)
+            return
+
+        metadata = io.open_db_metadata(proc_url)
+        final = metadata.tables["final"]
+
+        seg_ids = list(int(i) for i in dframe[cn.seg_id])
+        outdated = final.delete().where(
+                       or_(final.c[cn.partnerhash] == tag,
+                           final.c[cn.seg_id].in_(seg_ids)))
+
+        io.write_db_dframes([dframe], proc_url, ["final"],
+                            statements=[outdated])
 
     else:
         if tag is None:
@@ -7,27 +7,42 @@ from sqlalchemy import select
 import pandas as pd
 
 from ... import io
+from ...types import IdMap
 from .. import colnames as cn
 from . import filenames as fn
+from . import buckets
 
 
 ID_MAP_COLUMNS = [cn.src_id, cn.dst_id]
 UNIQUE_ID_MAP_COLUMNS = ["id", cn.seg_id]
 CHUNKED_ID_MAP_COLUMNS = [cn.seg_id, cn.dst_id, cn.chunk_tag]
+SEG_MERGE_MAP_COLUMNS = [cn.src_id, cn.dst_id, cn.dst_id_hash]
 
 
-def cleft_map_fname(proc_url, chunk_bounds):
+def idmap_dirname(unthresholded=False):
+    """
+    The subdirectory of the chunk id maps. The unthresholded maps skip
+    the size threshold, so appended chunks can still reach the segments
+    that it removed.
+    """
+    if unthresholded:
+        return fn.unthresholded_idmap_dirname
+
+    return fn.idmap_dirname
+
+
+def cleft_map_fname(proc_url, chunk_bounds, unthresholded=False):
     chunk_tag = io.fname_chunk_tag(chunk_bounds)
     basename = fn.idmap_fmtstr.format(tag=chunk_tag)
 
-    return os.path.join(proc_url, fn.idmap_dirname, basename)
+    return os.path.join(proc_url, idmap_dirname(unthresholded), basename)
 
 
 def make_dframe_from_dict(id_map):
-    df = pd.DataFrame(pd.Series(id_map), columns=[cn.dst_id])
-    df.index.name = cn.src_id
+    """ Makes a dst id dataframe indexed by src id from a dict or IdMap """
+    df = IdMap.from_dict(id_map).to_dframe(cn.src_id, cn.dst_id)
 
-    return df
+    return df.set_index(cn.src_id)
 
 
 def read_chunk_unique_ids(proc_url, chunk_bounds):
@@ -42,7 +57,7 @@ def read_chunk_unique_ids(proc_url, chunk_bounds):
 
     dframe = io.read_db_dframe(proc_url, statement)
 
-    return dict(zip(dframe[cn.seg_id], dframe["id"]))
+    return unique_id_dframe_to_map(dframe)
 
 
 def read_all_chunk_unique_ids(proc_url):
@@ -66,12 +81,38 @@ def read_all_chunk_unique_ids(proc_url):
 
 
 def unique_id_dframe_to_map(dframe):
-    return dict(zip(dframe[cn.seg_id], dframe["id"]))
+    return IdMap.from_dframe(dframe, cn.seg_id, "id")
 
 
-def write_seg_merge_map(seg_merge_df, proc_url):
+def read_seg_merge_map(proc_url):
+    """ Reads the seg merge map (with dst id hashes) from a database """
     assert io.is_db_url(proc_url), "merge map IO not implemented for files"
-    io.write_db_dframe(seg_merge_df, proc_url, "seg_merge_map")
+
+    metadata = io.open_db_metadata(proc_url)
+    seg_merge_map = metadata.tables["seg_merge_map"]
+
+    columns = list(seg_merge_map.c[name] for name in SEG_MERGE_MAP_COLUMNS)
+    statement = select(columns)
+
+    return io.read_db_dframe(proc_url, statement)
+
+
+def write_seg_merge_map(seg_merge_df, proc_url, changed_buckets=()):
+    """
+    Replaces the seg merge map, and marks the changed_buckets (dst id
+    hashes) as dirty for merge_seginfo within the same transaction.
+    """
+    assert io.is_db_url(proc_url), "merge map IO not implemented for files"
+
+    metadata = io.open_db_metadata(proc_url)
+    seg_merge_map = metadata.tables["seg_merge_map"]
+
+    dirty_df, dirty_tablename = buckets.prep_dirty_buckets("merge_seginfo",
+                                                           changed_buckets)
+
+    io.write_db_dframes([seg_merge_df, dirty_df], proc_url,
+                        ["seg_merge_map", dirty_tablename],
+                        statements=[seg_merge_map.delete()])
 
 
 def write_chunked_seg_map(proc_url):
@@ -103,7 +144,8 @@ def write_chunked_seg_map(proc_url):
                     names=chunked_map_colnames,
                     select=select_stmt)
 
-    io.execute_db_statement(proc_url, full_stmt)
+    # replacing the map from any earlier run
+    io.execute_db_statements(proc_url, [chunked_map.delete(), full_stmt])
 
 
 def read_chunk_id_map(proc_url, chunk_bounds):
@@ -121,23 +163,49 @@ def read_chunk_id_map(proc_url, chunk_bounds):
         fname = io.pull_file(cleft_map_fname(proc_url, chunk_bounds))
         dframe = io.read_dframe(fname)
 
-    return dict(zip(dframe.index, dframe.dst_id))
+    return IdMap(dframe.index.values, dframe[cn.dst_id].values)
+
+
+def read_all_chunk_id_maps(proc_url, unthresholded=False):
+    """
+    Reads every chunk id mapping within a processing directory. Returns a
+    dict from chunk bounds to id maps.
+    """
+    assert not io.is_db_url(proc_url), "not implemented for databases"
+
+    idmap_dir = os.path.join(proc_url, idmap_dirname(unthresholded))
+    fnames = io.pull_directory(idmap_dir)
+
+    id_maps = dict()
+    for fname in fnames:
+        dframe = io.read_dframe(fname)
+        id_maps[io.bbox_from_fname(fname)] = IdMap(dframe.index.values,
+                                                   dframe[cn.dst_id].values)
+
+    return id_maps
 
 
-def write_chunk_id_map(id_map, proc_url, chunk_bounds):
+def write_chunk_id_map(id_map, proc_url, chunk_bounds, unthresholded=False):
     """Writes an id mapping for a chunk to a processing directory"""
     dframe = make_dframe_from_dict(id_map)
 
     if io.is_db_url(proc_url):
+        assert not unthresholded, "unthresholded maps not stored in databases"
         tag = io.fname_chunk_tag(chunk_bounds)
         dframe["chunk_tag"] = tag
         io.write_db_dframe(dframe, proc_url, "seg_idmap")
 
     else:
-        io.write_dframe(dframe, cleft_map_fname(proc_url, chunk_bounds))
+        fname = cleft_map_fname(proc_url, chunk_bounds,
+                                unthresholded=unthresholded)
+        if not io.is_remote_path(fname):
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+
+        io.write_dframe(dframe, fname)
 
 
-def write_chunk_id_maps(chunk_id_maps, chunk_bounds, proc_url):
+def write_chunk_id_maps(chunk_id_maps, chunk_bounds, proc_url,
+                        unthresholded=False):
     """
     Writes all of the id mappings for each chunk to a subdirectory
     of a processing directory
@@ -146,16 +214,19 @@ def write_chunk_id_maps(chunk_id_maps, chunk_bounds, proc_url):
 
         for (id_map, bounds) in zip(chunk_id_maps.flat, chunk_bounds):
             # Simple for now, since I'm not sure how to implement this later
-            write_chunk_id_map(id_map, proc_url, bounds)
+            write_chunk_id_map(id_map, proc_url, bounds,
+                               unthresholded=unthresholded)
 
     else:
-        if not os.path.exists(fn.idmap_dirname):
-            os.makedirs(fn.idmap_dirname)
+        dirname = idmap_dirname(unthresholded)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
 
         for (id_map, bounds) in zip(chunk_id_maps.flat, chunk_bounds):
-            write_chunk_id_map(id_map, "./", bounds)
+            write_chunk_id_map(id_map, "./", bounds,
+                               unthresholded=unthresholded)
 
-        io.send_directory(fn.idmap_dirname, proc_url)
+        io.send_directory(dirname, proc_url)
 
 
 def read_dup_id_map(proc_url):
@@ -175,15 +246,32 @@ def read_dup_id_map(proc_url):
             print("WARNING: no dup id map found, passing empty dup mapping")
             dframe = pd.DataFrame({cn.dst_id: []})
 
-    return dict(zip(dframe.index, dframe[cn.dst_id]))
+    return IdMap(dframe.index.values, dframe[cn.dst_id].values)
 
 
-def write_dup_id_map(id_map, proc_url):
-    """ Writes a duplicate mapping to storage. """
+def write_dup_id_map(id_map, proc_url, hashcol=None, hashval=None):
+    """
+    Writes a duplicate mapping to storage. For databases, passing the
+    hash column and value of the writing task (e.g. the partnerhash of a
+    merge_dups task) replaces the mapping written by that task before.
+    """
     dframe = make_dframe_from_dict(id_map)
 
     if io.is_db_url(proc_url):
-        io.write_db_dframe(dframe.reset_index(), proc_url, "dup_merge_map")
+        if hashcol is None:
+            io.write_db_dframe(dframe.reset_index(), proc_url,
+                               "dup_merge_map")
+            return
+
+        metadata = io.open_db_metadata(proc_url)
+        dup_map = metadata.tables["dup_merge_map"]
+
+        to_write = dframe.reset_index()
+        to_write[hashcol] = hashval
+        outdated = dup_map.delete().where(dup_map.c[hashcol] == hashval)
+
+        io.write_db_dframes([to_write], proc_url, ["dup_merge_map"],
+                            statements=[outdated])
 
     else:
         io.write_dframe(dframe, proc_url, fn.dup_map_fname)
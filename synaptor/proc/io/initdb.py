@@ -32,7 +32,8 @@ __all__ = ["init_db", "drop_db", "fill_chunks", "TABLES"]
 TABLES = ["final", "contin_graph", "merged_edges", "chunk_edges",
           "merged_segs", "chunk_segs",
           "seg_merge_map", "chunked_seg_merge_map", "dup_merge_map",
-          "continuations", "chunk_overlaps", "max_overlaps", "timing_log"]
+          "continuations", "chunk_overlaps", "chunk_overlap_topk",
+          "max_overlaps", "timing_log", "task_manifests", "dirty_buckets"]
 
 
 def init_db(url, segid_colname=cn.seg_id, metadata=None,
@@ -43,6 +44,8 @@ def init_db(url, segid_colname=cn.seg_id, metadata=None,
 
     # init_chunks(metadata)
     init_timing_log(metadata)
+    init_manifest_table(metadata)
+    init_dirty_bucket_table(metadata)
 
     init_seg_tables(metadata, segid_colname)
     init_continuation_tables(metadata)
@@ -50,7 +53,8 @@ def init_db(url, segid_colname=cn.seg_id, metadata=None,
 
     if edges:
         init_edge_tables(metadata)
-        init_idmap_table(metadata, "dup_merge_map")
+        init_idmap_table(metadata, "dup_merge_map",
+                         hashed=True, partnered=True)
 
     if overlaps:
         init_overlap_tables(metadata)
@@ -69,6 +73,30 @@ def init_timing_log(metadata):
                  Column(cn.task_time, Float))
 
 
+def init_manifest_table(metadata):
+    """
+    Specifies a table to record the fingerprints of the parameters and
+    inputs used by each chunk task
+    """
+    return Table("task_manifests", metadata,
+                 Column("id", Integer, primary_key=True),
+                 Column(cn.task_name, Text),
+                 Column(cn.chunk_tag, Text, index=True),
+                 Column(cn.params_hash, Text),
+                 Column(cn.input_hash, Text))
+
+
+def init_dirty_bucket_table(metadata):
+    """
+    Specifies a table to record the hash buckets of each reduce stage
+    whose inputs changed since the stage's task for that bucket last ran
+    """
+    return Table("dirty_buckets", metadata,
+                 Column("id", Integer, primary_key=True),
+                 Column(cn.stage, Text),
+                 Column(cn.bucket, Integer))
+
+
 def init_chunks(metadata):
     """ Specifies a table to record chunk tags. """
     return Table("chunks", metadata,
@@ -89,10 +117,11 @@ def init_seg_tables(metadata, segid_colname=cn.seg_id):
     """
     init_seg_table(metadata, "chunk_segs", segid_colname=segid_colname)
     init_seg_table(metadata, "merged_segs", segid_colname=segid_colname,
-                   chunked=False)
+                   chunked=False, hashed=True)
 
 
-def init_seg_table(metadata, tablename, segid_colname=cn.seg_id, chunked=True):
+def init_seg_table(metadata, tablename, segid_colname=cn.seg_id, chunked=True,
+                   hashed=False):
     """ Specifies a table for tracking info about a segment. """
     columns = [Column("id", BigInteger, primary_key=True),
                Column(cn.seg_id, Integer, index=True),
@@ -113,6 +142,11 @@ def init_seg_table(metadata, tablename, segid_colname=cn.seg_id, chunked=True):
         # Chunk id - None if merged across chunks
         columns.append(Column(cn.chunk_tag, Text, index=True))
 
+    if hashed:
+        # dst id hash of the merge_seginfo task which wrote the row
+        columns.append(Column(cn.dst_id_hash, Integer, default=-1,
+                              index=True))
+
     return Table(tablename, metadata, *columns)
 
 
@@ -128,7 +162,8 @@ def init_continuation_file_table(metadata, tablename="continuations"):
     """
     columns = [Column("id", Integer, primary_key=True),
                Column("filename", Text),
-               Column("facehash", Integer, index=True)]
+               Column("facehash", Integer, index=True),
+               Column(cn.contin_size, Integer, default=0)]
 
     return Table(tablename, metadata, *columns)
 
@@ -139,7 +174,8 @@ def init_continuation_graph_table(metadata, tablename="contin_graph"):
     """
     columns = [Column("id", BigInteger, primary_key=True),
                Column(cn.graph_id1, BigInteger),
-               Column(cn.graph_id2, BigInteger)]
+               Column(cn.graph_id2, BigInteger),
+               Column(cn.facehash, Integer, default=-1, index=True)]
 
     return Table(tablename, metadata, *columns)
 
@@ -149,7 +185,8 @@ def init_idmap_tables(metadata):
     init_idmap_table(metadata, "chunked_seg_merge_map", chunked=True)
 
 
-def init_idmap_table(metadata, tablename, hashed=False, chunked=False):
+def init_idmap_table(metadata, tablename, hashed=False, chunked=False,
+                     partnered=False):
     """ Specifies a table that holds an id mapping. """
     columns = [Column("id", Integer, primary_key=True),
                Column(cn.src_id, Integer, index=True),
@@ -161,6 +198,9 @@ def init_idmap_table(metadata, tablename, hashed=False, chunked=False):
     if chunked:
         columns.append(Column(cn.chunk_tag, Text))
 
+    if partnered:
+        columns.append(Column(cn.partnerhash, Integer, default=-1))
+
     return Table(tablename, metadata, *columns)
 
 
@@ -239,18 +279,27 @@ def init_overlap_tables(metadata):
     overlap between sets of segments.
     """
     init_overlap_table(metadata, "chunk_overlaps", chunked=True)
+    init_overlap_table(metadata, "chunk_overlap_topk", chunked=True,
+                       bounded=True)
     init_overlap_table(metadata, "max_overlaps", chunked=False)
 
 
-def init_overlap_table(metadata, tablename, chunked=True):
-    """ Specifies a table that holds an id mapping. """
+def init_overlap_table(metadata, tablename, chunked=True, bounded=False):
+    """
+    Specifies a table that holds an overlap matrix. Bounded tables
+    also record the largest overlap left out of each row's summary.
+    """
     columns = [Column("id", Integer, primary_key=True),
                Column(cn.rows, BigInteger),
                Column(cn.cols, BigInteger),
                Column(cn.vals, Integer)]
 
+    if bounded:
+        columns.append(Column(cn.ovl_bound, Integer))
+
     if chunked:
         columns.append(Column(cn.chunk_tag, Text))
+        columns.append(Column(cn.rowhash, Integer, default=-1, index=True))
 
     return Table(tablename, metadata, *columns)
 
@@ -0,0 +1,104 @@
+""" Task Manifest IO - fingerprints of the inputs used by chunk tasks """
+
+
+import os
+
+from sqlalchemy import select
+from sqlalchemy.sql import and_
+import pandas as pd
+
+from ... import io
+from .. import colnames as cn
+from . import filenames as fn
+
+
+MANIFEST_COLUMNS = [cn.task_name, cn.chunk_tag,
+                    cn.params_hash, cn.input_hash]
+
+
+def manifest_fname(proc_dir, task_name, chunk_bounds):
+    tag = io.fname_chunk_tag(chunk_bounds)
+    basename = fn.manifest_fmtstr.format(task_name=task_name, tag=tag)
+
+    return os.path.join(proc_dir, fn.manifest_dirname, basename)
+
+
+def read_task_manifest(proc_url, task_name, chunk_bounds):
+    """
+    Reads the (params_hash, input_hash) fingerprints recorded by the last
+    run of a task over a chunk. Returns None if the task hasn't recorded
+    a manifest for that chunk.
+    """
+    if io.is_db_url(proc_url):
+        tag = io.fname_chunk_tag(chunk_bounds)
+        metadata = io.open_db_metadata(proc_url)
+
+        manifests = metadata.tables["task_manifests"]
+        columns = list(manifests.c[name] for name in MANIFEST_COLUMNS)
+        statement = select(columns).where(and_(
+                        manifests.c[cn.chunk_tag] == tag,
+                        manifests.c[cn.task_name] == task_name)
+                        ).order_by(manifests.c["id"])
+
+        dframe = io.read_db_dframe(proc_url, statement)
+
+    else:
+        try:
+            dframe = io.read_dframe(
+                         manifest_fname(proc_url, task_name, chunk_bounds))
+        except Exception:
+            return None
+
+    if len(dframe) == 0:
+        return None
+
+    last = dframe.iloc[-1]
+    return last[cn.params_hash], last[cn.input_hash]
+
+
+def read_task_manifests(proc_url, task_name):
+    """
+    Reads the last manifest recorded by a task for every chunk. Returns a
+    dataframe of fingerprints indexed by chunk tag.
+    """
+    assert io.is_db_url(proc_url), "not implemented for files"
+
+    metadata = io.open_db_metadata(proc_url)
+
+    manifests = metadata.tables["task_manifests"]
+    columns = list(manifests.c[name] for name in MANIFEST_COLUMNS)
+    statement = select(columns).where(
+                    manifests.c[cn.task_name] == task_name
+                    ).order_by(manifests.c["id"])
+
+    dframe = io.read_db_dframe(proc_url, statement)
+    dframe = dframe.loc[~dframe[cn.chunk_tag].duplicated(keep="last")]
+
+    return dframe.set_index(cn.chunk_tag)
+
+
+def write_task_manifest(params_hash, input_hash,
+                        task_name, chunk_bounds, proc_url):
+    """ Records the fingerprints used by a task over a chunk """
+    tag = io.fname_chunk_tag(chunk_bounds)
+
+    if io.is_db_url(proc_url):
+        metadata = io.open_db_metadata(proc_url)
+
+        manifests = metadata.tables["task_manifests"]
+        statement = manifests.insert().values({cn.task_name: task_name,
+                                               cn.chunk_tag: tag,
+                                               cn.params_hash: params_hash,
+                                               cn.input_hash: input_hash})
+
+        io.execute_db_statement(proc_url, statement)
+
+    else:
+        dframe = pd.DataFrame({cn.task_name: [task_name],
+                               cn.chunk_tag: [tag],
+                               cn.params_hash: [params_hash],
+                               cn.input_hash: [input_hash]},
+                              columns=MANIFEST_COLUMNS)
+
+        io.write_dframe(dframe,
+                        manifest_fname(proc_url, task_name, chunk_bounds))
@@ -9,10 +9,12 @@ from sqlalchemy import select
 
 from ... import io
 from .. import colnames as cn
+from .. import hashing
 from . import filenames as fn
 
 
 OVERLAP_COLUMNS = [cn.rows, cn.cols, cn.vals]
+TOPK_COLUMNS = [cn.rows, cn.cols, cn.vals, cn.ovl_bound, cn.chunk_tag]
 CHUNK_START_COLUMNS = [cn.chunk_tag, cn.chunk_bx, cn.chunk_by, cn.chunk_bz]
 
 
@@ -41,8 +43,22 @@ def empty_matrix():
     return sp.coo_matrix(([], ([], [])), shape=(0, 0))
 
 
-def write_chunk_overlap_mat(overlap_mat, chunk_bounds, proc_url):
-    """Writes an overlap matrix for a chunk to a processing directory"""
+def hashed_overlap_dirname(proc_dir, hashval):
+    partname = fn.hashed_overlaps_partfmt.format(hashval=hashval)
+
+    return os.path.join(proc_dir, fn.hashed_overlaps_dirname, partname)
+
+
+def write_chunk_overlap_mat(overlap_mat, chunk_bounds, proc_url,
+                            hashmax=None):
+    """
+    Writes an overlap matrix for a chunk to a processing directory. If
+    hashmax is passed, each entry is also tagged with the hash of its row
+    id so that the entries can be merged by hash partition
+    (see read_hashed_overlap_mat). For file storage, the entries of each
+    partition are also written to a separate directory per hash value,
+    so each merging task only pulls its own partition.
+    """
     chunk_tag = io.fname_chunk_tag(chunk_bounds)
 
     rs, cs, vs = sp.find(overlap_mat)
@@ -50,14 +66,26 @@ def write_chunk_overlap_mat(overlap_mat, chunk_bounds, proc_url):
                        cn.cols:cs,
                        cn.vals:vs})
 
+    if hashmax is not None:
+        df = hashing.add_hashed_index(df, [cn.rows], hashmax,
+                                      indexname=cn.rowhash)
+
     if io.is_db_url(proc_url):
         df[cn.chunk_tag] = chunk_tag
         io.write_db_dframe(df, proc_url, "chunk_overlaps")
 
     else:
-        mat_fname = os.path.join(proc_url, fn.overlaps_dirname,
-                                 fn.overlaps_fmtstr.format(tag=chunk_tag))
-        io.write_dframe(df, mat_fname)
+        basename = fn.overlaps_fmtstr.format(tag=chunk_tag)
+        io.write_dframe(df, os.path.join(proc_url, fn.overlaps_dirname,
+                                         basename))
+
+        if hashmax is not None:
+            for (hashval, part_df) in df.groupby(cn.rowhash):
+                part_dir = hashed_overlap_dirname(proc_url, hashval)
+                if not io.is_remote_path(part_dir):
+                    os.makedirs(part_dir, exist_ok=True)
+
+                io.write_dframe(part_df, os.path.join(part_dir, basename))
 
 
 def read_all_overlap_mats(proc_url):
@@ -112,6 +140,133 @@ def read_all_overlap_mats(proc_url):
     return io.utils.make_info_arr(dframe_lookup)
 
 
+def read_hashed_overlap_mat(proc_url, hashval):
+    """
+    Reads the chunk overlap matrix entries whose row id hashes to hashval
+    (see write_chunk_overlap_mat), and combines them into a single matrix.
+    Duplicate entries across chunks are left to be summed by the caller.
+    """
+    if io.is_db_url(proc_url):
+        metadata = io.open_db_metadata(proc_url)
+        overlaps = metadata.tables["chunk_overlaps"]
+
+        columns = list(overlaps.c[name] for name in OVERLAP_COLUMNS)
+        statement = select(columns).where(overlaps.c[cn.rowhash] == hashval)
+
+        df = io.read_db_dframe(proc_url, statement)
+
+    else:
+        df = read_overlap_partition(proc_url, hashval)
+
+    return overlap_mat_from_dframe(df)
+
+
+def read_overlap_partition(proc_url, hashval):
+    """
+    Reads the overlap entries of a row hash partition from file storage.
+    Chunks without entries in the partition don't write a file.
+    """
+    fnames = io.pull_directory(hashed_overlap_dirname(proc_url, hashval))
+
+    dframes = [io.read_dframe(fname)[OVERLAP_COLUMNS] for fname in fnames]
+    if len(dframes) == 0:
+        return pd.DataFrame(columns=OVERLAP_COLUMNS)
+
+    return pd.concat(dframes)
+
+
+def read_overlap_mat_for_rows(proc_url, row_ids, hashval=None):
+    """
+    Reads the chunk overlap matrix entries for a set of row ids, and
+    combines them into a single matrix. Passing the hash value of the
+    rows (if hashed) restricts the search to that partition.
+    """
+    row_ids = [int(r) for r in row_ids]
+
+    if io.is_db_url(proc_url):
+        metadata = io.open_db_metadata(proc_url)
+        overlaps = metadata.tables["chunk_overlaps"]
+
+        columns = list(overlaps.c[name] for name in OVERLAP_COLUMNS)
+        statement = select(columns).where(overlaps.c[cn.rows].in_(row_ids))
+        if hashval is not None:
+            statement = statement.where(overlaps.c[cn.rowhash] == hashval)
+
+        df = io.read_db_dframe(proc_url, statement)
+
+    elif hashval is not None:
+        df = read_overlap_partition(proc_url, hashval)
+        df = df[df[cn.rows].isin(row_ids)]
+
+    else:
+        overlap_mat_dir = os.path.join(proc_url, fn.overlaps_dirname)
+        fnames = io.pull_directory(overlap_mat_dir)
+        assert len(fnames) > 0, "No filenames returned"
+
+        dframes = list()
+        for fname in fnames:
+            df = io.read_dframe(fname)
+            dframes.append(df[df[cn.rows].isin(row_ids)][OVERLAP_COLUMNS])
+
+        df = pd.concat(dframes)
+
+    return overlap_mat_from_dframe(df)
+
+
+def write_chunk_overlap_topk(topk_df, chunk_bounds, proc_url, hashmax=None):
+    """
+    Writes the top-k overlap summary of a chunk (see
+    overlap.top_k_overlaps) to a processing directory
+    """
+    chunk_tag = io.fname_chunk_tag(chunk_bounds)
+
+    df = topk_df.copy()
+    df[cn.chunk_tag] = chunk_tag
+
+    if hashmax is not None:
+        df = hashing.add_hashed_index(df, [cn.rows], hashmax,
+                                      indexname=cn.rowhash)
+
+    if io.is_db_url(proc_url):
+        io.write_db_dframe(df, proc_url, "chunk_overlap_topk")
+
+    else:
+        topk_fname = os.path.join(proc_url, fn.topk_overlaps_dirname,
+                                  fn.topk_overlaps_fmtstr.format(tag=chunk_tag))
+        io.write_dframe(df, topk_fname)
+
+
+def read_overlap_topk(proc_url, hashval=None):
+    """
+    Reads the top-k overlap summaries of every chunk. If hashval is passed,
+    only reads the entries whose row id hashes to that value.
+    """
+    if io.is_db_url(proc_url):
+        metadata = io.open_db_metadata(proc_url)
+        topk = metadata.tables["chunk_overlap_topk"]
+
+        columns = list(topk.c[name] for name in TOPK_COLUMNS)
+        statement = select(columns)
+        if hashval is not None:
+            statement = statement.where(topk.c[cn.rowhash] == hashval)
+
+        return io.read_db_dframe(proc_url, statement)
+
+    else:
+        topk_dir = os.path.join(proc_url, fn.topk_overlaps_dirname)
+        fnames = io.pull_directory(topk_dir)
+        assert len(fnames) > 0, "No filenames returned"
+
+        dframes = list()
+        for fname in fnames:
+            df = io.read_dframe(fname)
+            if hashval is not None:
+                df = df[df[cn.rowhash] == hashval]
+            dframes.append(df[TOPK_COLUMNS])
+
+        return pd.concat(dframes)
+
+
 def make_empty_df():
     """ Make an empty dataframe as a placeholder. """
     df = pd.DataFrame(data=None, dtype=int, columns=OVERLAP_COLUMNS)
@@ -119,10 +274,11 @@ def make_empty_df():
     return df.set_index(cn.seg_id)
 
 
-def read_max_overlaps(proc_url):
+def read_max_overlaps(proc_url, hashmax=None):
     """
     Reads the mapping from segment to base segment of maximal overlap
-    from a processing directory
+    from a processing directory. Pass hashmax for files written by
+    hashed merge tasks.
     """
     if io.is_db_url(proc_url):
         metadata = io.open_db_metadata(proc_url)
@@ -131,16 +287,25 @@ def read_max_overlaps(proc_url):
         columns = list(overlaps.c[name] for name in OVERLAP_COLUMNS)
         df = io.read_db_dframe(proc_url, select(columns), index=cn.rows)
 
+    elif hashmax is not None:
+        df = pd.concat([io.read_dframe(proc_url,
+                                       fn.max_overlaps_fmtstr.format(tag=i))
+                        for i in range(hashmax)])
+
     else:
         df = io.read_dframe(proc_url, fn.max_overlaps_fname)
 
+    if cn.rows in df.columns:
+        df = df.set_index(cn.rows)
+
     return dict(zip(df.index, df[cn.cols]))
 
 
-def write_max_overlaps(max_overlaps, proc_url):
+def write_max_overlaps(max_overlaps, proc_url, hash_tag=None):
     """
     Writes a mapping from segment to base segment of maximal overlap
-    to a processing directory
+    to a processing directory. Hashed merge tasks pass their hash value
+    as the hash_tag.
 
     UNFINISHED - will revisit after testing other tasks
     """
@@ -153,4 +318,9 @@ def write_max_overlaps(max_overlaps, proc_url):
         io.write_db_dframe(df, proc_url, "max_overlaps")
 
     else:
-        io.write_dframe(df, proc_url, fn.max_overlaps_fname)
+        if hash_tag is not None:
+            filename = fn.max_overlaps_fmtstr.format(tag=hash_tag)
+        else:
+            filename = fn.max_overlaps_fname
+
+        io.write_dframe(df, proc_url, filename)
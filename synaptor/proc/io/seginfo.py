@@ -9,6 +9,7 @@ import pandas as pd
 from ... import io
 from .. import colnames as cn
 from . import filenames as fn
+from . import buckets
 
 
 SEG_INFO_COLUMNS = [cn.seg_id, cn.size, *cn.centroid_cols, *cn.bbox_cols]
@@ -58,6 +59,18 @@ def prep_chunk_seg_info(dframe, chunk_bounds):
     return to_write, CHUNKED_TABLENAME
 
 
+def outdated_chunk_seg_info(proc_url, chunk_bounds):
+    """
+    Makes a statement that deletes the seg info rows written by an earlier
+    run over a chunk.
+    """
+    tag = io.fname_chunk_tag(chunk_bounds)
+    metadata = io.open_db_metadata(proc_url)
+    segs = metadata.tables[CHUNKED_TABLENAME]
+
+    return segs.delete().where(segs.c[cn.chunk_tag] == tag)
+
+
 def read_all_chunk_seg_infos(proc_url):
     """
     Reads all seg info for chunks within storage.
@@ -107,6 +120,28 @@ def read_all_chunk_seg_infos(proc_url):
     return io.utils.make_info_arr(dframe_lookup), os.path.dirname(fnames[0])
 
 
+def read_new_chunk_seg_infos(proc_url, merged_bounds):
+    """
+    Reads the seg info of each chunk that isn't within merged_bounds (i.e.
+    that was added after the last merge). Returns a dict from chunk bounds
+    to dataframes.
+    """
+    assert not io.is_db_url(proc_url), "not implemented for databases"
+
+    merged_bounds = set(merged_bounds)
+
+    seginfo_dir = os.path.join(proc_url, fn.seginfo_dirname)
+    fnames = io.pull_directory(seginfo_dir)
+
+    dframes = dict()
+    for fname in fnames:
+        bounds = io.bbox_from_fname(fname)
+        if bounds not in merged_bounds:
+            dframes[bounds] = io.read_dframe(fname)
+
+    return dframes
+
+
 def make_empty_df():
     """ Make an empty dataframe as a placeholder. """
     df = pd.DataFrame(data=None, dtype=int, columns=SEG_INFO_COLUMNS)
@@ -137,6 +172,27 @@ def read_mapped_seginfo_by_dst_hash(proc_url, hashval):
     return io.read_db_dframe(proc_url, statement)
 
 
+def mark_partner_buckets(proc_url, hashval):
+    """
+    Marks the partner hash buckets of the merged edges of the segments
+    merged under a dst id hash as dirty for merge_dups (which reads their
+    merged seg info).
+    """
+    assert io.is_db_url(proc_url), "Not implemented for file IO"
+
+    metadata = io.open_db_metadata(proc_url)
+    segs = metadata.tables[MERGED_TABLENAME]
+    edges = metadata.tables["merged_edges"]
+
+    statement = buckets.dirty_buckets_from_select(
+                    metadata, "merge_dups", edges.c[cn.partnerhash],
+                    segs.c[cn.dst_id_hash] == hashval,
+                    select_from=segs.join(edges, segs.c[cn.seg_id] ==
+                                          edges.c[cn.seg_id]))
+
+    io.execute_db_statement(proc_url, statement)
+
+
 def read_all_unique_seg_ids(proc_url):
     assert io.is_db_url(proc_url), "Not implemented for file IO"
 
@@ -181,9 +237,24 @@ def read_merged_seg_info(proc_url, hash_index=None):
 
 
 def write_merged_seg_info(dframe, proc_url, hash_tag=None):
-    """Writes a merged seg info dataframe to storage. """
+    """
+    Writes a merged seg info dataframe to storage. For databases, passing
+    the dst id hash_tag replaces the rows written for that hash before.
+    """
     if io.is_db_url(proc_url):
-        io.write_db_dframe(dframe, proc_url, MERGED_TABLENAME, index=True)
+        if hash_tag is None:
+            io.write_db_dframe(dframe, proc_url, MERGED_TABLENAME, index=True)
+            return
+
+        metadata = io.open_db_metadata(proc_url)
+        segs = metadata.tables[MERGED_TABLENAME]
+
+        to_write = dframe.reset_index()
+        to_write[cn.dst_id_hash] = hash_tag
+        outdated = segs.delete().where(segs.c[cn.dst_id_hash] == hash_tag)
+
+        io.write_db_dframes([to_write], proc_url, [MERGED_TABLENAME],
+                            statements=[outdated])
 
     else:
         if hash_tag is not None:
@@ -194,6 +265,23 @@ def write_merged_seg_info(dframe, proc_url, hash_tag=None):
         io.write_dframe(dframe, proc_url, filename)
 
 
+def read_unthresholded_seg_info(proc_url):
+    """
+    Reads the merged seg info from before the size threshold (which keeps
+    the segments that it removed).
+    """
+    assert not io.is_db_url(proc_url), "not implemented for databases"
+
+    return io.read_dframe(proc_url, fn.unthresholded_seginfo_fname)
+
+
+def write_unthresholded_seg_info(dframe, proc_url):
+    """ Writes the merged seg info from before the size threshold. """
+    assert not io.is_db_url(proc_url), "not implemented for databases"
+
+    io.write_dframe(dframe, proc_url, fn.unthresholded_seginfo_fname)
+
+
 def dedup_chunk_segs(proc_url):
     assert io.is_db_url(proc_url), "not implemented for file IO"
 
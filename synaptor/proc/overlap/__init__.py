@@ -1,4 +1,5 @@
 from . import overlap
 from .overlap import count_overlaps, find_max_overlaps, add_overlapping_seg
+from .overlap import top_k_overlaps, merge_top_k_overlaps
 
 from . import merge
@@ -13,12 +13,31 @@ def apply_chunk_id_maps(overlap_arr, chunk_id_maps):
     """
     rs, cs, vs = list(), list(), list()
     for (overlap, id_map) in zip(overlap_arr.flat, chunk_id_maps.flat):
-        for (r, c, v) in zip(overlap.row, overlap.col, overlap.data):
-            rs.append(id_map[r])
-            cs.append(c)
-            vs.append(v)
+        rs.append(map_ids(overlap.row, id_map))
+        cs.append(overlap.col)
+        vs.append(overlap.data)
 
-    return sp.coo_matrix((vs, (rs, cs)))
+    return sp.coo_matrix((np.concatenate(vs),
+                          (np.concatenate(rs), np.concatenate(cs))))
+
+
+def map_ids(ids, id_map):
+    """ Maps an array of ids through a dictionary using a sorted lookup """
+    if len(ids) == 0:
+        return np.array([], dtype=np.uint64)
+
+    keys = np.array(list(id_map.keys()), dtype=np.uint64)
+    vals = np.array(list(id_map.values()), dtype=np.uint64)
+
+    order = np.argsort(keys)
+    keys, vals = keys[order], vals[order]
+
+    ids = np.asarray(ids, dtype=np.uint64)
+    inds = np.searchsorted(keys, ids)
+    inds[inds == len(keys)] = 0
+    assert len(keys) > 0 and np.all(keys[inds] == ids), "ids missing from map"
+
+    return vals[inds]
 
 
 def consolidate_overlaps(overlap_mat_arr, dtype=np.uint64):
@@ -2,6 +2,7 @@
 Segment Overlap
 """
 
+import numpy as np
 import pandas as pd
 from scipy import sparse
 
@@ -13,17 +14,139 @@ count_overlaps = seg_utils.count_overlaps
 
 
 def find_max_overlaps(overlap_mat):
+    """
+    Finds the column of maximal overlap for each row of an overlap matrix.
+    Ties are broken toward the smallest column id.
+
+    Returns a coo_matrix with a single entry for each row
+    """
+    rs, cs, vs = overlap_mat.row, overlap_mat.col, overlap_mat.data
+
+    if len(vs) == 0:
+        return sparse.coo_matrix(([], ([], [])), shape=overlap_mat.shape)
+
+    # sorting by row, then col within each row
+    order = np.lexsort((cs, rs))
+    rs, cs, vs = rs[order], cs[order], vs[order]
+
+    new_row = np.ones((len(rs),), dtype=np.bool_)
+    new_row[1:] = rs[1:] != rs[:-1]
+    row_starts = np.nonzero(new_row)[0]
+    row_sizes = np.diff(np.append(row_starts, len(rs)))
+    row_maxima = np.maximum.reduceat(vs, row_starts)
+
+    # first (i.e. smallest col) entry matching the maximum within each row
+    is_max = vs == np.repeat(row_maxima, row_sizes)
+    max_inds = np.nonzero(is_max)[0]
+    first_inds = max_inds[np.unique(rs[max_inds], return_index=True)[1]]
+
+    return sparse.coo_matrix((vs[first_inds],
+                              (rs[first_inds], cs[first_inds])))
+
+
+def top_k_overlaps(overlap_mat, k):
+    """
+    Summarizes each row of an overlap matrix by its k largest entries
+    (ties broken toward the smallest column id).
+
+    Returns a DataFrame of the kept entries, where each entry also records
+    the largest value left out of its row (0 if nothing was left out).
+    """
+    rs, cs, vs = overlap_mat.row, overlap_mat.col, overlap_mat.data
+    columns = [cn.rows, cn.cols, cn.vals, cn.ovl_bound]
+
+    if len(vs) == 0:
+        return pd.DataFrame(data=None, dtype=int, columns=columns)
+
+    # sorting by row, then decreasing value, then col
+    order = np.lexsort((cs, -vs.astype(np.int64), rs))
+    rs, cs, vs = rs[order], cs[order], vs[order]
+
+    new_row = np.ones((len(rs),), dtype=np.bool_)
+    new_row[1:] = rs[1:] != rs[:-1]
+    row_starts = np.nonzero(new_row)[0]
+    row_sizes = np.diff(np.append(row_starts, len(rs)))
+
+    ranks = np.arange(len(rs)) - np.repeat(row_starts, row_sizes)
+
+    bounds = np.zeros((len(row_starts),), dtype=vs.dtype)
+    truncated = row_sizes > k
+    bounds[truncated] = vs[row_starts[truncated] + k]
+    bounds = np.repeat(bounds, row_sizes)
+
+    kept = ranks < k
+
+    return pd.DataFrame({cn.rows: rs[kept], cn.cols: cs[kept],
+                         cn.vals: vs[kept], cn.ovl_bound: bounds[kept]},
+                        columns=columns)
+
+
+def merge_top_k_overlaps(topk_df):
+    """
+    Combines the top-k summaries of several chunks (see top_k_overlaps),
+    where each entry is tagged by its chunk (cn.chunk_tag).
+
+    The summed summary values are a lower bound on each total overlap, and
+    adding the values each chunk left out gives an upper bound. Rows
+    where another column's upper bound could reach the best lower bound
+    are ambiguous, and need the full overlap entries for an exact answer.
+
+    Returns a coo_matrix with the best column for each row according to
+    the summaries, and an array of the ambiguous row ids.
+    """
+    if len(topk_df) == 0:
+        return (sparse.coo_matrix(([], ([], [])), shape=(0, 0)),
+                np.array([], dtype=np.uint64))
+
+    # total left out of each row across the chunks containing it
+    chunk_rows = topk_df.drop_duplicates([cn.rows, cn.chunk_tag])
+    row_bounds = chunk_rows.groupby(cn.rows)[cn.ovl_bound].sum()
+
+    pairs = topk_df.groupby([cn.rows, cn.cols])[[cn.vals, cn.ovl_bound]]
+    pairs = pairs.sum().reset_index()
+
+    # a column can only be missing from chunks where it was left out
+    upper = (pairs[cn.vals] + pairs[cn.rows].map(row_bounds)
+             - pairs[cn.ovl_bound])
+
+    pairs = pairs.sort_values([cn.rows, cn.vals, cn.cols],
+                              ascending=[True, False, True])
+    best = pairs.drop_duplicates(cn.rows).set_index(cn.rows)
+
+    best_vals = pairs[cn.rows].map(best[cn.vals])
+    best_cols = pairs[cn.rows].map(best[cn.cols])
+    upper = upper.loc[pairs.index]
+
+    contested = ((pairs[cn.cols] != best_cols)
+                 & ((upper > best_vals)
+                    | ((upper == best_vals) & (pairs[cn.cols] < best_cols))))
+
+    # columns absent from every summary of a row
+    hidden = row_bounds[row_bounds >= best[cn.vals].loc[row_bounds.index]]
+
+    ambiguous = np.union1d(pairs[cn.rows][contested].values,
+                           hidden.index.values)
+
+    max_overlaps = sparse.coo_matrix((best[cn.vals].values,
+                                      (best.index.values,
+                                       best[cn.cols].values)))
+
+    return max_overlaps, ambiguous
+
+
+def replace_rows(max_overlaps, new_max_overlaps):
+    """
+    Replaces the rows of a max overlap matrix with those of another,
+    keeping the rows which aren't represented in the new matrix
+    """
+    kept = ~np.isin(max_overlaps.row, new_max_overlaps.row)
 
-    maxima = {}
-    max_overlaps = {}
-    for (i, j, v) in zip(overlap_mat.row, overlap_mat.col, overlap_mat.data):
-        if (i not in maxima) or (v > maxima[i]):
-            maxima[i] = v
-            max_overlaps[i] = j
+    rs = np.concatenate((max_overlaps.row[kept], new_max_overlaps.row))
+    cs = np.concatenate((max_overlaps.col[kept], new_max_overlaps.col))
+    vs = np.concatenate((max_overlaps.data[kept], new_max_overlaps.data))
 
-    rs = list(max_overlaps.keys())
-    cs = list(max_overlaps[k] for k in rs)
-    vs = list(maxima[k] for k in rs)
+    if len(vs) == 0:
+        return sparse.coo_matrix(([], ([], [])), shape=(0, 0))
 
     return sparse.coo_matrix((vs, (rs, cs)))
 
@@ -8,6 +8,6 @@ from . import partnerprox
 from .partnerprox import find_prox_terminals
 
 from . import continuation
-from .continuation import hash_chunk_faces
+from .continuation import hash_chunk_faces, face_sizes
 
 from . import merge
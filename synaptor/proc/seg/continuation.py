@@ -133,6 +133,12 @@ def make_id_lookup(face_arr):
     return lookup
 
 
+def face_sizes(continuations):
+    """ Counts the continuation voxels on each face: face -> count """
+    return {face: sum(len(c.face_coords) for c in contins)
+            for (face, contins) in continuations.items()}
+
+
 def hash_chunk_faces(chunk_begin, chunk_end, maxval):
     """
     Need a hash function which maps opposite ends of adjacent chunks
@@ -1,14 +1,17 @@
 from . import assign_ids
-from .assign_ids import assign_unique_ids_serial 
+from .assign_ids import assign_unique_ids_serial, chunk_id_offsets
 from .assign_ids import apply_chunk_id_maps, update_chunk_id_maps
-from .assign_ids import apply_id_map
+from .assign_ids import apply_id_map, update_changed_id_maps
+from .assign_ids import threshold_changed_id_maps
 
 from . import merge_ccs
 from .merge_ccs import find_connected_continuations, merge_continuations
 from .merge_ccs import pair_continuation_files, match_continuations
+from .merge_ccs import pair_new_faces, match_face_pairs
 
 from . import merge_df
 from .merge_df import merge_seginfo_df, enforce_size_threshold, add_new_ids
+from .merge_df import append_seginfo_df
 
 from . import misc
 from .misc import expand_id_map
@@ -1,30 +1,45 @@
 """ Connected Component ID management """
 
 
+import itertools
+
 import numpy as np
 import pandas as pd
 
+from ....types import IdMap
+
 
-def assign_unique_ids_serial(cleft_info_arr):
-    """ Assigns new ids to every cleft segment """
+def assign_unique_ids_serial(cleft_info_arr, first_id=1):
+    """ Assigns new ids to every cleft segment, starting with first_id """
 
-    # init
+    offsets = chunk_id_offsets(cleft_info_arr, first_id)
     chunk_id_maps = empty_obj_array(cleft_info_arr.shape)
-    df_parts = []
-    next_id = 1
 
-    for (x, y, z) in np.ndindex(cleft_info_arr.shape):
+    # each chunk's ids are fixed by its offset, so chunks can be
+    # relabeled independently
+    for index in np.ndindex(cleft_info_arr.shape):
 
-        new_df = cleft_info_arr[x, y, z]
-        chunk_id_maps[x, y, z], next_id = new_id_map(new_df, next_id)
+        new_df = cleft_info_arr[index]
+        chunk_id_maps[index], _ = new_id_map(new_df, offsets[index])
 
-        df_parts.append(remap_ids(new_df, chunk_id_maps[x, y, z]))
+        remap_ids(new_df, chunk_id_maps[index])
 
-    full_df = pd.concat(df_parts, copy=False)
+    full_df = pd.concat(list(cleft_info_arr.flat), copy=False)
 
     return full_df, chunk_id_maps
 
 
+def chunk_id_offsets(cleft_info_arr, first_id=1):
+    """
+    Returns the first new id for each chunk (in C-order) as an exclusive
+    prefix sum of the chunk segment counts
+    """
+    counts = np.array([len(df) for df in cleft_info_arr.flat], dtype=np.int64)
+    offsets = first_id + np.cumsum(counts) - counts
+
+    return offsets.reshape(cleft_info_arr.shape)
+
+
 def empty_obj_array(shape):
     size = np.prod(shape)
 
@@ -34,17 +49,16 @@ def empty_obj_array(shape):
 def new_id_map(df, next_id):
     """ Creates a new id for each record in df, starting with next_id """
 
-    segids = df.index.tolist()
+    segids = df.index.values
+    new_ids = np.arange(next_id, next_id+len(segids), dtype=np.int64)
 
-    id_map = {segid: n for (segid, n) in
-              zip(segids, range(next_id, next_id+len(segids)))}
-
-    return id_map, next_id+len(segids)
+    return IdMap(segids, new_ids), next_id+len(segids)
 
 
 def remap_ids(df, id_map):
-    """ Remaps the index ids of a dataframe """
-    df.rename(id_map, inplace=True)
+    """ Remaps the index ids of a dataframe in place """
+    new_ids = IdMap.from_dict(id_map).apply(df.index.values)
+    df.index = pd.Index(new_ids, name=df.index.name)
 
     return df
 
@@ -62,13 +76,15 @@ def apply_id_map(continuations, id_map):
     Applies an id map to a set of continuations organized in
     dictionaries: face -> [continuations]
     """
-    if not isinstance(continuations, dict):
-        for continuation in continuations:
-            continuation.segid = id_map[continuation.segid]
-    else:
-        for (face, conts) in continuations.items():
-            for continuation in conts:
-                continuation.segid = id_map[continuation.segid]
+    if isinstance(continuations, dict):
+        continuations = itertools.chain(*continuations.values())
+    continuations = list(continuations)
+
+    segids = np.array([c.segid for c in continuations])
+    new_segids = IdMap.from_dict(id_map).lookup(segids).tolist()
+
+    for (continuation, segid) in zip(continuations, new_segids):
+        continuation.segid = segid
 
 
 def update_chunk_id_maps(chunk_id_maps, cont_id_map):
@@ -77,8 +93,50 @@ def update_chunk_id_maps(chunk_id_maps, cont_id_map):
     chunk id map
     """
 
-    for mapping in chunk_id_maps.flat:
-        for (k, v) in mapping.items():
-            mapping[k] = cont_id_map.get(v, v)
+    cont_id_map = IdMap.from_dict(cont_id_map)
+
+    for (i, mapping) in enumerate(chunk_id_maps.flat):
+        chunk_id_maps.flat[i] = IdMap.from_dict(mapping).compose(
+                                    cont_id_map, include_new=False)
 
     return chunk_id_maps
+
+
+def update_changed_id_maps(chunk_id_maps, cont_id_map):
+    """
+    Applies cont_id_map after each id map within a dict of chunk id maps.
+    Returns a dict of only the updated maps that changed.
+    """
+    cont_id_map = IdMap.from_dict(cont_id_map)
+
+    changed = dict()
+    for (key, mapping) in chunk_id_maps.items():
+        mapping = IdMap.from_dict(mapping)
+        updated = mapping.compose(cont_id_map, include_new=False)
+
+        if not np.array_equal(updated.values(), mapping.values()):
+            changed[key] = updated
+
+    return changed
+
+
+def threshold_changed_id_maps(chunk_id_maps, size_thr_map, old_id_maps):
+    """
+    Applies a size threshold map after each (unthresholded) id map within
+    a dict of chunk id maps. Returns a dict of only the thresholded maps
+    that differ from those in old_id_maps.
+    """
+    size_thr_map = IdMap.from_dict(size_thr_map)
+
+    changed = dict()
+    for (key, mapping) in chunk_id_maps.items():
+        updated = IdMap.from_dict(mapping).compose(size_thr_map,
+                                                   include_new=False)
+
+        old = old_id_maps.get(key)
+        if (old is None or
+                not np.array_equal(updated.keys(), old.keys()) or
+                not np.array_equal(updated.values(), old.values())):
+            changed[key] = updated
+
+    return changed
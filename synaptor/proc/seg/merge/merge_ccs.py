@@ -13,16 +13,7 @@ def pair_continuation_files(contin_files):
     pairs = dict()
 
     for contin_file in contin_files:
-        if contin_file.face.hi_index:
-            hash_input = (*contin_file.bbox.max(), contin_file.face.axis)
-
-        else:
-            bbox_min, bbox_max = contin_file.bbox.min(), contin_file.bbox.max()
-
-            chunk_id = list(bbox_max)
-            chunk_id[contin_file.face.axis] = bbox_min[contin_file.face.axis]
-
-            hash_input = (*chunk_id, contin_file.face.axis)
+        hash_input = face_key(contin_file.bbox, contin_file.face)
 
         pairs[hash_input] = pairs.get(hash_input, []) + [contin_file]
 
@@ -32,6 +23,54 @@ def pair_continuation_files(contin_files):
     return unique_files
 
 
+def face_key(bbox, face):
+    """ Identifies a face by the coordinates shared by both of its sides """
+    if face.hi_index:
+        return (*bbox.max(), face.axis)
+
+    else:
+        bbox_min, bbox_max = bbox.min(), bbox.max()
+
+        chunk_id = list(bbox_max)
+        chunk_id[face.axis] = bbox_min[face.axis]
+
+        return (*chunk_id, face.axis)
+
+
+def pair_new_faces(new_bounds, old_bounds):
+    """
+    Finds the faces that new chunks share with other new chunks or with
+    old (already merged) chunks. Faces between two old chunks are skipped.
+
+    Returns a list of ((bounds, face), (bounds, face)) pairs
+    """
+    sides = dict()
+
+    for (bounds_list, is_new) in ((new_bounds, True), (old_bounds, False)):
+        for bounds in bounds_list:
+            for face in continuation.Face.all_faces():
+                key = face_key(bounds, face)
+                sides[key] = sides.get(key, []) + [(bounds, face, is_new)]
+
+    return list(((b1, f1), (b2, f2))
+                for ((b1, f1, new1), (b2, f2, new2))
+                in (s for s in sides.values() if len(s) == 2)
+                if new1 or new2)
+
+
+def match_face_pairs(face_pairs, face_shape=(1152, 1152)):
+    """
+    Determines which continuations match across each pair of
+    continuation lists
+    """
+    matches = []
+    for (conts1, conts2) in face_pairs:
+        matches.extend(match_continuations(conts1, conts2,
+                                           face_shape=face_shape))
+
+    return matches
+
+
 def merge_continuations(continuation_arr, overlap_df=None,
                         max_face_shape=(1152, 1152), overlap_col=cn.ovl_segid):
     """
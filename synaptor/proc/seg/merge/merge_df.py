@@ -1,11 +1,20 @@
 """ Merging Segment Info Dataframes. """
 
 
+import numpy as np
 import pandas as pd
 
+from ....types import IdMap
+from ... import utils
 from ... import colnames as cn
 
 
+SEGINFO_AGGS = {cn.size: "sum",
+                **{col: "mean" for col in cn.centroid_cols},
+                **{col: "min" for col in cn.bbox_cols[:3]},
+                **{col: "max" for col in cn.bbox_cols[3:]}}
+
+
 def add_new_ids(seginfo_df, mapping, new_id_colname="new_ids"):
     seginfo_df[new_id_colname] = seginfo_df.index.map(mapping)
 
@@ -16,49 +25,36 @@ def merge_seginfo_df(seginfo_df, new_id_colname="new_ids"):
     if "index" in seginfo_df.columns:
         seginfo_df = seginfo_df.drop(["index"], axis=1)
 
-    # computing grouped stats
-    grouped = seginfo_df.groupby(new_id_colname)
-    szs = grouped[cn.size].sum()
-    bbox1 = grouped[cn.bbox_cols[:3]].min()
-    bbox2 = grouped[cn.bbox_cols[-3:]].max()
-    coms = compute_centroids(seginfo_df, szs, new_id_colname=new_id_colname)
-
-    # setting index to the original if not remapped
-    no_new_id = pd.isnull(seginfo_df[new_id_colname])
-    seginfo_df.loc[no_new_id, new_id_colname] = seginfo_df.loc[no_new_id,
-                                                              cn.seg_id]
-    # taking all other fields from largest cleft
-    new_df = seginfo_df.sort_values([cn.size]).drop_duplicates(new_id_colname)
-
-    # recreating index
-    new_df = new_df.drop([cn.seg_id], axis=1)
-    new_df = new_df.rename(columns={new_id_colname: cn.seg_id})
-    new_df = new_df.set_index(cn.seg_id)
-
-    new_df.update(coms)
-    new_df.update(bbox1)
-    new_df.update(bbox2)
-    new_df.update(szs)
-
-    return new_df
+    return merge_rows_by_new_id(seginfo_df, new_id_colname,
+                                centroid_dtype=int)
 
 
-def compute_centroids(df, szs, new_id_colname="new_ids"):
+def merge_rows_by_new_id(df, new_id_colname, centroid_dtype=None):
+    """
+    Merges the rows of a dataframe (with a cn.seg_id column) that share a
+    new id. Rows without a new id keep their own seg id. Sizes are summed,
+    bboxes take the min/max, centroids are size-weighted, and all other
+    fields come from the largest row (the first such row for ties).
 
-    szs = szs.reset_index()
-    szs = szs.rename(columns={cn.size: "total_size"})
+    Returns a dataframe indexed by the new (cn.seg_id) ids in sorted order.
+    """
+    if len(df) == 0:
+        return df.drop([new_id_colname], axis=1).set_index(cn.seg_id)
 
-    centroid_df = pd.merge(df[cn.centroid_cols + [cn.size, new_id_colname]],
-                           szs, how="left", on=new_id_colname)
+    seg_ids = df[cn.seg_id].values
+    new_ids = df[new_id_colname].values
+    no_new_id = pd.isnull(new_ids)
+    new_ids = np.where(no_new_id, seg_ids, new_ids).astype(seg_ids.dtype)
 
-    # This will create NANs, but those will disappear after grouping
-    centroid_df[cn.size] /= centroid_df["total_size"]
+    new_df = utils.reduce_groups(df.drop([cn.seg_id, new_id_colname], axis=1),
+                                 new_ids, aggs=SEGINFO_AGGS)
+    new_df.index.name = cn.seg_id
 
-    centroid_df[cn.centroid_x] *= centroid_df[cn.size]
-    centroid_df[cn.centroid_y] *= centroid_df[cn.size]
-    centroid_df[cn.centroid_z] *= centroid_df[cn.size]
+    if centroid_dtype is not None:
+        new_df[cn.centroid_cols] = new_df[cn.centroid_cols].astype(
+                                       centroid_dtype)
 
-    return centroid_df.groupby(new_id_colname)[cn.centroid_cols].sum().astype(int)
+    return new_df
 
 
 def enforce_size_threshold(seginfo_df, size_thr):
@@ -66,3 +62,30 @@ def enforce_size_threshold(seginfo_df, size_thr):
     seginfo_df.drop(violations.tolist(), inplace=True)
 
     return {v: 0 for v in violations}
+
+
+def append_seginfo_df(merged_df, new_df, matches):
+    """
+    Merges the segments of new_df into an already merged dataframe, joining
+    the segments connected by matches. Each component takes its smallest id,
+    so existing segments keep their ids when new ones attach to them.
+    merged_df should hold every merged segment from before the size
+    threshold, so that new segments can bring back the ones it removed.
+
+    Returns the updated dataframe (without a size threshold), and an id
+    map for the new ids and the matched existing ids
+    """
+    ccs = utils.find_connected_components(matches)
+    cc_map = IdMap.from_dict(utils.make_id_map(ccs))
+    cc_map = cc_map.expand(new_df.index.values)
+
+    touched = np.intersect1d(cc_map.keys(), merged_df.index.values)
+    to_merge = pd.concat((merged_df.loc[touched], new_df))
+    to_merge.index.name = cn.seg_id
+    to_merge[cn.dst_id] = cc_map.apply(to_merge.index.values)
+
+    merged_rows = merge_seginfo_df(to_merge, new_id_colname=cn.dst_id)
+
+    appended = pd.concat((merged_df.drop(touched), merged_rows)).sort_index()
+
+    return appended, cc_map
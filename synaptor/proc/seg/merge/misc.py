@@ -2,6 +2,7 @@
 
 import pandas as pd
 
+from ....types import IdMap
 from ... import colnames as cn
 
 
@@ -10,11 +11,7 @@ def make_map_dframe(id_map):
     if len(id_map) == 0:
         return empty_map_df()
 
-    mapping_dict = dict(enumerate(id_map.items()))
-    df = pd.DataFrame.from_dict(mapping_dict, orient="index")
-    df.columns = [cn.src_id, cn.dst_id]
-
-    return df
+    return IdMap.from_dict(id_map).to_dframe(cn.src_id, cn.dst_id)
 
 
 def empty_map_df():
@@ -24,10 +21,4 @@ def empty_map_df():
 
 def expand_id_map(id_map, all_ids):
     """ Ensures all ids within all_ids are included as keys in the mapping """
-
-    unmapped_ids = list(set(all_ids).difference(id_map.keys()))
-
-    for i in unmapped_ids:
-        id_map[i] = i
-
-    return id_map
+    return IdMap.from_dict(id_map).expand(all_ids)
@@ -14,21 +14,24 @@ def find_prox_terminals(prox, seg=None, presyn_thresh=0,
     Threshold partner-signed proximity and make segments which represent
     pre- and post-synaptic terminals
     """
-    presyn_v = prox > presyn_thresh
-    postsyn_v = prox < postsyn_thresh
+    presyn_ccs = find_terminals(prox > presyn_thresh, seg, sz_thresh)
+    postsyn_ccs = find_terminals(prox < postsyn_thresh, seg, sz_thresh)
 
-    presyn_ccs = conncomps.connected_components(presyn_v)
-    postsyn_ccs = conncomps.connected_components(postsyn_v)
+    return presyn_ccs, postsyn_ccs
 
-    if seg is not None:
-        presyn_ccs = seg_utils.split_by_overlap(presyn_ccs, seg)
-        postsyn_ccs = seg_utils.split_by_overlap(postsyn_ccs, seg)
 
-        presyn_ccs[seg == 0] = 0
-        postsyn_ccs[seg == 0] = 0
+def find_terminals(threshed_prox, seg=None, sz_thresh=0):
+    """
+    Make terminal segments from one side of thresholded partner-signed
+    proximity
+    """
+    ccs = conncomps.connected_components(threshed_prox)
+
+    if seg is not None:
+        # also removes voxels outside of the segmentation
+        ccs = seg_utils.relabel_pairs(ccs, seg, dtype=ccs.dtype)
 
     if sz_thresh > 0:
-        presyn_ccs = seg_utils.filter_segs_by_size(presyn_ccs, sz_thresh)[0]
-        postsyn_ccs = seg_utils.filter_segs_by_size(postsyn_ccs, sz_thresh)[0]
+        ccs = seg_utils.filter_segs_by_size(ccs, sz_thresh)[0]
 
-    return presyn_ccs, postsyn_ccs
+    return ccs
@@ -70,7 +70,8 @@ def cc_task(desc_vol, cc_thresh, sz_thresh,
 
 
 def merge_ccs_task(cont_info_arr, cleft_info_arr,
-                   size_thr, max_face_shape, enforce_overlaps=False):
+                   size_thr, max_face_shape, enforce_overlaps=False,
+                   return_unthresholded=False):
     """
     -Assigns a global set of cleft segment ids
     -Finds which continuations match across chunks
@@ -82,6 +83,8 @@ def merge_ccs_task(cont_info_arr, cleft_info_arr,
     Returns:
         -A single DataFrame for all merged clefts
         -A nparray of id maps for each chunk
+        -(if return_unthresholded) The DataFrame and id maps from before
+         the size threshold (see append_ccs_task)
     """
 
     cons_cleft_info, chunk_id_maps = timed("Assigning new cleft ids",
@@ -111,6 +114,9 @@ def merge_ccs_task(cont_info_arr, cleft_info_arr,
                             seg.merge.merge_seginfo_df,
                             cons_cleft_info, new_id_colname=cn.dst_id)
 
+    unthr_cleft_info = cons_cleft_info.copy()
+    unthr_id_maps = chunk_id_maps.copy()
+
     size_thr_map = timed("Enforcing size threshold over merged ccs",
                          seg.merge.enforce_size_threshold,
                          cons_cleft_info, size_thr)
@@ -119,9 +125,64 @@ def merge_ccs_task(cont_info_arr, cleft_info_arr,
                           seg.merge.update_chunk_id_maps,
                           chunk_id_maps, size_thr_map)
 
+    if return_unthresholded:
+        return (cons_cleft_info, chunk_id_maps,
+                unthr_cleft_info, unthr_id_maps)
+
     return cons_cleft_info, chunk_id_maps
 
 
+def append_ccs_task(merged_cleft_info, cleft_info_arr, cont_info_arr,
+                    face_pairs, size_thr, max_face_shape, next_id):
+    """
+    -Assigns cleft segment ids to new chunks, starting with next_id
+    -Finds which continuations match across the faces of the new chunks
+     (face_pairs holds the continuation lists on either side of each face.
+      The lists of new chunks should be those within cont_info_arr, and
+      those of old chunks should already map to merged ids from before
+      the size threshold)
+    -Merges the matching segments into the merged cleft info (which
+     should also be from before the size threshold)
+    -Maps any cleft segments to 0 if they're under the size threshold
+
+    Returns:
+        -The updated DataFrame for all merged clefts
+        -The updated DataFrame from before the size threshold
+        -A nparray of id maps for each new chunk (before the size threshold)
+        -An id map to apply after the unthresholded id maps of the old chunks
+        -The size threshold id map
+    """
+
+    new_cleft_info, chunk_id_maps = timed("Assigning new cleft ids",
+                                          seg.merge.assign_unique_ids_serial,
+                                          cleft_info_arr, first_id=next_id)
+
+    cont_info_arr = timed("Applying chunk_id_maps to continuations",
+                          seg.merge.apply_chunk_id_maps,
+                          cont_info_arr, chunk_id_maps)
+
+    matches = timed("Matching continuations across new faces",
+                    seg.merge.match_face_pairs,
+                    face_pairs, face_shape=max_face_shape)
+
+    unthr_cleft_info, append_id_map = timed("Appending cleft dataframes",
+                                            seg.merge.append_seginfo_df,
+                                            merged_cleft_info, new_cleft_info,
+                                            matches)
+
+    chunk_id_maps = timed("Updating chunk id maps",
+                          seg.merge.update_chunk_id_maps,
+                          chunk_id_maps, append_id_map)
+
+    merged_cleft_info = unthr_cleft_info.copy()
+    size_thr_map = timed("Enforcing size threshold over merged ccs",
+                         seg.merge.enforce_size_threshold,
+                         merged_cleft_info, size_thr)
+
+    return (merged_cleft_info, unthr_cleft_info, chunk_id_maps,
+            append_id_map, size_thr_map)
+
+
 def match_continuations_task(contins1, contins2, max_face_shape=(1024, 1024),
                              id_map1=None, id_map2=None):
 
@@ -183,11 +244,13 @@ def merge_seginfo_task(seginfo_dframe, szthresh=None):
 def edge_task(img, clefts, seg, assoc_net,
               patchsz, offset=(0, 0, 0), root_seg=None,
               samples_per_cleft=2, dil_param=5,
-              id_map=None, hashmax=None, hash_fillval=-1):
+              id_map=None, hashmax=None, hash_fillval=-1,
+              group_shift=0, max_group_size=8, num_workers=2):
     """
     -Applies an id map to a chunk (if passed)
     NOTE: Modifies the clefts array if id_map exists
     -Applies an assignment network to each cleft in the chunk
+     (clefts with nearly coinciding patches share a forward pass)
     -Computes the sizes of each cleft to assist later thresholding
     -Returns all of the computed information in a DataFrame
 
@@ -205,7 +268,9 @@ def edge_task(img, clefts, seg, assoc_net,
                   assoc_net, img, clefts, seg,
                   offset=offset, patchsz=patchsz,
                   samples_per_cleft=samples_per_cleft,
-                  root_seg=root_seg, dil_param=dil_param)
+                  root_seg=root_seg, dil_param=dil_param,
+                  group_shift=group_shift, max_group_size=max_group_size,
+                  num_workers=num_workers)
 
     edges = timed("Computing cleft size and adding it to dframe",
                   edge.add_cleft_sizes,
@@ -311,6 +376,58 @@ def merge_overlaps_task(overlaps_arr):
                  full_overlap)
 
 
+def overlap_topk_task(overlap_mat, topk):
+    """
+    Summarizes each row of a chunk overlap matrix by its topk largest
+    entries, along with the largest value left out of each row
+    """
+    return timed(f"Summarizing top {topk} overlaps per segment",
+                 overlap.top_k_overlaps,
+                 overlap_mat, topk)
+
+
+def merge_overlap_topk_task(topk_df):
+    """
+    -Merges the chunk top-k overlap summaries
+    -Returns a mapping from segment to base segment of max overlap
+     according to the summaries, and the segments whose maximum is
+     ambiguous without the full overlap entries
+    """
+    return timed("Merging top-k overlap summaries",
+                 overlap.merge_top_k_overlaps,
+                 topk_df)
+
+
+def resolve_ambiguous_overlaps_task(max_overlaps, ambiguous_overlaps):
+    """
+    -Finds the exact maximal overlaps for the ambiguous segments of a
+     top-k merge using their full overlap entries
+    -Returns the combined mapping
+    """
+    timed("Summing duplicate overlap entries",
+          ambiguous_overlaps.sum_duplicates)
+
+    exact_overlaps = timed("Finding exact maximal overlaps",
+                           overlap.find_max_overlaps,
+                           ambiguous_overlaps)
+
+    return overlap.overlap.replace_rows(max_overlaps, exact_overlaps)
+
+
+def merge_hashed_overlaps_task(overlap_mat):
+    """
+    -Sums the entries of a row hash partition of the chunk overlap matrices
+    -Returns a mapping from segment to base segment of max overlap
+     for the segments within that partition
+    """
+    timed("Summing duplicate overlap entries",
+          overlap_mat.sum_duplicates)
+
+    return timed("Finding segments with maximal overlap",
+                 overlap.find_max_overlaps,
+                 overlap_mat)
+
+
 def remap_ids_task(clefts, *id_maps, copy=False):
     """
     -Maps the ids within clefts according to a list of id_maps
@@ -335,14 +452,16 @@ def remap_ids_task(clefts, *id_maps, copy=False):
 
 def anchor_task(edge_info, seg, clf, chunk_begin,
                 voxel_res=[4, 4, 40], min_box_width=[100, 100, 5],
-                root_seg=None):
+                root_seg=None, num_workers=0):
     """
     -Places centralized anchor points for presynaptic and postsynaptic
-    terminals
+    terminals (over num_workers processes if > 0)
+    -Records the root_seg ids at each anchor point (if passed)
     """
 
     return timed("Placing anchor points",
                  anchor.place_anchor_pts,
                  edge_info, seg, clf, verbose=True,
                  voxel_res=voxel_res, offset=chunk_begin,
-                 min_box_width=min_box_width, root_seg=root_seg)
+                 min_box_width=min_box_width, wshed=root_seg,
+                 num_workers=num_workers)
@@ -7,6 +7,8 @@ Storage) or (2) a SQLAlchemy-supported database.
 
 import time
 
+import numpy as np
+
 from .. import io
 from .. import types
 from .. import seg_utils
@@ -15,13 +17,55 @@ from . import tasks
 from .tasks import timed
 from . import seg
 from . import edge
+from . import hashing
 from . import colnames as cn
 
 
+def cc_params_hash(desc_cvname, seg_cvname, cc_thresh, sz_thresh,
+                   mip=0, hashmax=100):
+    """ Fingerprints the parameters which determine cc_task's outputs """
+    return hashing.fingerprint(desc_cvname=desc_cvname, seg_cvname=seg_cvname,
+                               cc_thresh=cc_thresh, sz_thresh=sz_thresh,
+                               mip=mip, hashmax=hashmax)
+
+
+def edge_params_hash(img_cvname, cleft_cvname, seg_cvname, patchsz,
+                     samples_per_cleft=2, dil_param=5, resolution=(4, 4, 40),
+                     num_downsamples=0, hashmax=None, group_shift=0,
+                     max_group_size=8):
+    """ Fingerprints the parameters which determine edge_task's outputs """
+    return hashing.fingerprint(img_cvname=img_cvname,
+                               cleft_cvname=cleft_cvname,
+                               seg_cvname=seg_cvname, patchsz=patchsz,
+                               samples_per_cleft=samples_per_cleft,
+                               dil_param=dil_param, resolution=resolution,
+                               num_downsamples=num_downsamples,
+                               hashmax=hashmax, group_shift=group_shift,
+                               max_group_size=max_group_size)
+
+
+def inputs_unchanged(storagestr, task_name, chunk_bounds,
+                     params_hash, input_hash):
+    """
+    Checks whether the last run of a task over a chunk used the same
+    parameters and inputs (so its outputs are already up to date)
+    """
+    manifest = timed("Reading task manifest",
+                     taskio.read_task_manifest,
+                     storagestr, task_name, chunk_bounds)
+
+    if manifest != (params_hash, input_hash):
+        return False
+
+    print(f"Inputs unchanged since the last {task_name} task"
+          f" for {chunk_bounds}, skipping")
+    return True
+
+
 def cc_task(desc_cvname, seg_cvname, storagestr,
             cc_thresh, sz_thresh, chunk_begin, chunk_end,
             mip=0, parallel=1, storagedir=None, hashmax=100,
-            timing_tag=None):
+            timing_tag=None, skip_unchanged=False):
 
     start_time = time.time()
 
@@ -33,6 +77,16 @@ def cc_task(desc_cvname, seg_cvname, storagestr,
                      desc_cvname, chunk_bounds,
                      mip=mip, parallel=parallel)
 
+    params_hash = cc_params_hash(desc_cvname, seg_cvname, cc_thresh,
+                                 sz_thresh, mip=mip, hashmax=hashmax)
+    input_hash = timed("Fingerprinting inputs",
+                       hashing.fingerprint,
+                       desc_vol)
+
+    if skip_unchanged and inputs_unchanged(storagestr, "ccs", chunk_bounds,
+                                           params_hash, input_hash):
+        return
+
     ccs, continuations, seg_info = tasks.cc_task(desc_vol,
                                                  cc_thresh, sz_thresh,
                                                  offset=chunk_begin)
@@ -55,26 +109,43 @@ def cc_task(desc_cvname, seg_cvname, storagestr,
         fhash_df, fhash_tablename = timed("Formatting chunk face hashes",
                                           taskio.prep_face_hashes,
                                           face_hashes, chunk_bounds,
-                                          storagedir)
+                                          storagedir,
+                                          face_sizes=seg.face_sizes(
+                                                         continuations))
 
         seginfo_df, seginfo_tablename = timed("Formatting segment info",
                                               taskio.prep_chunk_seg_info,
                                               seg_info, chunk_bounds)
 
+        # the faces of this chunk need to be matched again
+        dirty_df, dirty_tablename = taskio.prep_dirty_buckets(
+                                        "match_contins", face_hashes.values())
+
+        # rows from an earlier run over this chunk would otherwise
+        #  remain alongside the new ones
+        outdated = [taskio.outdated_chunk_seg_info(storagestr, chunk_bounds),
+                    taskio.outdated_face_hashes(
+                        storagestr, fhash_df[cn.contin_filename])]
+
         # NOTE: need to send these as a transaction. Otherwise,
         #  you can create "phantom" segments in the database that don't
         #  really exist in the segmentation volume.
         #  These phantoms create further problems later.
         timed("Writing results to the database",
               io.write_db_dframes,
-              [fhash_df, seginfo_df], storagestr,
-              [fhash_tablename, seginfo_tablename])
+              [fhash_df, seginfo_df, dirty_df], storagestr,
+              [fhash_tablename, seginfo_tablename, dirty_tablename],
+              statements=outdated)
 
     else:  # file storage backend
         timed("Writing seg info to storage",
               taskio.write_chunk_seg_info,
               seg_info, storagestr, chunk_bounds)
 
+    timed("Writing task manifest",
+          taskio.write_task_manifest,
+          params_hash, input_hash, "ccs", chunk_bounds, storagestr)
+
     if timing_tag is not None:
         timed("Writing total task time",
               taskio.write_task_timing,
@@ -96,10 +167,20 @@ def merge_ccs_task(storagestr, size_thr, max_face_shape, timing_tag=None):
     chunk_bounds = io.extract_sorted_bboxes(local_dir)
 
     # Processing
-    cons_cleft_info, chunk_id_maps = tasks.merge_ccs_task(cont_info_arr,
-                                                          cleft_info_arr,
-                                                          size_thr,
-                                                          max_face_shape)
+    (cons_cleft_info, chunk_id_maps,
+     unthr_cleft_info, unthr_id_maps) = tasks.merge_ccs_task(
+                                            cont_info_arr, cleft_info_arr,
+                                            size_thr, max_face_shape,
+                                            return_unthresholded=True)
+
+    # the state before the size threshold is kept for append_ccs_task
+    timed("Writing unthresholded cleft info",
+          taskio.write_unthresholded_seg_info,
+          unthr_cleft_info, storagestr)
+
+    timed("Writing unthresholded chunk id maps",
+          taskio.write_chunk_id_maps,
+          unthr_id_maps, chunk_bounds, storagestr, unthresholded=True)
 
     timed("Writing merged cleft info",
           taskio.write_merged_seg_info,
@@ -115,6 +196,141 @@ def merge_ccs_task(storagestr, size_thr, max_face_shape, timing_tag=None):
               time.time() - start_time, "merge_ccs", timing_tag, storagestr)
 
 
+def append_ccs_task(storagestr, size_thr, max_face_shape, timing_tag=None):
+    """
+    Merges the chunks without an id map (i.e. those added since the last
+    merge) into a merged file workspace. Only the faces that touch a new
+    chunk are matched, and old chunk id maps are only rewritten if their
+    merged ids change.
+
+    Appending works from the merged state before the size threshold (written
+    by merge_ccs_task), so new segments can bring back the old segments
+    that the threshold removed, and the result matches a full merge.
+    """
+
+    start_time = time.time()
+
+    old_id_maps = timed("Reading chunk id maps",
+                        taskio.read_all_chunk_id_maps,
+                        storagestr)
+
+    new_cleft_infos = timed("Reading new cleft infos",
+                            taskio.read_new_chunk_seg_infos,
+                            storagestr, old_id_maps.keys())
+
+    if len(new_cleft_infos) == 0:
+        print("No new chunks to append")
+        return
+
+    unthr_id_maps = timed("Reading unthresholded chunk id maps",
+                          taskio.read_all_chunk_id_maps,
+                          storagestr, unthresholded=True)
+
+    # workspaces merged before the unthresholded state was written
+    fallback = len(unthr_id_maps) == 0 and len(old_id_maps) > 0
+    if fallback:
+        print("WARNING: no unthresholded id maps found. Old segments removed"
+              " by the size threshold will stay removed")
+        unthr_id_maps = old_id_maps
+        merged_cleft_info = timed("Reading merged cleft info",
+                                  taskio.read_merged_seg_info,
+                                  storagestr)
+    else:
+        merged_cleft_info = timed("Reading unthresholded cleft info",
+                                  taskio.read_unthresholded_seg_info,
+                                  storagestr)
+
+    new_bounds = sorted(new_cleft_infos.keys(), key=lambda bb: bb.min())
+    cleft_info_arr = np.empty((len(new_bounds),), dtype=object)
+    cont_info_arr = np.empty((len(new_bounds),), dtype=object)
+    for (i, bounds) in enumerate(new_bounds):
+        cleft_info_arr[i] = new_cleft_infos[bounds]
+        cont_info_arr[i] = taskio.read_chunk_continuations(storagestr, bounds)
+
+    # old faces are read as needed and mapped to their merged ids
+    face_pairs = seg.merge.pair_new_faces(new_bounds, old_id_maps.keys())
+    old_faces = list(set(side for pair in face_pairs for side in pair
+                         if side[0] not in new_cleft_infos))
+
+    old_contins = timed("Reading old continuations",
+                        taskio.read_face_filenames,
+                        [taskio.face_filename(storagestr, bounds, face)
+                         for (bounds, face) in old_faces])
+
+    face_contins = dict(zip(old_faces, old_contins))
+    for ((bounds, face), contins) in face_contins.items():
+        seg.merge.apply_id_map(contins, unthr_id_maps[bounds])
+
+    for (bounds, contin_dict) in zip(new_bounds, cont_info_arr):
+        for (face, contins) in contin_dict.items():
+            face_contins[(bounds, face)] = contins
+
+    contin_pairs = [(face_contins[side1], face_contins[side2])
+                    for (side1, side2) in face_pairs]
+
+    next_id = 1 + max([np.max(merged_cleft_info.index.values, initial=0),
+                       *(np.max(id_map.values(), initial=0)
+                         for id_map in unthr_id_maps.values())])
+
+    # Processing
+    (merged_cleft_info, unthr_cleft_info, unthr_new_maps,
+     append_id_map, size_thr_map) = tasks.append_ccs_task(
+                                        merged_cleft_info, cleft_info_arr,
+                                        cont_info_arr, contin_pairs,
+                                        size_thr, max_face_shape, next_id)
+
+    changed_unthr_maps = timed("Updating old chunk id maps",
+                               seg.merge.update_changed_id_maps,
+                               unthr_id_maps, append_id_map)
+
+    # segments can cross the size threshold in either direction, even in
+    # chunks whose unthresholded ids didn't change
+    changed_id_maps = timed("Thresholding old chunk id maps",
+                            seg.merge.threshold_changed_id_maps,
+                            {**unthr_id_maps, **changed_unthr_maps},
+                            size_thr_map, old_id_maps)
+
+    if fallback:
+        # starting the unthresholded maps for the next append
+        changed_unthr_maps = {**unthr_id_maps, **changed_unthr_maps}
+
+    new_id_maps = timed("Thresholding new chunk id maps",
+                        seg.merge.update_chunk_id_maps,
+                        unthr_new_maps.copy(), size_thr_map)
+
+    print(f"Appended {len(new_bounds)} chunks,"
+          f" updating the id maps of {len(changed_id_maps)} old chunks")
+
+    timed("Writing unthresholded cleft info",
+          taskio.write_unthresholded_seg_info,
+          unthr_cleft_info, storagestr)
+
+    timed("Writing merged cleft info",
+          taskio.write_merged_seg_info,
+          merged_cleft_info, storagestr)
+
+    for (bounds, id_map) in changed_unthr_maps.items():
+        taskio.write_chunk_id_map(id_map, storagestr, bounds,
+                                  unthresholded=True)
+
+    for (bounds, id_map) in changed_id_maps.items():
+        taskio.write_chunk_id_map(id_map, storagestr, bounds)
+
+    # the new chunk id maps are written last, since they mark those
+    # chunks as merged
+    for (bounds, id_map) in zip(new_bounds, unthr_new_maps):
+        taskio.write_chunk_id_map(id_map, storagestr, bounds,
+                                  unthresholded=True)
+
+    for (bounds, id_map) in zip(new_bounds, new_id_maps):
+        taskio.write_chunk_id_map(id_map, storagestr, bounds)
+
+    if timing_tag is not None:
+        timed("Writing total task time",
+              taskio.write_task_timing,
+              time.time() - start_time, "append_ccs", timing_tag, storagestr)
+
+
 def match_continuations_task(storagestr, facehash, max_face_shape=(1024, 1024),
                              timing_tag=None):
 
@@ -163,7 +379,9 @@ def match_continuations_task(storagestr, facehash, max_face_shape=(1024, 1024),
 
     timed("Writing graph edges",
           taskio.write_contin_graph_edges,
-          graph_edges, storagestr)
+          graph_edges, storagestr, facehash=facehash)
+
+    taskio.clear_dirty_bucket(storagestr, "match_contins", facehash)
 
     if timing_tag is not None:
         timed("Writing total task time",
@@ -184,11 +402,22 @@ def seg_graph_cc_task(storagestr, hashmax, timing_tag=None):
                     taskio.read_all_unique_seg_ids,
                     storagestr)
 
+    old_merge_df = timed("Reading old seg merge_map",
+                         taskio.read_seg_merge_map,
+                         storagestr)
+
     seg_merge_df = tasks.seg_graph_cc_task(graph_edges, hashmax, all_ids)
 
+    changed_buckets = timed("Finding changed dst id hashes",
+                            hashing.changed_buckets,
+                            old_merge_df, seg_merge_df,
+                            cn.src_id, cn.dst_id_hash)
+
+    print(f"{len(changed_buckets)} dst id hashes changed")
+
     timed("Writing seg merge_map",
           taskio.write_seg_merge_map,
-          seg_merge_df, storagestr)
+          seg_merge_df, storagestr, changed_buckets=changed_buckets)
 
     if timing_tag is not None:
         timed("Writing total task time",
@@ -229,6 +458,11 @@ def merge_seginfo_task(storagestr, hashval, szthresh=None,
                                        seginfo_w_new_id,
                                        szthresh=szthresh)
 
+    # merge_dups reads the old rows of this hash through merged_edges
+    timed(f"Marking partner hashes of dst hash {hashval}",
+          taskio.mark_partner_buckets,
+          storagestr, hashval)
+
     timed(f"Writing merged seginfo for dst hash {hashval}",
           taskio.write_merged_seg_info,
           merged_seginfo, storagestr, hash_tag=hashval)
@@ -241,7 +475,10 @@ def merge_seginfo_task(storagestr, hashval, szthresh=None,
     if szthresh is not None:
         timed("Writing mapping for size threshold",
               taskio.write_dup_id_map,
-              szthresh_map, storagestr)
+              szthresh_map, storagestr,
+              hashcol=cn.dst_id_hash, hashval=hashval)
+
+    taskio.clear_dirty_bucket(storagestr, "merge_seginfo", hashval)
 
     if timing_tag is not None:
         timed("Writing total task time",
@@ -257,7 +494,8 @@ def edge_task(img_cvname, cleft_cvname, seg_cvname,
               resolution=(4, 4, 40), num_downsamples=0,
               base_res_begin=None, base_res_end=None,
               parallel=1, hashmax=None, storagedir=None,
-              timing_tag=None):
+              group_shift=0, max_group_size=8, num_workers=2,
+              timing_tag=None, skip_unchanged=False):
     """
     Runs tasks.chunk_edges_task after reading the relevant
     cloud volume chunks and downsampling the cleft volume
@@ -310,6 +548,24 @@ def edge_task(img_cvname, cleft_cvname, seg_cvname,
                          taskio.read_chunk_id_map,
                          storagestr, base_bounds)
 
+    params_hash = edge_params_hash(img_cvname, cleft_cvname, seg_cvname,
+                                   patchsz,
+                                   samples_per_cleft=samples_per_cleft,
+                                   dil_param=dil_param, resolution=resolution,
+                                   num_downsamples=num_downsamples,
+                                   hashmax=hashmax, group_shift=group_shift,
+                                   max_group_size=max_group_size)
+    net_params = [p.detach().cpu().numpy()
+                  for p in assoc_net.state_dict().values()]
+    input_hash = timed("Fingerprinting inputs",
+                       hashing.fingerprint,
+                       img, clefts, seg, chunk_id_map.keys(),
+                       chunk_id_map.values(), *net_params)
+
+    if skip_unchanged and inputs_unchanged(storagestr, "edge", chunk_bounds,
+                                           params_hash, input_hash):
+        return
+
     # Downsampling clefts to match other volumes
     if num_downsamples > 0:
         clefts = timed(f"Downsampling clefts to MIP {num_downsamples}",
@@ -322,7 +578,10 @@ def edge_task(img_cvname, cleft_cvname, seg_cvname,
                                 patchsz, offset=chunk_begin,
                                 id_map=chunk_id_map, root_seg=None,
                                 samples_per_cleft=samples_per_cleft,
-                                dil_param=dil_param, hashmax=hashmax)
+                                dil_param=dil_param, hashmax=hashmax,
+                                group_shift=group_shift,
+                                max_group_size=max_group_size,
+                                num_workers=num_workers)
 
     if num_downsamples > 0:
         edge_info = timed("Up-sampling edge information",
@@ -333,6 +592,10 @@ def edge_task(img_cvname, cleft_cvname, seg_cvname,
           taskio.write_chunk_edge_info,
           edge_info, storagestr, base_bounds)
 
+    timed("Writing task manifest",
+          taskio.write_task_manifest,
+          params_hash, input_hash, "edge", chunk_bounds, storagestr)
+
     if timing_tag is not None:
         timed("Writing total task time",
               taskio.write_task_timing,
@@ -343,9 +606,8 @@ def merge_edges_task(voxel_res, dist_thr, size_thr, storagestr, timing_tag=None)
 
     start_time = time.time()
 
-    edges_arr = timed("Reading all edges",
-                      taskio.read_all_chunk_edge_infos,
-                      storagestr)
+    # chunk edges are read lazily while picking the largest edges
+    edges_arr = taskio.iter_chunk_edge_infos(storagestr)
     merged_cleft_info = timed("Reading merged cleft info",
                               taskio.read_merged_seg_info,
                               storagestr)
@@ -375,23 +637,25 @@ def pick_largest_edges_task(storagestr, clefthash=None, timing_tag=None):
     start_time = time.time()
 
     if clefthash is None:
-        edges = timed("Reading all chunkwise edge info",
-                      taskio.read_all_chunk_edge_infos,
-                      storagestr)
+        # chunk edges are read lazily while picking the largest edges
+        edges = taskio.iter_chunk_edge_infos(storagestr)
     else:
         edges = timed(f"Reading edge info for cleft id hash {clefthash}",
                       taskio.read_hashed_edge_info,
                       storagestr,
                       clefthash=clefthash, merged=False)
 
-    if edges.index.name == cn.seg_id:
-        edges = edges.reset_index()
+        if edges.index.name == cn.seg_id:
+            edges = edges.reset_index()
 
     largest_info = tasks.pick_largest_edges_task(edges, clefthash is not None)
 
     timed("Writing merged edge list",
           taskio.write_merged_edge_info,
-          largest_info, storagestr)
+          largest_info, storagestr, clefthash=clefthash)
+
+    if clefthash is not None:
+        taskio.clear_dirty_bucket(storagestr, "pick_edge", clefthash)
 
     if timing_tag is not None:
         timed("Writing total task time",
@@ -426,12 +690,15 @@ def merge_duplicates_task(voxel_res, dist_thr, size_thr,
     # call.
     timed("Writing duplicate id mapping for hash index",
           taskio.write_dup_id_map,
-          dup_id_map, src_storagestr)
+          dup_id_map, src_storagestr,
+          hashcol=cn.partnerhash, hashval=hash_index)
     timed("Writing final DataFrame for hash index",
           taskio.write_full_info,
           full_df, fulldf_storagestr,
           tag=hash_index)
 
+    taskio.clear_dirty_bucket(src_storagestr, "merge_dups", hash_index)
+
     if timing_tag is not None:
         timed("Writing total task time",
               taskio.write_task_timing,
@@ -441,7 +708,13 @@ def merge_duplicates_task(voxel_res, dist_thr, size_thr,
 def overlap_task(seg_cvname, base_seg_cvname,
                  chunk_begin, chunk_end,
                  storagedir, mip=0, seg_mip=None,
-                 parallel=1, timing_tag=None):
+                 parallel=1, hashmax=None, topk=None, timing_tag=None):
+    """
+    Counts the overlaps between a segmentation and a base segmentation
+    within a chunk, and writes the chunk's overlap matrix. If topk is
+    passed, also writes a summary of the topk largest overlaps for each
+    segment (see merge_overlaps_task).
+    """
 
     start_time = time.time()
 
@@ -463,7 +736,14 @@ def overlap_task(seg_cvname, base_seg_cvname,
 
     timed("Writing overlap matrix",
           taskio.write_chunk_overlap_mat,
-          overlap_matrix, chunk_bounds, storagedir)
+          overlap_matrix, chunk_bounds, storagedir, hashmax=hashmax)
+
+    if topk is not None:
+        topk_df = tasks.overlap_topk_task(overlap_matrix, topk)
+
+        timed("Writing top-k overlap summary",
+              taskio.write_chunk_overlap_topk,
+              topk_df, chunk_bounds, storagedir, hashmax=hashmax)
 
     if timing_tag is not None:
         timed("Writing total task time",
@@ -472,19 +752,56 @@ def overlap_task(seg_cvname, base_seg_cvname,
               timing_tag, storagedir)
 
 
-def merge_overlaps_task(storagestr, timing_tag=None):
+def merge_overlaps_task(storagestr, hashval=None, topk_mode=None,
+                        timing_tag=None):
+    """
+    Merges the chunk overlap matrices and writes the base segment of
+    maximal overlap for each segment. If hashval is passed, only merges
+    the entries whose row id hashes to that value (written by overlap_task
+    with hashmax), so the merge can be split across tasks.
+
+    topk_mode merges the top-k summaries written by overlap_task instead.
+    "approx" trusts the summaries, and "exact" reads the full entries for
+    the segments whose maximum the summaries can't determine.
+    """
+    assert topk_mode in (None, "exact", "approx"), f"mode {topk_mode}?"
 
     start_time = time.time()
 
-    overlap_arr = timed("Reading overlap matrices",
-                        taskio.read_all_overlap_mats,
-                        storagestr)
+    if topk_mode is not None:
+        topk_df = timed("Reading top-k overlap summaries",
+                        taskio.read_overlap_topk,
+                        storagestr, hashval=hashval)
+
+        max_overlaps, ambiguous = tasks.merge_overlap_topk_task(topk_df)
+        print(f"{len(ambiguous)} segments with ambiguous maximal overlaps")
+
+        if topk_mode == "exact" and len(ambiguous) > 0:
+            ambiguous_overlaps = timed("Reading full entries for ambiguous"
+                                       " segments",
+                                       taskio.read_overlap_mat_for_rows,
+                                       storagestr, ambiguous, hashval=hashval)
+
+            max_overlaps = tasks.resolve_ambiguous_overlaps_task(
+                               max_overlaps, ambiguous_overlaps)
+
+    elif hashval is None:
+        overlap_arr = timed("Reading overlap matrices",
+                            taskio.read_all_overlap_mats,
+                            storagestr)
+
+        max_overlaps = tasks.merge_overlaps_task(overlap_arr)
+
+    else:
+        overlap_mat = timed(f"Reading overlap entries for row hash {hashval}",
+                            taskio.read_hashed_overlap_mat,
+                            storagestr, hashval)
 
-    max_overlaps = tasks.merge_overlaps_task(overlap_arr)
+        max_overlaps = tasks.merge_hashed_overlaps_task(overlap_mat)
 
     timed("Writing max overlaps",
           taskio.write_max_overlaps,
-          max_overlaps, storagestr)
+          max_overlaps, storagestr, hash_tag=hashval)
 
     if timing_tag is not None:
         timed("Writing total task time",
@@ -535,7 +852,8 @@ def remap_ids_task(seg_in_cvname, seg_out_cvname,
 def anchor_task(cleft_cvname, seg_cvname, storagestr,
                 chunk_begin, chunk_end, root_seg_cvname=None,
                 voxel_res=[4, 4, 40], min_box_width=[100, 100, 5],
-                mip=0, seg_mip=None, parallel=1, timing_tag=None):
+                mip=0, seg_mip=None, parallel=1, num_workers=0,
+                timing_tag=None):
 
     start_time = time.time()
 
@@ -568,7 +886,8 @@ def anchor_task(cleft_cvname, seg_cvname, storagestr,
 
     anchor_df = tasks.anchor_task(edge_df, seg, clefts, chunk_begin,
                                   voxel_res=voxel_res, root_seg=roots,
-                                  min_box_width=min_box_width)
+                                  min_box_width=min_box_width,
+                                  num_workers=num_workers)
 
     timed("Writing chunk anchor info",
           taskio.write_chunk_anchor,
@@ -1,39 +1,86 @@
 import itertools
+import collections
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
 import igraph
 
+from . import colnames as cn
 
-def merge_info_df(df, id_map, merge_fn):
 
-    to_drop = []
-    new_rows = {}
-    indices = set([])
+AGGREGATIONS = ["sum", "min", "max", "mean", "largest"]
 
-    for (k,v) in id_map.items():
-        if k == v:
-            continue
 
-        if v in new_rows:
-            row_v = new_rows[v]
-        else:
-            row_v = df.loc[v]
+def merge_info_df(df, id_map, aggs=None, size_col=cn.size):
+    """
+    Merges the rows of an info dataframe according to an id map. Each row
+    joins the group of its mapped id, and rows outside of the map keep
+    their own id. See reduce_groups for the aggregations.
 
-        new_rows[v] = merge_fn(df.loc[k], row_v)
+    Returns the merged dataframe indexed by the remaining ids in sorted order
+    """
+    ids = df.index.values
+    new_ids = pd.Index(ids).map(id_map).values
+    new_ids = np.where(pd.isnull(new_ids), ids, new_ids).astype(ids.dtype)
 
-        to_drop.append(k)
-        indices.add(v)
+    merged = reduce_groups(df, new_ids, aggs=aggs, size_col=size_col)
+    merged.index.name = df.index.name
 
-    if len(new_rows) > 0:
-        index = sorted(list(indices))
-        replacements = pd.DataFrame.from_dict(new_rows, orient="index")
+    return merged
 
-        # indexing by columns ensures that they have the same order
-        df.loc[index] = replacements[df.columns]
-        df.drop(to_drop, inplace=True)
 
-    return df
+def reduce_groups(df, group_ids, aggs=None, size_col=cn.size):
+    """
+    Reduces the rows of a dataframe which share a group id in one sorted
+    pass. aggs maps column names to one of the AGGREGATIONS:
+        "sum", "min", "max" -- the usual reductions over each group
+        "mean"              -- the mean weighted by size_col
+        "largest"           -- the value of the row with the largest size_col
+    Columns without an aggregation take the "largest" row's value, and
+    ties go to the first row.
+
+    Returns a dataframe indexed by the sorted unique group ids
+    """
+    aggs = dict() if aggs is None else aggs
+    for agg in aggs.values():
+        assert agg in AGGREGATIONS, f"unknown aggregation {agg}"
+
+    group_ids = np.asarray(group_ids)
+    if len(df) == 0:
+        return df.set_index(pd.Index(group_ids))
+
+    sizes = df[size_col].values
+
+    # sorting by group id and then by decreasing size (stable for ties)
+    order = np.lexsort((-sizes.astype(np.float64), group_ids))
+    sorted_ids = group_ids[order]
+    starts = np.flatnonzero(np.concatenate(
+                 ([True], sorted_ids[1:] != sorted_ids[:-1])))
+
+    merged = df.iloc[order[starts]]
+    merged = merged.set_index(pd.Index(sorted_ids[starts]))
+
+    sorted_szs = sizes[order]
+    weights = None
+    for (col, agg) in aggs.items():
+        vals = df[col].values[order]
+
+        if agg == "sum":
+            merged[col] = np.add.reduceat(vals, starts)
+        elif agg == "min":
+            merged[col] = np.minimum.reduceat(vals, starts)
+        elif agg == "max":
+            merged[col] = np.maximum.reduceat(vals, starts)
+        elif agg == "mean":
+            if weights is None:
+                group_szs = np.add.reduceat(sorted_szs, starts)
+                group_lens = np.diff(np.append(starts, len(order)))
+                weights = sorted_szs / np.repeat(group_szs, group_lens)
+            merged[col] = np.add.reduceat(vals * weights, starts)
+
+    return merged
 
 
 def find_connected_components(matches):
@@ -96,3 +143,60 @@ def weighted_avg(com1, sz1, com2, sz2):
     h2 = (com2[0]*frac2, com2[1]*frac2, com2[2]*frac2)
 
     return (h1[0]+h2[0], h1[1]+h2[1], h1[2]+h2[2])
+
+
+def prefetch_map(fn, items, num_workers=1, max_pending=4):
+    """
+    Applies fn to each item within a pool of background threads, and
+    yields the results in order. At most max_pending results are computed
+    ahead of the consumer, which bounds the memory held by the queue.
+    Runs serially if num_workers is 0.
+    """
+    if num_workers == 0:
+        for item in items:
+            yield fn(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = collections.deque()
+
+        for item in items:
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+
+            pending.append(pool.submit(fn, item))
+
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+
+# function applied within fork_map workers (inherited through fork)
+_fork_map_fn = None
+
+
+def _call_fork_map_fn(item):
+    return _fork_map_fn(item)
+
+
+def fork_map(fn, items, num_workers=0):
+    """
+    Applies fn to each item within a pool of forked processes, and
+    returns the results in order. Arguments bound to fn (e.g. large
+    arrays) are inherited by the workers instead of being pickled.
+    Runs serially if num_workers is 0.
+    """
+    global _fork_map_fn
+
+    if num_workers == 0:
+        return list(map(fn, items))
+
+    items = list(items)
+    chunksize = max(1, len(items) // (4 * num_workers))
+
+    _fork_map_fn = fn
+    try:
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(num_workers) as pool:
+            return pool.map(_call_fork_map_fn, items, chunksize=chunksize)
+    finally:
+        _fork_map_fn = None
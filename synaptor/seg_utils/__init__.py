@@ -9,6 +9,7 @@ These functions include:
 - Segment sizes (segment_sizes)
 - General data relabeling (relabel_data)
 - Relabeling segment ids to 1:N (relabel_data_1N)
+- Relabeling pairs of ids across two volumes to 1:N (relabel_pairs)
 - Finding nonzero unique ids (nonzero_unique_ids)
 - High-pass size thresholding (filter_segs_by_size)
 - General segment removal (filter_segs_by_id)
@@ -16,6 +17,7 @@ These functions include:
 - Splitting segments by overlap with a base (split_by_overlap)
 - Down/Upsampling over the last 2 dimensions (upsample2d, downsample_seg)
 - Dilation over the last 2 dimensions (dilate_by_k)
+- Indexing voxel coordinates by segment id (CoordIndex)
 
 Other functions exist. See the documentation for each function (and submodules)
 for more information.
@@ -39,3 +41,6 @@ from .resample import *
 
 from . import misc
 from .misc import *
+
+from . import coordindex
+from .coordindex import *
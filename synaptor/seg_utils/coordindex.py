@@ -0,0 +1,117 @@
+import random
+
+import numpy as np
+
+
+__all__ = ["CoordIndex"]
+
+
+class CoordIndex(object):
+    """
+    Voxel Coordinate Index
+
+    Groups the voxels of a segmentation by their id using a single argsort.
+    Each id owns a contiguous [start, stop) range of the sorted order, which
+    makes coordinate lookup and random sampling for any id cheap after the
+    index is built.
+
+    Within each id, voxels are kept in increasing (C-order) linear index,
+    so coordinates come back in the same order as np.nonzero.
+
+    ids()           -- return the nonzero ids within the volume
+    count()         -- return the number of voxels for an id
+    coords()        -- return the coordinates of an id as an (N,3) array
+    coords_in_box() -- return the coordinates of an id within a bbox
+    random_coord()  -- return a random coordinate of an id
+    random_coords() -- return several random coordinates of an id
+    """
+
+    __slots__ = ("shape", "offset", "_order", "_ids", "_starts", "_stops")
+
+    def __init__(self, seg, offset=(0, 0, 0)):
+        """
+        Index a segmentation volume. Coordinates returned by the index are
+        shifted by :param: offset.
+        """
+        self.shape = seg.shape
+        self.offset = np.array(offset)
+
+        flat = seg.ravel()
+        self._order = np.argsort(flat, kind="stable")
+
+        sorted_vals = flat[self._order]
+        ids, starts, counts = np.unique(sorted_vals, return_index=True,
+                                        return_counts=True)
+
+        self._ids = ids
+        self._starts = starts
+        self._stops = starts + counts
+
+    def _lookup(self, segid):
+        """ Returns the [start, stop) range of sorted voxels for segid """
+        i = np.searchsorted(self._ids, segid)
+
+        if i == len(self._ids) or self._ids[i] != segid:
+            return 0, 0
+
+        return self._starts[i], self._stops[i]
+
+    def __contains__(self, segid):
+        lo, hi = self._lookup(segid)
+        return hi > lo
+
+    def ids(self):
+        """ Returns the nonzero ids within the indexed volume """
+        return self._ids[self._ids != 0]
+
+    def count(self, segid):
+        """ Returns the number of voxels with value segid """
+        lo, hi = self._lookup(segid)
+        return hi - lo
+
+    def linear_indices(self, segid):
+        """ Returns the flat (C-order) indices of the voxels for segid """
+        lo, hi = self._lookup(segid)
+        return self._order[lo:hi]
+
+    def coords(self, segid):
+        """ Returns the coordinates of each voxel for segid (N x 3) """
+        inds = self.linear_indices(segid)
+        coords = np.array(np.unravel_index(inds, self.shape)).T
+
+        return coords.reshape((-1, len(self.shape))) + self.offset
+
+    def coords_in_box(self, segid, box):
+        """
+        Returns the coordinates of each voxel for segid within a bbox
+        (N x 3). The box is expressed in offset coordinates.
+        """
+        box_min = np.array(tuple(box.min())) - self.offset
+        box_max = np.array(tuple(box.max())) - self.offset
+
+        # the first axis bounds select a contiguous run of linear indices
+        inds = self.linear_indices(segid)
+        stride = int(np.prod(self.shape[1:]))
+        begin, end = np.searchsorted(inds, [max(box_min[0], 0) * stride,
+                                            max(box_max[0], 0) * stride])
+
+        coords = np.array(np.unravel_index(inds[begin:end], self.shape)).T
+        coords = coords.reshape((-1, len(self.shape)))
+
+        inside = np.all((coords >= box_min) & (coords < box_max), axis=1)
+
+        return coords[inside] + self.offset
+
+    def random_coord(self, segid):
+        """ Returns a random coordinate where the volume == segid """
+        lo, hi = self._lookup(segid)
+        assert hi > lo, "{} not contained in volume".format(segid)
+
+        linear_index = self._order[random.randint(lo, hi-1)]
+        coord = np.unravel_index(linear_index, self.shape)
+
+        return tuple(c + o for (c, o) in zip(coord, self.offset))
+
+    def random_coords(self, segid, num_coords):
+        """ Returns a list of random coordinates where the volume == segid """
+        return [self.random_coord(segid) for _ in range(num_coords)]
@@ -1,10 +1,8 @@
-from collections import Counter
-
 import numpy as np
 from scipy import sparse
 
 from . import describe
-from . import _relabel
+from . import relabel
 
 
 def count_overlaps(seg1, seg2, orig_ids=False):
@@ -31,9 +29,6 @@ def count_overlaps(seg1, seg2, orig_ids=False):
         overlap_mat = sparse.coo_matrix(([], ([], [])), shape=(0, 0))
         return overlap_mat, seg1_ids, seg2_ids
 
-    seg1_index = {v: i for (i, v) in enumerate(seg1_ids)}
-    seg2_index = {v: i for (i, v) in enumerate(seg2_ids)}
-
     overlap_mask = np.logical_and(seg1 != 0, seg2 != 0)
 
     # data type here is important - adding int(1) to np.uint64 can cause
@@ -41,26 +36,52 @@ def count_overlaps(seg1, seg2, orig_ids=False):
     n_rows = int(seg1_ids.max() + np.uint64(1)) if orig_ids else seg1_ids.size
     n_cols = int(seg2_ids.max() + np.uint64(1)) if orig_ids else seg2_ids.size
 
-    seg1_vals = seg1[overlap_mask]
-    seg2_vals = seg2[overlap_mask]
+    # indices into the id arrays (both sorted)
+    rs = np.searchsorted(seg1_ids, seg1[overlap_mask])
+    cs = np.searchsorted(seg2_ids, seg2[overlap_mask])
 
-    counts = Counter(zip(seg1_vals, seg2_vals))
+    rs, cs, vs = count_index_pairs(rs, cs, seg1_ids.size, seg2_ids.size)
 
-    rs, cs, vs = [], [], []
-    for ((r, c), v) in counts.items():
-        if orig_ids:
-            rs.append(r)
-            cs.append(c)
-        else:
-            # subtracting one from indices so val 1 -> index 0
-            rs.append(seg1_index[r])
-            cs.append(seg2_index[c])
-        vs.append(v)
+    if orig_ids:
+        rs = seg1_ids[rs]
+        cs = seg2_ids[cs]
 
     overlap_mat = sparse.coo_matrix((vs, (rs, cs)), shape=(n_rows, n_cols))
     return overlap_mat, seg1_ids, seg2_ids
 
 
+def count_index_pairs(rs, cs, n_rows, n_cols):
+    """
+    Counts the occurrences of each (row, col) index pair.
+
+    Pairs are packed into single uint64 keys (row * n_cols + col) and
+    counted by np.unique when the packed keys fit, and are lexsorted
+    otherwise. Returns the unique pairs in row-major order along with
+    their counts.
+    """
+    if len(rs) == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+
+    if n_rows * n_cols < 2 ** 64:
+        n_cols = np.uint64(n_cols)
+        keys = rs.astype(np.uint64) * n_cols + cs.astype(np.uint64)
+        keys, vs = np.unique(keys, return_counts=True)
+
+        return ((keys // n_cols).astype(np.int64),
+                (keys % n_cols).astype(np.int64), vs)
+
+    order = np.lexsort((cs, rs))
+    rs, cs = rs[order], cs[order]
+
+    new_pair = np.ones((len(rs),), dtype=np.bool_)
+    new_pair[1:] = (rs[1:] != rs[:-1]) | (cs[1:] != cs[:-1])
+    starts = np.nonzero(new_pair)[0]
+    vs = np.diff(np.append(starts, len(rs)))
+
+    return rs[starts], cs[starts], vs
+
+
 def split_by_overlap(seg_to_split, overlap_seg, copy=True):
     """
     Split segments by overlap with a separate segmentation.
@@ -75,17 +96,11 @@ def split_by_overlap(seg_to_split, overlap_seg, copy=True):
         3darray: A new volume with each segment in :param:seg_to_split assigned
             a new id based on its overlap with ids in :param:overlap_seg.
     """
-    overlaps, row_ids, col_ids = count_overlaps(seg_to_split, overlap_seg)
-    rs, cs, _ = sparse.find(overlaps)
-
-    dict_of_dicts = dict((r, dict()) for r in row_ids)
-    for (v, (r, c)) in enumerate(zip(rs, cs)):
-        row = row_ids[r]
-        col = col_ids[c]
-        dict_of_dicts[row][col] = v+1
+    split = relabel.relabel_pairs(seg_to_split, overlap_seg,
+                                  dtype=seg_to_split.dtype)
 
     if copy:
-        seg_to_split = np.copy(seg_to_split)
+        return split
 
-    return _relabel.relabel_paired_data(
-               seg_to_split, overlap_seg, dict_of_dicts)
+    seg_to_split[...] = split
+    return seg_to_split
@@ -1,5 +1,6 @@
 import numpy as np
 
+from .. import types
 from . import describe
 from . import _relabel
 
@@ -14,7 +15,8 @@ def relabel_data(d, mapping, copy=True):
 
     Args:
         d (3darray): A data volume.
-        mapping (dict): A mapping from data values in d to new desired values.
+        mapping (dict or IdMap): A mapping from data values in d to new
+            desired values.
         copy (bool): Whether or not to perform relabeling in-place. Defaults
             to True, which will create a new volume.
 
@@ -24,6 +26,10 @@ def relabel_data(d, mapping, copy=True):
     """
     if copy:
         d = np.copy(d)
+
+    if isinstance(mapping, types.IdMap):
+        return mapping.apply(d, out=d)
+
     return _relabel.relabel_data(d, mapping)
 
 
@@ -43,6 +49,72 @@ def relabel_data_1N(d, copy=True):
     return relabel_data(d, mapping, copy=copy)
 
 
+def relabel_pairs(d1, d2, mask=None, dtype=np.uint32):
+    """
+    Relabel each pair of values across two volumes from 1:N
+
+    Each distinct (d1, d2) pair within :param:mask receives a new id. Ids
+    follow the sorted order of the pairs (by d1, then d2), and voxels
+    outside of the mask are set to 0. Pairs are packed into single uint64
+    keys where possible, and relabeled with one np.unique call.
+
+    Args:
+        d1 (3darray): A data volume.
+        d2 (3darray): Another data volume with the same shape.
+        mask (3darray): A boolean mask of the voxels to relabel. Defaults to
+            the voxels where both volumes are nonzero.
+        dtype (np.dtype): The data type of the new volume.
+
+    Returns:
+        3darray: A new volume with the paired ids.
+    """
+    assert d1.shape == d2.shape, "mismatched volumes"
+
+    if mask is None:
+        mask = np.logical_and(d1 != 0, d2 != 0)
+
+    vals1 = d1[mask]
+    vals2 = d2[mask]
+
+    new_ids = np.zeros(d1.shape, dtype=dtype)
+    if vals1.size == 0:
+        return new_ids
+
+    keys = pack_pairs(vals1, vals2)
+    if keys is not None:
+        _, inverse = np.unique(keys, return_inverse=True)
+    else:
+        pairs = np.stack((vals1, vals2), axis=1)
+        _, inverse = np.unique(pairs, axis=0, return_inverse=True)
+
+    inverse = inverse.ravel()
+    if np.issubdtype(dtype, np.integer):
+        assert inverse.max() < np.iinfo(dtype).max, "too many pairs for dtype"
+    new_ids[mask] = inverse + 1
+
+    return new_ids
+
+
+def pack_pairs(vals1, vals2):
+    """
+    Packs pairs of nonnegative integer values into uint64 keys that sort
+    in the same order as the pairs. Returns None if the keys won't fit.
+    """
+    if vals1.dtype.kind not in "ui" or vals2.dtype.kind not in "ui":
+        return None
+    if vals1.min() < 0 or vals2.min() < 0:
+        return None
+
+    max1 = int(vals1.max())
+    base = int(vals2.max()) + 1
+
+    if max1 * base + base > np.iinfo(np.uint64).max:
+        return None
+
+    base = np.uint64(base)
+    return vals1.astype(np.uint64) * base + vals2.astype(np.uint64)
+
+
 def relabel_data_iterative(d, mapping):
     """
     Python-based iterative relabeling
@@ -53,7 +125,8 @@ def relabel_data_iterative(d, mapping):
 
     Args:
         d (3darray): A segmentation.
-        mapping (dict): A mapping from data values in d to new desired values.
+        mapping (dict or IdMap): A mapping from data values in d to new
+            desired values.
 
     Returns:
         3darray: A new volume with the desired modifications.
@@ -78,7 +151,8 @@ def relabel_data_lookup_arr(d, mapping):
 
     Args:
         d (3darray): A segmentation.
-        mapping (dict): A mapping from data values in d to new desired values.
+        mapping (dict or IdMap): A mapping from data values in d to new
+            desired values.
 
     Returns:
         3darray: A new volume with the desired modifications.
@@ -0,0 +1,197 @@
+""" Array-backed Id Mappings """
+
+
+import numpy as np
+import pandas as pd
+
+
+__all__ = ["IdMap"]
+
+
+class IdMap(object):
+    """
+    Id Mapping
+
+    Maps integer ids to new ids using sorted key and value arrays, so
+    composing, expanding and applying mappings are vectorized lookups.
+    Ids which aren't keys map to themselves when a mapping is applied.
+
+    The read-only dict interface (len, in, [], get, keys, values, items,
+    iteration) is also supported for code which expects dicts.
+
+    from_dict()    -- build a mapping from a dict (or another IdMap)
+    from_dframe()  -- build a mapping from a pair of dataframe columns
+    compose()      -- the mapping which applies this one and then another
+    expand()       -- add identity entries for ids which aren't keys
+    invert()       -- map each value back to its (smallest) key
+    lookup()       -- map an array of ids, filling in missing ids
+    apply()        -- map an array of ids, leaving missing ids unchanged
+    apply_column() -- map a column of a dataframe
+    to_dframe()    -- convert to a dataframe of key and value columns
+    """
+
+    __slots__ = ("_keys", "_vals")
+
+    def __init__(self, keys=(), vals=()):
+        keys = np.asarray(keys)
+        vals = np.asarray(vals)
+        assert keys.shape == vals.shape, "mismatched keys and values"
+
+        keys = keys.astype(np.int64) if keys.size == 0 else keys
+        vals = vals.astype(np.int64) if vals.size == 0 else vals
+
+        order = np.argsort(keys, kind="stable")
+        keys, vals = keys[order], vals[order]
+
+        # later entries win for repeated keys (as in a dict)
+        if keys.size > 1:
+            last = np.append(keys[1:] != keys[:-1], True)
+            keys, vals = keys[last], vals[last]
+
+        self._keys = keys
+        self._vals = vals
+
+    @classmethod
+    def from_dict(cls, mapping):
+        """ Builds a mapping from a dict (an IdMap is returned as-is) """
+        if isinstance(mapping, IdMap):
+            return mapping
+
+        keys = np.fromiter(mapping.keys(), dtype=np.int64, count=len(mapping))
+        vals = np.fromiter(mapping.values(), dtype=np.int64,
+                           count=len(mapping))
+
+        return cls(keys, vals)
+
+    @classmethod
+    def from_dframe(cls, dframe, key_col, val_col):
+        """ Builds a mapping from two columns (or the index) of a dataframe """
+        def column(col):
+            if col == dframe.index.name:
+                return dframe.index.values
+            return dframe[col].values
+
+        return cls(column(key_col), column(val_col))
+
+    def _find(self, ids):
+        """ Returns the key index of each id, and whether it was found """
+        # comparing within the key dtype avoids float promotion
+        # between int64 and uint64
+        ids = np.asarray(ids)
+        if ids.size > 0 and not np.issubdtype(ids.dtype, np.integer):
+            assert np.all(np.mod(ids, 1) == 0), "non-integer ids"
+
+        ids = ids.astype(self._keys.dtype, copy=False)
+        inds = np.searchsorted(self._keys, ids)
+        inds[inds == self._keys.size] = 0
+
+        if self._keys.size == 0:
+            return inds, np.zeros(ids.shape, dtype=bool)
+
+        return inds, self._keys[inds] == ids
+
+    def lookup(self, ids, fill=None):
+        """
+        Maps an array of ids, replacing ids which aren't keys with fill
+        (either a scalar or an array matching ids). Raises a KeyError
+        for missing ids if fill is None.
+        """
+        inds, found = self._find(ids)
+        if fill is None and not np.all(found):
+            raise KeyError(np.asarray(ids)[~found][0])
+
+        vals = np.zeros(found.shape, dtype=self._vals.dtype)
+        vals[found] = self._vals[inds[found]]
+
+        if fill is None:
+            return vals
+
+        return np.where(found, vals, fill)
+
+    def apply(self, ids, out=None):
+        """
+        Maps an array of ids, leaving ids which aren't keys unchanged.
+        Writes into :param: out if given (which can be ids itself).
+        """
+        ids = np.asarray(ids)
+        if out is None:
+            out = np.copy(ids)
+
+        inds, found = self._find(ids)
+        out[found] = self._vals[inds[found]]
+
+        return out
+
+    def apply_column(self, dframe, col):
+        """ Maps a column of a dataframe in place """
+        dframe[col] = self.apply(dframe[col].values)
+
+        return dframe
+
+    def compose(self, next_map, include_new=True):
+        """
+        Returns the mapping which applies this mapping and then next_map.
+        Keys of next_map which aren't values of this mapping are added
+        as-is if include_new is True.
+        """
+        next_map = IdMap.from_dict(next_map)
+
+        keys = self._keys
+        vals = next_map.apply(self._vals)
+
+        if include_new and len(next_map) > 0:
+            new = ~np.isin(next_map._keys, self._vals)
+            keys = np.concatenate((keys, next_map._keys[new]))
+            vals = np.concatenate((vals, next_map._vals[new]))
+
+        return IdMap(keys, vals)
+
+    def expand(self, ids):
+        """ Adds identity entries for each of the ids which aren't keys """
+        ids = np.unique(np.asarray(ids))
+        _, found = self._find(ids)
+
+        return IdMap(np.concatenate((self._keys, ids[~found])),
+                     np.concatenate((self._vals, ids[~found])))
+
+    def invert(self):
+        """ Maps each value back to its smallest key """
+        vals, first = np.unique(self._vals, return_index=True)
+
+        return IdMap(vals, self._keys[first])
+
+    def to_dframe(self, key_col, val_col):
+        """ Converts to a dataframe with key and value columns """
+        return pd.DataFrame({key_col: self._keys, val_col: self._vals},
+                            columns=[key_col, val_col])
+
+    def keys(self):
+        return self._keys
+
+    def values(self):
+        return self._vals
+
+    def items(self):
+        return zip(self._keys, self._vals)
+
+    def get(self, key, default=None):
+        inds, found = self._find([key])
+        return self._vals[inds[0]] if found[0] else default
+
+    def __getitem__(self, key):
+        val = self.get(key)
+        if val is None:
+            raise KeyError(key)
+        return val
+
+    def __contains__(self, key):
+        return bool(self._find([key])[1][0])
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return self._keys.size
+
+    def __repr__(self):
+        return "IdMap({} ids)".format(len(self))
@@ -0,0 +1,31 @@
+"""
+Connected Component Append Wrapper Script
+
+-Finds the chunks added since the last merge (those without an id map)
+-Assigns their cleft segments ids past the existing merged ids
+-Finds which continuations match across the faces of the new chunks
+-Merges the new segments into the merged cleft info from before the size
+ threshold, and updates the id maps of any old chunks whose segments were
+ merged together
+-Maps any cleft segments to 0 if they're under the size threshold (so
+ segments that it removed before can come back)
+"""
+import synaptor as s
+
+import argparse
+parser = argparse.ArgumentParser()
+
+# Inputs & Outputs
+parser.add_argument("storagestr")
+
+# Processing Parameters
+parser.add_argument("size_thr", type=int)
+parser.add_argument("--max_face_shape", type=int,
+                    nargs="+", default=(1024, 1024))
+parser.add_argument("--timing_tag", default=None)
+
+args = parser.parse_args()
+print(vars(args))
+
+
+s.proc.tasks_w_io.append_ccs_task(**vars(args))
@@ -29,6 +29,9 @@ parser.add_argument("--parallel", type=int, default=1)
 parser.add_argument("--mip", nargs="+", type=int, default=(0,))
 parser.add_argument("--hashmax", type=int, default=1)
 parser.add_argument("--timing_tag", default=None)
+parser.add_argument("--skip_unchanged", action="store_true",
+                    help="skip chunks whose parameters and inputs"
+                         " match their last run")
 
 
 # MIP arguments can specify voxel resolutions or mip index
@@ -33,7 +33,13 @@ parser.add_argument("--num_downsamples", type=int, default=0)
 parser.add_argument("--base_res_begin", nargs=3, type=int, default=None)
 parser.add_argument("--base_res_end", nargs=3, type=int, default=None)
 parser.add_argument("--parallel", type=int, default=1)
+parser.add_argument("--group_shift", type=int, default=0)
+parser.add_argument("--max_group_size", type=int, default=8)
+parser.add_argument("--num_workers", type=int, default=2)
 parser.add_argument("--timing_tag", default=None)
+parser.add_argument("--skip_unchanged", action="store_true",
+                    help="skip chunks whose parameters and inputs"
+                         " match their last run")
 
 
 args = parser.parse_args()
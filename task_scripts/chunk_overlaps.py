@@ -23,6 +23,8 @@ parser.add_argument("--chunk_end", nargs="+", type=int, required=True)
 parser.add_argument("--parallel", type=int, default=1)
 parser.add_argument("--mip", nargs="+", type=int, default=(0,))
 parser.add_argument("--seg_mip", nargs="+", type=int, default=None)
+parser.add_argument("--hashmax", type=int, default=None)
+parser.add_argument("--topk", type=int, default=None)
 parser.add_argument("--timing_tag", default=None)
 
 
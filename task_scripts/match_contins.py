@@ -11,7 +11,7 @@ parser = argparse.ArgumentParser()
 
 # Inputs & Outputs
 parser.add_argument("storagestr")
-parser.add_argument("facehash", type=int)
+parser.add_argument("facehash", type=int, nargs="+")
 
 # Processing Parameters
 parser.add_argument("--max_face_shape", type=int,
@@ -23,4 +23,8 @@ args.storagestr = s.io.parse_storagestr(args.storagestr)
 print(vars(args))
 
 
-s.proc.tasks_w_io.match_continuations_task(**vars(args))
+# the bucket planner can assign several hash buckets to one task
+facehashes = args.facehash
+for facehash in facehashes:
+    args.facehash = facehash
+    s.proc.tasks_w_io.match_continuations_task(**vars(args))
@@ -13,7 +13,7 @@ parser = argparse.ArgumentParser()
 
 # Inputs & Outputs
 parser.add_argument("src_storagestr")
-parser.add_argument("hash_index", type=int)
+parser.add_argument("hash_index", type=int, nargs="+")
 
 # Processing Parameters
 parser.add_argument("dist_thr", type=int)
@@ -29,4 +29,8 @@ args.fulldf_storagestr = s.io.parse_storagestr(args.fulldf_storagestr)
 print(vars(args))
 
 
-s.proc.tasks_w_io.merge_duplicates_task(**vars(args))
+# the bucket planner can assign several hash buckets to one task
+hash_indices = args.hash_index
+for hash_index in hash_indices:
+    args.hash_index = hash_index
+    s.proc.tasks_w_io.merge_duplicates_task(**vars(args))
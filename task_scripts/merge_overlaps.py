@@ -12,6 +12,8 @@ parser = argparse.ArgumentParser()
 
 # Inputs & Outputs
 parser.add_argument("storagestr")
+parser.add_argument("--hashval", type=int, default=None)
+parser.add_argument("--topk_mode", default=None, choices=["exact", "approx"])
 
 parser.add_argument("--timing_tag", default=None)
 
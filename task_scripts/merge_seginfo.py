@@ -12,7 +12,7 @@ parser = argparse.ArgumentParser()
 
 # Inputs & Outputs
 parser.add_argument("storagestr")
-parser.add_argument("hashval", type=int)
+parser.add_argument("hashval", type=int, nargs="+")
 
 parser.add_argument("--aux_storagestr", default=None)
 parser.add_argument("--timing_tag", default=None)
@@ -25,4 +25,8 @@ args.aux_storagestr = s.io.parse_storagestr(args.aux_storagestr)
 print(vars(args))
 
 
-s.proc.tasks_w_io.merge_seginfo_task(**vars(args))
+# the bucket planner can assign several hash buckets to one task
+hashvals = args.hashval
+for hashval in hashvals:
+    args.hashval = hashval
+    s.proc.tasks_w_io.merge_seginfo_task(**vars(args))
@@ -12,7 +12,7 @@ parser = argparse.ArgumentParser()
 
 # Inputs & Outputs
 parser.add_argument("storagestr")
-parser.add_argument("clefthash", type=int)
+parser.add_argument("clefthash", type=int, nargs="+")
 
 parser.add_argument("--timing_tag", default=None)
 
@@ -22,4 +22,8 @@ args.storagestr = s.io.parse_storagestr(args.storagestr)
 print(vars(args))
 
 
-s.proc.tasks_w_io.pick_largest_edges_task(**vars(args))
+# the bucket planner can assign several hash buckets to one task
+clefthashes = args.clefthash
+for clefthash in clefthashes:
+    args.clefthash = clefthash
+    s.proc.tasks_w_io.pick_largest_edges_task(**vars(args))
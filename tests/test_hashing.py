@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from synaptor.proc import hashing
+
+
+def rowwise_hashes(dframe, columns, maxval):
+    return [hashing.hashval(row, maxval)
+            for row in zip(*(dframe[col] for col in columns))]
+
+
+def test_hashcolumns_compat():
+    dframe = pd.DataFrame({
+        "int": np.array([0, 7, -12, 123456789, -1, 42], dtype=np.int64),
+        "uint": np.array([0, 1, 2**63, 2**64-1, 99, 5], dtype=np.uint64),
+        "float": [0.0, -0.0, 1.5, np.nan, -3.0, 1e20],
+        "nullable": pd.array([1, None, -3, 4, None, 0], dtype="Int64")})
+
+    for columns in (["int"], ["uint"], ["float"], ["nullable"],
+                    ["int", "float"], ["nullable", "uint", "int"]):
+        hashes = hashing.hashcolumns(dframe, columns, 1000, compat=True)
+
+        assert hashes.tolist() == rowwise_hashes(dframe, columns, 1000)
+
+
+def test_changed_buckets():
+    old = pd.DataFrame({"src": [1, 2, 3, 4],
+                        "dst": [1, 1, 3, 4],
+                        "hash": [10, 10, 30, 40]})
+    new = pd.DataFrame({"src": [1, 2, 3, 5],
+                        "dst": [1, 3, 3, 5],
+                        "hash": [10, 30, 30, 50]})
+
+    # 2 moves from 10 to 30, 4 is removed from 40, and 5 is added to 50
+    assert hashing.changed_buckets(old, new, "src", "hash") == {10, 30,
+                                                                40, 50}
+    assert hashing.changed_buckets(old, old, "src", "hash") == set()